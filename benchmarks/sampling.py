@@ -0,0 +1,81 @@
+"""Compares osw_incline's per-edge sampling with the vectorized sampling engine.
+
+Writes a synthetic DEM tile, inclines random edges over it with `DEMProcessor.infer_incline`
+one edge at a time (what `OSWIncline` does) and with `InclineCalculator.inclines` in one call,
+then reports both timings and how the results differ for each sampling method.
+
+Usage: python -m benchmarks.sampling [--size 2048] [--edges 100000]
+"""
+import os
+import time
+import argparse
+import rasterio
+import tempfile
+import numpy as np
+from shapely.geometry import shape
+from osw_incline.dem_processor import DEMProcessor
+from src.inclination_helper.incline_calculator import InclineCalculator
+from benchmarks.windowed_reads import write_tile, NORTH, WEST
+
+
+def sample_geometries(count, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = np.column_stack([rng.uniform(-WEST + 0.01, -WEST + 0.99, count),
+                              rng.uniform(NORTH - 0.99, NORTH - 0.01, count)])
+    ends = starts + rng.uniform(-0.0005, 0.0005, (count, 2))
+    return [{'type': 'LineString', 'coordinates': [start, end]} for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def per_edge(path, geometries):
+    processor = DEMProcessor(osm_graph=None, dem_files=[])
+    inclines = []
+    with rasterio.open(path) as dem:
+        for geometry in geometries:
+            incline = processor.infer_incline(linestring=shape(geometry), dem=dem, precision=3)
+            inclines.append(incline if incline is not None and -1 <= incline <= 1 else None)
+    return inclines
+
+
+def vectorized(path, geometries, method):
+    calculator = InclineCalculator(method=method)
+    try:
+        return calculator.inclines(geometries=geometries, dem_files=[path])
+    finally:
+        calculator.close()
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def differences(expected, result):
+    pairs = [(e, r) for e, r in zip(expected, result) if e is not None and r is not None]
+    deltas = np.abs(np.array([e - r for e, r in pairs])) if pairs else np.zeros(1)
+    presence = sum((e is None) != (r is None) for e, r in zip(expected, result))
+    return deltas.max(), np.percentile(deltas, 99), presence
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=2048, help='Width and height of the tile in pixels')
+    parser.add_argument('--edges', type=int, default=100000, help='Number of edges to incline')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'n{NORTH}w{WEST}.tif')
+        write_tile(path, args.size)
+        geometries = sample_geometries(args.edges)
+        expected, baseline = timed(per_edge, path, geometries)
+        print(f'{args.edges} edges on a {args.size}x{args.size} tile')
+        print(f'{"per edge (osw_incline)":<26}{baseline:>8.2f} s')
+        for method in ('idw', 'bilinear'):
+            result, elapsed = timed(vectorized, path, geometries, method)
+            largest, p99, presence = differences(expected, result)
+            print(f'{f"vectorized {method}":<26}{elapsed:>8.2f} s{baseline / elapsed:>8.1f}x   '
+                  f'max |diff| {largest:.3f}, p99 {p99:.3f}, None mismatches {presence}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Compares whole-tile reads with the block cached reads used to sample DEM tiles.
+
+Writes a synthetic NED 1/3 sized GeoTIFF, inclines a city sized set of edges against it three
+ways and reports the time and the peak memory (as seen by tracemalloc) of each:
+
+    whole tile    the tile is read into memory once and windows are sliced from it
+    gdal windows  every 3x3 window is read from the dataset by GDAL
+    block cache   the windows are served from cached blocks (BlockCachedRaster)
+
+Usage: python -m benchmarks.windowed_reads [--size 10812] [--edges 20000] [--area 0.03]
+"""
+import os
+import time
+import argparse
+import rasterio
+import tempfile
+import tracemalloc
+import numpy as np
+from shapely.geometry import LineString
+from rasterio.windows import Window
+from rasterio.transform import from_origin
+from osw_incline.dem_processor import DEMProcessor
+from src.inclination_helper.block_cache import BlockCachedRaster
+
+NORTH = 48
+WEST = 123
+
+
+def write_tile(path, size):
+    resolution = 1 / size
+    with rasterio.open(
+        path, 'w', driver='GTiff', height=size, width=size, count=1, dtype='float32', crs='EPSG:4326',
+        transform=from_origin(-WEST, NORTH, resolution, resolution), tiled=True, blockxsize=256, blockysize=256
+    ) as dst:
+        cols = np.arange(size) * resolution
+        for row_off in range(0, size, 256):
+            rows = np.arange(row_off, min(row_off + 256, size))[:, None] * resolution
+            data = 100 + 500 * np.sin(rows * 7) * np.cos(cols * 5) + 20 * rows
+            dst.write(data.astype('float32'), 1, window=Window(0, row_off, size, len(rows)))
+
+
+def sample_lines(count, area, seed=0):
+    # Edges of up to ~30 m inside a square covering `area` of the tile
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(area)
+    west, south = -WEST + 0.3, NORTH - 1 + 0.3
+    starts = np.column_stack([rng.uniform(west, west + side, count), rng.uniform(south, south + side, count)])
+    ends = starts + rng.uniform(-0.0003, 0.0003, (count, 2))
+    return [LineString([start, end]) for start, end in zip(starts, ends)]
+
+
+def run(name, lines, open_dem):
+    processor = DEMProcessor(osm_graph=None, dem_files=[])
+    tracemalloc.start()
+    started = time.perf_counter()
+    dem = open_dem()
+    try:
+        inclines = [processor.infer_incline(linestring=line, dem=dem, precision=3) for line in lines]
+    finally:
+        dem.close()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<14}{elapsed:>10.2f} s{peak / 1024 ** 2:>12.1f} MiB')
+    return inclines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=10812, help='Width and height of the tile in pixels')
+    parser.add_argument('--edges', type=int, default=20000, help='Number of edges to incline')
+    parser.add_argument('--area', type=float, default=0.03, help='Fraction of the tile covered by the edges')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'n{NORTH}w{WEST}.tif')
+        write_tile(path, args.size)
+        lines = sample_lines(args.edges, args.area)
+        print(f'{args.edges} edges over {args.area:.0%} of a {args.size}x{args.size} tile')
+        print(f'{"":<14}{"time":>12}{"peak memory":>16}')
+        whole = run('whole tile', lines,
+                    lambda: BlockCachedRaster(rasterio.open(path), max_blocks=1, block_size=args.size))
+        gdal = run('gdal windows', lines, lambda: rasterio.open(path))
+        blocks = run('block cache', lines, lambda: BlockCachedRaster(rasterio.open(path)))
+        assert whole == gdal == blocks, 'The three ways of reading the tile gave different inclines'
+
+
+if __name__ == '__main__':
+    main()
@@ -14,10 +14,44 @@ class EventBusSettings:
     container_name: str = os.environ.get('CONTAINER_NAME', 'osw')
 
 
+class DEMSettings:
+    block_cache_blocks: int = int(os.environ.get('DEM_BLOCK_CACHE_BLOCKS', 64))
+    cache_max_bytes: int = int(os.environ.get('DEM_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+    download_chunk_size: int = int(os.environ.get('DEM_DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+    download_max_workers: int = int(os.environ.get('DEM_DOWNLOAD_MAX_WORKERS', 8))
+    download_retries: int = int(os.environ.get('DEM_DOWNLOAD_RETRIES', 4))
+    download_timeout: int = int(os.environ.get('DEM_DOWNLOAD_TIMEOUT', 60))
+    tile_format: str = os.environ.get('DEM_TILE_FORMAT', 'geotiff')
+    tile_quantize: bool = os.environ.get('DEM_TILE_QUANTIZE', 'false').lower() == 'true'
+    shared_memory: bool = os.environ.get('DEM_SHARED_MEMORY', 'false').lower() == 'true'
+
+
 class Settings(BaseSettings):
     app_name: str = 'python-osw-inclination'
     event_bus: ClassVar[EventBusSettings] = EventBusSettings()  # Annotate event_bus as a ClassVar
+    dem: ClassVar[DEMSettings] = DEMSettings()
     max_concurrent_messages: int = int(os.environ.get('MAX_CONCURRENT_MESSAGES', 2))  # Convert to int
+    incline_batch_size: int = int(os.environ.get('INCLINE_BATCH_SIZE', 10000))
+    incline_workers: int = int(os.environ.get('INCLINE_WORKERS', 1))
+    incline_sampling_method: str = os.environ.get('INCLINE_SAMPLING_METHOD', 'idw')
+    incline_cache: bool = os.environ.get('INCLINE_CACHE', 'true').lower() == 'true'
+    incline_cache_max_bytes: int = int(os.environ.get('INCLINE_CACHE_MAX_BYTES', 1024 ** 3))
+    job_dedup_ttl: int = int(os.environ.get('JOB_DEDUP_TTL', 7 * 24 * 60 * 60))
+    checkpoint_ttl: int = int(os.environ.get('CHECKPOINT_TTL', 24 * 60 * 60))
+    job_workers: int = int(os.environ.get('JOB_WORKERS', 1))
+    job_worker_max_jobs: int = int(os.environ.get('JOB_WORKER_MAX_JOBS', 10))
+    job_worker_max_rss: int = int(os.environ.get('JOB_WORKER_MAX_RSS', 2 * 1024 ** 3))
+    admission_control: bool = os.environ.get('ADMISSION_CONTROL', 'true').lower() == 'true'
+    admission_memory_bytes: int = int(os.environ.get('ADMISSION_MEMORY_BYTES', 0))
+    small_job_slots: int = int(os.environ.get('SMALL_JOB_SLOTS', 1))
+    small_job_max_edges: int = int(os.environ.get('SMALL_JOB_MAX_EDGES', 5000))
+    small_job_max_tiles: int = int(os.environ.get('SMALL_JOB_MAX_TILES', 1))
+    job_timeout: int = int(os.environ.get('JOB_TIMEOUT', 6 * 60 * 60))
+    pipeline_io_slots: int = int(os.environ.get('PIPELINE_IO_SLOTS', 2))
+    pipeline_prefetch_jobs: int = int(os.environ.get('PIPELINE_PREFETCH_JOBS', 1))
+    tile_hint_max_tiles: int = int(os.environ.get('TILE_HINT_MAX_TILES', 16))
+    tile_warmup_top_tiles: int = int(os.environ.get('TILE_WARMUP_TOP_TILES', 4))
+    tile_warmup_tiles: str = os.environ.get('TILE_WARMUP_TILES', '')
 
     def get_root_directory(self) -> str:
         return os.path.dirname(os.path.abspath(__file__))
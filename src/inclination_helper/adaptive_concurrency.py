@@ -0,0 +1,50 @@
+import time
+import threading
+
+
+class AdaptiveConcurrency:
+    """Additive increase / multiplicative decrease limit driven by measured throughput.
+
+    Completed transfers are accumulated into a measurement window that closes after `limit`
+    completions. When a window is at least `gain` faster than the previous one the limit grows
+    by one, when it is `gain` slower it shrinks by one, and any failure halves it.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=8, gain=0.1):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.gain = gain
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_count = 0
+        self._last_throughput = None
+
+    def record_success(self, nbytes):
+        with self._lock:
+            self._window_bytes += nbytes
+            self._window_count += 1
+            if self._window_count < self.limit:
+                return
+            elapsed = max(time.monotonic() - self._window_start, 1e-6)
+            throughput = self._window_bytes / elapsed
+            if self._last_throughput is not None:
+                if throughput >= self._last_throughput * (1 + self.gain):
+                    self.limit = min(self.limit + 1, self.maximum)
+                elif throughput <= self._last_throughput * (1 - self.gain):
+                    self.limit = max(self.limit - 1, self.minimum)
+            elif self._window_bytes > 0:
+                self.limit = min(self.limit + 1, self.maximum)
+            self._last_throughput = throughput
+            self._reset_window()
+
+    def record_failure(self):
+        with self._lock:
+            self.limit = max(self.limit // 2, self.minimum)
+            self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_count = 0
@@ -0,0 +1,125 @@
+import math
+import numpy as np
+from collections import OrderedDict
+from rasterio.windows import Window
+
+
+class BlockCachedRaster:
+    """Serves windows of band 1 of an open raster from a small LRU cache of blocks.
+
+    Sampling an edge reads a 3x3 window around each of its end points. Rather than asking GDAL
+    for every such window, the raster is read in blocks aligned to its internal tiling, and
+    only the blocks that edges actually touch are read and kept (up to `max_blocks`). Windows
+    are clipped to the raster like `DatasetReader.read()` does, and carry the same mask. Values
+    of rasters with a scale or offset (quantized tiles) are returned in meters.
+    """
+
+    BLOCK_SIZE = 256
+
+    def __init__(self, dataset, max_blocks=64, block_size=None):
+        self.dataset = dataset
+        self.transform = dataset.transform
+        self.height = dataset.height
+        self.width = dataset.width
+        self.max_blocks = max(1, max_blocks)
+        self.block_height, self.block_width = self._block_shape(dataset, block_size or self.BLOCK_SIZE)
+        self.scale = dataset.scales[0]
+        self.offset = dataset.offsets[0]
+        self.dtype = 'float32' if self.scale != 1 or self.offset else dataset.dtypes[0]
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+
+    @staticmethod
+    def _block_shape(dataset, block_size):
+        # Blocks are a whole number of the raster's own blocks so each of them is decompressed
+        # once. Striped rasters (one block spans the full width) are cut into square blocks.
+        block_height, block_width = dataset.block_shapes[0]
+        if block_width >= dataset.width:
+            return block_size, block_size
+        return (
+            block_height * max(1, math.ceil(block_size / block_height)),
+            block_width * max(1, math.ceil(block_size / block_width))
+        )
+
+    @property
+    def closed(self):
+        return self.dataset.closed
+
+    def _block(self, block_row, block_col):
+        key = (block_row, block_col)
+        block = self._blocks.get(key)
+        if block is not None:
+            self.hits += 1
+            self._blocks.move_to_end(key)
+            return block
+        self.misses += 1
+        window = Window(block_col * self.block_width, block_row * self.block_height,
+                        self.block_width, self.block_height)
+        data = self.dataset.read(1, window=window, masked=True)
+        values = np.ma.getdata(data)
+        if self.scale != 1 or self.offset:
+            values = (values * self.scale + self.offset).astype(self.dtype)
+        block = (values, np.ma.getmaskarray(data))
+        self._blocks[key] = block
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def read(self, indexes, window, masked=False):
+        if indexes != 1:
+            raise ValueError(f'Only band 1 can be read through the block cache, not {indexes}')
+        row_start = max(int(window.row_off), 0)
+        col_start = max(int(window.col_off), 0)
+        row_stop = min(int(window.row_off + window.height), self.height)
+        col_stop = min(int(window.col_off + window.width), self.width)
+        shape = (max(row_stop - row_start, 0), max(col_stop - col_start, 0))
+        data = np.empty(shape, dtype=self.dtype)
+        mask = np.zeros(shape, dtype=bool)
+
+        for block_row in range(row_start // self.block_height, (row_stop - 1) // self.block_height + 1):
+            for block_col in range(col_start // self.block_width, (col_stop - 1) // self.block_width + 1):
+                if not shape[0] or not shape[1]:
+                    break
+                block_data, block_mask = self._block(block_row, block_col)
+                top = block_row * self.block_height
+                left = block_col * self.block_width
+                rows = slice(max(row_start, top), min(row_stop, top + self.block_height))
+                cols = slice(max(col_start, left), min(col_stop, left + self.block_width))
+                target = (slice(rows.start - row_start, rows.stop - row_start),
+                          slice(cols.start - col_start, cols.stop - col_start))
+                source = (slice(rows.start - top, rows.stop - top), slice(cols.start - left, cols.stop - left))
+                data[target] = block_data[source]
+                mask[target] = block_mask[source]
+
+        if not masked:
+            return data
+        return np.ma.masked_array(data, mask=mask, fill_value=self.dataset.nodata)
+
+    def gather(self, rows, cols):
+        """Values and mask of the pixels at (rows, cols), which must lie within the raster."""
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        values = np.empty(rows.shape, dtype=self.dtype)
+        mask = np.empty(rows.shape, dtype=bool)
+        block_rows = rows // self.block_height
+        block_cols = cols // self.block_width
+        keys = block_rows * (self.width // self.block_width + 1) + block_cols
+        order = np.argsort(keys, axis=None, kind='stable')
+        sorted_keys = keys.ravel()[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        flat_rows, flat_cols = rows.ravel(), cols.ravel()
+        flat_values, flat_mask = values.reshape(-1), mask.reshape(-1)
+        for start, stop in zip(starts, np.r_[starts[1:], len(order)]):
+            indices = order[start:stop]
+            block_row, block_col = divmod(int(sorted_keys[start]), self.width // self.block_width + 1)
+            block_data, block_mask = self._block(block_row, block_col)
+            local_rows = flat_rows[indices] - block_row * self.block_height
+            local_cols = flat_cols[indices] - block_col * self.block_width
+            flat_values[indices] = block_data[local_rows, local_cols]
+            flat_mask[indices] = block_mask[local_rows, local_cols]
+        return values, mask
+
+    def close(self):
+        self._blocks.clear()
+        self.dataset.close()
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import shutil
+from pathlib import Path
+from src.logger import Logger
+
+
+class JobCheckpoint:
+    """Stages completed by a job, kept in its directory so a redelivered message can resume.
+
+    A stage is recorded with a value (e.g. the path it produced) once it is complete. Computed
+    edges are saved as numbered chunks, one per batch, each written atomically so a chunk on
+    disk is always complete. Chunks are only valid for the `fingerprint` they were computed with
+    (batch size, calculator options) and are discarded when it changes.
+    """
+    FILE_NAME = 'checkpoint.json'
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.path = Path(self.directory, self.FILE_NAME)
+        self.chunk_dir = Path(self.directory, 'chunks')
+        self.stages = {}
+        try:
+            with open(self.path) as f:
+                self.stages = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def done(self, stage):
+        return self.stages.get(stage)
+
+    def complete(self, stage, value=True):
+        self.stages[stage] = value
+        self._save()
+
+    def _save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        part_path = self.path.with_name(f'{self.path.name}.part')
+        with open(part_path, 'w') as f:
+            json.dump(self.stages, f)
+        os.replace(part_path, self.path)
+
+    def start_chunks(self, fingerprint):
+        """Keeps the saved chunks if they were computed with `fingerprint`, drops them otherwise."""
+        if self.stages.get('chunks') != fingerprint:
+            shutil.rmtree(self.chunk_dir, ignore_errors=True)
+            self.stages.pop('zipped', None)
+            self.complete('chunks', fingerprint)
+        self.chunk_dir.mkdir(parents=True, exist_ok=True)
+
+    def chunk_path(self, index):
+        return Path(self.chunk_dir, f'{index:08d}.jsonl')
+
+    def load_chunk(self, index):
+        """The features of chunk `index`, None if it was not saved."""
+        try:
+            with open(self.chunk_path(index)) as f:
+                return [json.loads(line) for line in f]
+        except FileNotFoundError:
+            return None
+
+    def save_chunk(self, index, features):
+        path = self.chunk_path(index)
+        part_path = path.with_name(f'{path.name}.part')
+        with open(part_path, 'w') as f:
+            for feature in features:
+                f.write(json.dumps(feature))
+                f.write('\n')
+        os.replace(part_path, path)
+        # The checkpoint counts as in use for garbage collection while chunks are being added
+        os.utime(self.path)
+
+    @classmethod
+    def collect_garbage(cls, directory, max_age, keep=('dems',)):
+        """Removes the job directories under `directory` not modified for `max_age` seconds.
+
+        A directory counts as modified when it, its checkpoint or any file directly in it is, so
+        the directory of a job that failed before its first checkpoint is removed as well. The
+        directories in `keep` (the shared DEM tiles) are never removed.
+        """
+        removed = []
+        cutoff = time.time() - max_age
+        for path in Path(directory).iterdir():
+            try:
+                if not path.is_dir() or path.name in keep or cls._last_modified(path) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path.name)
+        if removed:
+            Logger.info(f'Removed stale job directories: {removed}')
+        return removed
+
+    @staticmethod
+    def _last_modified(path):
+        with os.scandir(path) as entries:
+            return max([path.stat().st_mtime] + [entry.stat().st_mtime for entry in entries])
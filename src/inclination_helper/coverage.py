@@ -0,0 +1,126 @@
+import numpy as np
+
+_RANGE_OFFSET = 256
+_RANGE_MASK = 511
+_RANGE_SHIFTS = np.array([27, 18, 9, 0], dtype=np.int64)
+
+
+def _positions(coordinates):
+    # Flattens the (possibly nested) GeoJSON coordinates of one geometry into [x, y] pairs
+    if not coordinates:
+        return []
+    first = coordinates[0]
+    if isinstance(first, (int, float)):
+        return [coordinates[:2]]
+    if isinstance(first[0], (int, float)):
+        return coordinates if len(first) == 2 else [position[:2] for position in coordinates]
+    positions = []
+    for part in coordinates:
+        positions.extend(_positions(part))
+    return positions
+
+
+def _geometry_positions(geometry):
+    if not geometry:
+        return []
+    if geometry.get('type') == 'GeometryCollection':
+        positions = []
+        for part in geometry.get('geometries', []):
+            positions.extend(_geometry_positions(part))
+        return positions
+    return _positions(geometry.get('coordinates'))
+
+
+def feature_bounds(geometries) -> np.ndarray:
+    """Bounds (minx, miny, maxx, maxy) of GeoJSON geometries as an (N, 4) array.
+
+    The coordinates of all geometries are gathered into one array and reduced per geometry with
+    `np.minimum.reduceat`/`np.maximum.reduceat`, instead of building a shapely shape per feature.
+    Geometries without coordinates get a row of NaN.
+    """
+    positions = []
+    counts = []
+    for geometry in geometries:
+        geometry_positions = _geometry_positions(geometry)
+        positions.extend(geometry_positions)
+        counts.append(len(geometry_positions))
+
+    bounds = np.full((len(counts), 4), np.nan)
+    if not positions:
+        return bounds
+
+    coords = np.asarray(positions, dtype=float)
+    counts = np.asarray(counts)
+    has_coords = counts > 0
+    offsets = (np.cumsum(counts) - counts)[has_coords]
+    bounds[has_coords, 0] = np.minimum.reduceat(coords[:, 0], offsets)
+    bounds[has_coords, 1] = np.minimum.reduceat(coords[:, 1], offsets)
+    bounds[has_coords, 2] = np.maximum.reduceat(coords[:, 0], offsets)
+    bounds[has_coords, 3] = np.maximum.reduceat(coords[:, 1], offsets)
+    return bounds
+
+
+def cell_ranges(bounds) -> np.ndarray:
+    """Range of NED 1/3 cells (n_min, n_max, w_min, w_max) touched by each of the bounds.
+
+    Tile `n{n}w{w}` covers latitudes [n - 1, n] and longitudes [-w, -w + 1]. Every tile whose
+    extent touches a bounding box is included, so edges that end exactly on a tile boundary
+    also get the neighbouring tile. Rows of bounds containing NaN must be filtered out first.
+    """
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    return np.column_stack([
+        np.ceil(bounds[:, 1]),
+        np.floor(bounds[:, 3]) + 1,
+        np.ceil(-bounds[:, 2]),
+        np.floor(-bounds[:, 0]) + 1
+    ]).astype(np.int64)
+
+
+def range_tiles(n_min, n_max, w_min, w_max):
+    return [f'n{n}w{w:03}' for n in range(n_min, n_max + 1) for w in range(w_min, w_max + 1)]
+
+
+def tile_cells(bounds) -> np.ndarray:
+    """Distinct NED 1/3 cells, as (n, w) rows, touched by any of the bounds (see `cell_ranges`)."""
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    bounds = bounds[~np.isnan(bounds).any(axis=1)]
+    if len(bounds) == 0:
+        return np.empty((0, 2), dtype=int)
+
+    ranges = cell_ranges(bounds)
+    # Almost every edge falls in one cell, so expanding the distinct ranges is cheap. Each range
+    # is packed into one integer (values are within +-256) to make the de-duplication a 1-D unique.
+    keys = np.unique(((ranges + _RANGE_OFFSET) << _RANGE_SHIFTS).sum(axis=1))
+    ranges = ((keys[:, None] >> _RANGE_SHIFTS) & _RANGE_MASK) - _RANGE_OFFSET
+    single = (ranges[:, 0] == ranges[:, 1]) & (ranges[:, 2] == ranges[:, 3])
+    cells = [ranges[single][:, [0, 2]]]
+    for n_min, n_max, w_min, w_max in ranges[~single]:
+        n, w = np.meshgrid(np.arange(n_min, n_max + 1), np.arange(w_min, w_max + 1), indexing='ij')
+        cells.append(np.column_stack([n.ravel(), w.ravel()]))
+    return np.unique(np.concatenate(cells), axis=0)
+
+
+def bucket_by_tile(bounds, tiles):
+    """Groups edges by the one DEM tile that fully covers them.
+
+    Returns `(buckets, shared)`: `buckets` maps a tile to the indices of the edges it owns and
+    `shared` lists `(index, tiles)` for edges that cross tile boundaries or have no tile at all.
+    Only tiles in `tiles` are considered, covering tiles are listed in grid order.
+    """
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    has_bounds = ~np.isnan(bounds).any(axis=1)
+    ranges = cell_ranges(np.nan_to_num(bounds))
+    covering_by_range = {}
+    buckets = {}
+    shared = []
+    for index, (valid, cell_range) in enumerate(zip(has_bounds.tolist(), ranges.tolist())):
+        key = tuple(cell_range) if valid else None
+        covering = covering_by_range.get(key)
+        if covering is None:
+            covering = [] if key is None else [tile for tile in range_tiles(*key) if tile in tiles]
+            covering_by_range[key] = covering
+        if len(covering) == 1:
+            buckets.setdefault(covering[0], []).append(index)
+        else:
+            shared.append((index, covering))
+    return buckets, shared
@@ -0,0 +1,49 @@
+import time
+
+
+class JobTimeoutError(Exception):
+    def __init__(self, seconds, stage):
+        self.seconds = seconds
+        self.stage = stage
+        super().__init__(f'Job exceeded its deadline of {seconds} seconds during {stage}')
+
+    def __reduce__(self):
+        # Raised in job worker processes and re-raised in the service
+        return self.__class__, (self.seconds, self.stage)
+
+
+class Deadline:
+    """Time by which a job has to complete, checked by the job at stage boundaries and in its loops.
+
+    Based on the wall clock, so a deadline passed to another process stays the same. Without
+    `seconds` (or with 0) the job has no deadline and the checks never fail.
+    """
+
+    def __init__(self, seconds=0):
+        self.seconds = seconds
+        self.expires_at = time.time() + seconds if seconds and seconds > 0 else None
+
+    def extend(self, seconds):
+        # For the time a job was held back without running
+        if self.expires_at is not None:
+            self.expires_at += seconds
+
+    def remaining(self):
+        """Seconds left, None without a deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def check(self, stage):
+        if self.expired():
+            raise JobTimeoutError(seconds=self.seconds, stage=stage)
+
+    def timeout(self, timeout):
+        """`timeout` shortened to the time left, so blocking calls do not outlive the deadline."""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return max(0.01, min(timeout, remaining)) if timeout is not None else max(0.01, remaining)
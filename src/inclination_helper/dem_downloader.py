@@ -1,19 +1,129 @@
 import gc
+import os
+import json
 import time
-import math
+import random
+import sqlite3
 import requests
+import threading
 from pathlib import Path
 import concurrent.futures
+from functools import lru_cache
 from src.logger import Logger
+from requests.adapters import HTTPAdapter
+from src.inclination_helper.adaptive_concurrency import AdaptiveConcurrency
+from src.inclination_helper.coverage import tile_cells
+from src.inclination_helper.tile_cache import TileCache
+from src.inclination_helper.tile_usage import TileUsage
+from src.inclination_helper.dem_transcoder import transcode_tile, TileRangeError
+from src.inclination_helper.single_flight import SingleFlight, file_lock
+from src.inclination_helper.deadline import Deadline, JobTimeoutError
+
+
+# Byte order marks of classic and BigTIFF files, little and big endian
+TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+
+
+@lru_cache()
+def load_ned_13_index(index_path) -> frozenset:
+    # Loaded once per process, membership checks against the index are then O(1)
+    with open(index_path) as f:
+        return frozenset(json.load(f)['tiles'])
+
+
+def is_valid_tile(path) -> bool:
+    """A tile counts as cached only if it is a GeoTIFF of the size recorded when it was downloaded."""
+    path = Path(path)
+    try:
+        with open(path, 'rb') as f:
+            if f.read(4) not in TIFF_SIGNATURES:
+                return False
+        meta_path = path.with_name(f'{path.name}.json')
+        if meta_path.exists():
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('size') is not None and meta['size'] != path.stat().st_size:
+                return False
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+class DEMDownloadError(Exception):
+    def __init__(self, tiles):
+        self.tiles = sorted(tiles)
+        super().__init__(f'Failed to download DEM tiles: {", ".join(self.tiles)}')
+
+    def __reduce__(self):
+        # Raised in job worker processes and re-raised in the service
+        return self.__class__, (self.tiles,)
 
 
 class DEMDownloader:
     TEMPLATE = 'https://prd-tnm.s3.amazonaws.com/StagedProducts/Elevation/13/TIFF/current/{e}/USGS_13_{e}.tif'
+    # Shared by every downloader in the process, so each tile is fetched only once at a time
+    _downloads = SingleFlight()
+    _session = None
+    _session_lock = threading.Lock()
+    POOL_SIZE = 16
+    # Client errors that will not go away by asking again
+    NON_RETRYABLE_STATUS = {400, 401, 403, 404, 410}
 
-    def __init__(self, ned_13_index, workdir):
-        self.ned_13_tiles = []
+    def __init__(self, ned_13_index, workdir, cache_max_bytes=0, chunk_size=1024 * 1024, max_workers=8,
+                 retries=4, backoff=1.0, timeout=60, tile_format='geotiff', quantize=False, deadline=None,
+                 counted_tiles=()):
+        self.ned_13_tiles = set()
         self.workdir = workdir
-        self.ned_13_index = ned_13_index
+        self.ned_13_index = frozenset(ned_13_index)
+        self.cache_max_bytes = cache_max_bytes
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.tile_format = tile_format
+        self.quantize = quantize
+        self.deadline = deadline or Deadline()
+        self.failed_tiles = []
+        self._cache = None
+        self._usage = None
+        self._pinned_tiles = set()
+        self._missing_tiles = set()
+        # Tiles whose use by the job is already counted, e.g. by the downloader that prefetched them
+        self._counted_tiles = set(counted_tiles)
+
+    @classmethod
+    def _after_fork(cls):
+        # The pooled connections, the downloads in flight in other threads and the locks they
+        # held all belong to the parent
+        cls._downloads = SingleFlight()
+        cls._session = None
+        cls._session_lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        # One pooled session for the process, so connections to the DEM host are reused across tiles and jobs
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=cls.POOL_SIZE, pool_maxsize=cls.POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                cls._session = session
+            return cls._session
+
+    @property
+    def cache(self) -> TileCache:
+        if self._cache is None:
+            self._cache = TileCache.for_directory(self.get_dem_dir(), max_bytes=self.cache_max_bytes)
+        return self._cache
+
+    @property
+    def usage(self) -> TileUsage:
+        # Next to the DEM directory rather than in it, the counts outlive evicted tiles
+        if self._usage is None:
+            self._usage = TileUsage.for_path(Path(self.workdir, 'tile_usage.sqlite3'))
+        return self._usage
 
     def get_dem_dir(self):
         dem_path = Path(self.workdir, 'dems')
@@ -24,78 +134,272 @@ class DEMDownloader:
         if tile_name not in self.ned_13_index:
             raise ValueError(f'Invalid tile name {tile_name}')
 
-        url = self.TEMPLATE.format(e=tile_name)
         filename = f'{tile_name}.tif'
         dem_dir = self.get_dem_dir()
         path = Path(dem_dir, filename)
 
+        while True:
+            try:
+                return self._downloads.do(str(path), self._download_tile_once, tile_name, path)
+            except JobTimeoutError:
+                # The download may have been started by another job whose deadline expired
+                if self.deadline.expired():
+                    raise
+
+    def _download_tile_once(self, tile_name: str, path: Path) -> int:
+        # The file lock coordinates with other processes sharing the same DEM directory
+        with file_lock(path.with_name(f'{path.name}.lock')):
+            if is_valid_tile(path):
+                Logger.info(f'{tile_name} already downloaded by another worker')
+                return 0
+            return self._fetch_tile_with_retries(tile_name=tile_name, path=path)
+
+    def _fetch_tile_with_retries(self, tile_name: str, path: Path) -> int:
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_tile(tile_name=tile_name, path=path)
+            except (requests.RequestException, IOError) as err:
+                response = getattr(err, 'response', None)
+                if response is not None and response.status_code in self.NON_RETRYABLE_STATUS:
+                    raise
+                if attempt >= self.retries:
+                    raise
+                # Exponential backoff with full jitter, a retry resumes from the .part file
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                attempt += 1
+                Logger.warning(f'Download of {tile_name} failed ({err}), retry {attempt} in {delay:.1f} seconds')
+                time.sleep(self.deadline.timeout(delay))
+
+    def _fetch_tile(self, tile_name: str, path: Path) -> int:
+        # Download into a .part file and rename it only once it has been verified, so an
+        # interrupted download never leaves a truncated tile behind. A later attempt resumes
+        # the .part file with a Range request if the remote file is unchanged (If-Range).
+        url = self.TEMPLATE.format(e=tile_name)
+        part_path = path.with_name(f'{path.name}.part')
+        part_meta_path = path.with_name(f'{path.name}.part.json')
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        etag = None
+        if offset and part_meta_path.exists():
+            with open(part_meta_path) as f:
+                etag = json.load(f).get('etag')
+
+        headers = {}
+        if offset and etag:
+            headers = {'Range': f'bytes={offset}-', 'If-Range': etag}
+
+        stage = f'download of {tile_name}'
+        self.deadline.check(stage)
         start_time = time.time()
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        timeout = self.deadline.timeout(self.timeout)
+        with self.get_session().get(url, stream=True, headers=headers, timeout=timeout) as r:
+            if r.status_code == 416 and headers:
+                # Nothing left after the offset: the .part file was complete when the earlier
+                # attempt stopped, or it is longer than the remote file and is started over
+                expected_size = self._expected_size(response=r, offset=0)
+                if expected_size != offset:
+                    part_path.unlink(missing_ok=True)
+                    part_meta_path.unlink(missing_ok=True)
+                    raise IOError(f'Cannot resume {tile_name} from {offset} bytes of {expected_size}')
+            else:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    offset = 0
+                expected_size = self._expected_size(response=r, offset=offset)
+                etag = r.headers.get('ETag')
+                with open(part_meta_path, 'w') as f:
+                    json.dump({'etag': etag}, f)
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                        # The .part file is kept, a later attempt of the job resumes it
+                        self.deadline.check(stage)
+
+        size = part_path.stat().st_size
+        if expected_size is not None and size != expected_size:
+            raise IOError(f'Incomplete download for {tile_name}: {size} of {expected_size} bytes')
+        if not is_valid_tile(part_path):
+            part_path.unlink()
+            raise IOError(f'Downloaded file for {tile_name} is not a GeoTIFF')
+
+        # The transcode rewrites the .part file, it must not be resumed from then on
+        part_meta_path.unlink(missing_ok=True)
+        tile_format = self._transcode(tile_name=tile_name, part_path=part_path, path=path)
+        size = part_path.stat().st_size
+        with open(path.with_name(f'{path.name}.json'), 'w') as f:
+            json.dump({'size': size, 'etag': etag, 'format': tile_format}, f)
+        os.replace(part_path, path)
+
         end_time = time.time()
         Logger.info(f'{tile_name} downloaded in {end_time - start_time} seconds')
 
         gc.collect()
+        return size
+
+    def _transcode(self, tile_name: str, part_path: Path, path: Path) -> str:
+        if self.tile_format == 'geotiff':
+            return 'geotiff'
+        start_time = time.time()
+        try:
+            transcode_tile(source=part_path, path=path, tile_format=self.tile_format, quantize=self.quantize)
+        except TileRangeError as err:
+            # Quantization is an optimisation, the tile is still usable as float32
+            Logger.warning(f'{tile_name} not quantized: {err}')
+            transcode_tile(source=part_path, path=path, tile_format=self.tile_format)
+        Logger.info(f'{tile_name} transcoded to {self.tile_format} in {time.time() - start_time} seconds')
+        return self.tile_format
+
+    @staticmethod
+    def _expected_size(response, offset):
+        content_range = response.headers.get('Content-Range')
+        if content_range and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            if total.isdigit():
+                return int(total)
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit():
+            return offset + int(content_length)
+        return None
+
+    def fetch_ned_tiles(self, tile_names, max_workers=None):
+        """Downloads the tiles and returns the ones that could not be fetched.
 
-    def fetch_ned_tiles(self, tile_names, max_workers=4):
+        The number of downloads in flight starts low and is adjusted to the measured throughput,
+        up to `max_workers`.
+        """
+        max_workers = max_workers or self.max_workers
+        concurrency = AdaptiveConcurrency(initial=min(2, max_workers), maximum=max_workers)
+        pending = list(tile_names)
+        failed_tiles = []
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_tile = {
-                executor.submit(self.download_tile, tile_name): tile_name
-                for tile_name in tile_names
-            }
-
-            # Iterate over the results as they complete
-            for future in concurrent.futures.as_completed(future_to_tile):
-                tile_name = future_to_tile[future]
-                try:
-                    future.result()
-                    Logger.info(f'Tile {tile_name} downloaded successfully')
-                except Exception as exc:
-                    Logger.info(f'Tile {tile_name} generated an exception: {exc}')
+            future_to_tile = {}
+            while pending or future_to_tile:
+                # The downloads in flight stop at their next chunk once the deadline has expired
+                self.deadline.check('tile downloads')
+                while pending and len(future_to_tile) < concurrency.limit:
+                    tile_name = pending.pop(0)
+                    future_to_tile[executor.submit(self.download_tile, tile_name)] = tile_name
+
+                done, _ = concurrent.futures.wait(future_to_tile, timeout=self.deadline.remaining(),
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    tile_name = future_to_tile.pop(future)
+                    try:
+                        nbytes = future.result()
+                        concurrency.record_success(nbytes or 0)
+                        Logger.info(f'Tile {tile_name} downloaded successfully')
+                    except Exception as exc:
+                        concurrency.record_failure()
+                        failed_tiles.append(tile_name)
+                        Logger.error(f'Tile {tile_name} generated an exception: {exc}')
+        self.failed_tiles.extend(failed_tiles)
         gc.collect()
+        return failed_tiles
 
     def get_ned13_for_bounds(self, total_bounds):
-        for bounds in total_bounds:
-            north_min = int(math.floor(bounds[1]))
-            north_max = int(math.ceil(bounds[3]))
-            west_min = int(math.floor(-1 * bounds[2]))
-            west_max = int(math.ceil(-1 * bounds[0]))
-            for n in range(north_min + 1, north_max + 1):
-                for w in range(west_min + 1, west_max + 1):
-                    tile = f'n{n}w{w:03}'
-                    if tile in self.ned_13_index:
-                        if tile in self.ned_13_tiles:
-                            pass
-                        else:
-                            self.ned_13_tiles.append(tile)
-                    else:
-                        Logger.warning(f'Tile not found {tile}')
-                        pass
+        """Returns the tiles covering the bounds, downloading the ones that are not cached yet.
+
+        Tiles already resolved by an earlier call are not looked up again, so calling this for
+        every batch of edges of a job is cheap.
+        """
+        # Most edges share a handful of 1 degree cells, so the distinct cells are computed in bulk
+        # and each one is looked up in the index only once
+        tiles = set()
+        for n, w in tile_cells(total_bounds).tolist():
+            tile = f'n{n}w{w:03}'
+            if tile in self.ned_13_index:
+                tiles.add(tile)
+            elif tile not in self._missing_tiles:
+                self._missing_tiles.add(tile)
+                Logger.warning(f'Tile not found {tile}')
+
+        new_tiles = sorted(tiles - self.ned_13_tiles)
+        if new_tiles:
+            self._resolve_tiles(new_tiles)
+        return sorted(tiles)
+
+    def prefetch(self, tiles):
+        """Fetches, pins and counts the use of `tiles` ahead of the computation.
+
+        The computation resolves them again on its own downloader, which is given them as
+        `counted_tiles` so that their use and cache hits are not counted twice for the job. A tile
+        already being downloaded, e.g. warmed from a hint, is waited for rather than fetched again.
+        """
+        new_tiles = sorted((set(tiles) & self.ned_13_index) - self.ned_13_tiles)
+        if new_tiles:
+            self._resolve_tiles(new_tiles)
+
+    def warm(self, tiles):
+        """Downloads the `tiles` that are not cached yet, without resolving them for the job.
+
+        For tiles the job is expected to need before it is known which ones it does. A tile that
+        cannot be fetched is only returned, it is fetched again if it turns out to be needed.
+        """
+        cached_tiles = set(self.list_ned13s())
+        fetch_tiles = sorted(tile for tile in (set(tiles) & self.ned_13_index) if tile not in cached_tiles)
+        if not fetch_tiles:
+            return []
+        Logger.info(f'Fetching DEM data ahead for {fetch_tiles}...')
+        failed_tiles = self.fetch_ned_tiles(tile_names=fetch_tiles)
+        self.cache.evict()
+        return failed_tiles
+
+    def _resolve_tiles(self, new_tiles):
+        self.ned_13_tiles.update(new_tiles)
+
+        # Pin the tiles for this job so that eviction never removes them while in use
+        self.cache.pin(new_tiles)
+        self._pinned_tiles.update(new_tiles)
 
         # Check temporary dir for these tiles
-        cached_tiles = self.list_ned13s()
+        cached_tiles = set(self.list_ned13s())
 
-        fetch_tiles = [tile for tile in self.ned_13_tiles if tile not in cached_tiles]
+        fetch_tiles = [tile for tile in new_tiles if tile not in cached_tiles]
+        counted_tiles = [tile for tile in new_tiles if tile not in self._counted_tiles]
+        self._counted_tiles.update(new_tiles)
+        self.cache.record_hits([tile for tile in counted_tiles if tile in cached_tiles])
+        self.cache.record_misses([tile for tile in counted_tiles if tile not in cached_tiles])
+        if counted_tiles:
+            try:
+                self.usage.record(counted_tiles)
+            except sqlite3.Error as err:
+                Logger.warning(f'Could not record the usage of {counted_tiles}: {err}')
 
         if fetch_tiles:
             Logger.info(f"Fetching DEM data for {fetch_tiles}...")
 
+        failed_tiles = []
         if len(fetch_tiles) > 0:
-            self.fetch_ned_tiles(tile_names=fetch_tiles)
+            failed_tiles = self.fetch_ned_tiles(tile_names=fetch_tiles)
+            self.cache.evict()
 
+        Logger.info(f'DEM cache stats: {self.cache.stats()}')
         gc.collect()
 
+        if failed_tiles:
+            # Computing without these tiles would silently leave edges without incline
+            raise DEMDownloadError(failed_tiles)
+
+    def release_tiles(self):
+        # Unpin the tiles used by this job, they become candidates for eviction again
+        self.cache.unpin(self._pinned_tiles)
+        self._pinned_tiles = set()
+        self.cache.evict()
+
     def list_ned13s(self):
         dem_dir = self.get_dem_dir()
-        return [Path(tif).stem for tif in dem_dir.glob('*.tif') if Path(tif).stem in self.ned_13_index]
+        return [
+            Path(tif).stem for tif in dem_dir.glob('*.tif')
+            if Path(tif).stem in self.ned_13_index and is_valid_tile(tif)
+        ]
 
     def list_ned13s_full_paths(self):
         dem_dir = self.get_dem_dir()
         # Return the full path for each matching file
         return [
             str(tif) for tif in dem_dir.glob('*.tif')
-            if tif.stem in self.ned_13_index and tif.stem in self.ned_13_tiles
+            if tif.stem in self.ned_13_index and tif.stem in self.ned_13_tiles and is_valid_tile(tif)
         ]
+
+
+os.register_at_fork(after_in_child=DEMDownloader._after_fork)
@@ -0,0 +1,176 @@
+import os
+import json
+import rasterio
+import numpy as np
+from pathlib import Path
+from affine import Affine
+from rasterio.windows import Window
+from src.inclination_helper.block_cache import BlockCachedRaster
+
+TILE_FORMATS = ('geotiff', 'tiled', 'npy')
+QUANTIZED_NODATA = -32768
+QUANTIZED_SCALE = 0.1
+_QUANTIZED_SPAN = 65534  # int16 values -32767..32767, -32768 being nodata
+_ROWS_PER_WINDOW = 256
+
+
+class TileRangeError(ValueError):
+    pass
+
+
+def _row_windows(dataset):
+    for row_off in range(0, dataset.height, _ROWS_PER_WINDOW):
+        yield Window(0, row_off, dataset.width, min(_ROWS_PER_WINDOW, dataset.height - row_off))
+
+
+def _quantized_offset(dataset):
+    # Decimeters relative to the lowest point of the tile, so any tile spanning less than
+    # 6553.4 m of elevation (all of NED) fits in an int16
+    low, high = np.inf, -np.inf
+    for window in _row_windows(dataset):
+        data = dataset.read(1, window=window, masked=True)
+        if data.count():
+            low, high = min(low, float(data.min())), max(high, float(data.max()))
+    if low == np.inf:
+        return 0.0
+    if (high - low) / QUANTIZED_SCALE > _QUANTIZED_SPAN:
+        raise TileRangeError(f'Elevations from {low} to {high} do not fit in int16 decimeters')
+    return low + (_QUANTIZED_SPAN // 2) * QUANTIZED_SCALE
+
+
+def _quantize(data, offset):
+    values = np.rint((np.ma.getdata(data).astype('float64') - offset) / QUANTIZED_SCALE)
+    values = np.clip(values, -_QUANTIZED_SPAN // 2, _QUANTIZED_SPAN // 2).astype('int16')
+    values[np.ma.getmaskarray(data)] = QUANTIZED_NODATA
+    return values
+
+
+def _write_tiled(dataset, target, quantize):
+    profile = dataset.profile.copy()
+    profile.update(driver='GTiff', tiled=True, blockxsize=256, blockysize=256, compress='deflate',
+                   predictor=2 if quantize else 3, BIGTIFF='IF_SAFER')
+    offset = None
+    if quantize:
+        offset = _quantized_offset(dataset)
+        profile.update(dtype='int16', nodata=QUANTIZED_NODATA)
+    with rasterio.open(target, 'w', **profile) as dst:
+        if quantize:
+            dst.scales = (QUANTIZED_SCALE,)
+            dst.offsets = (offset,)
+        for window in _row_windows(dataset):
+            data = dataset.read(1, window=window, masked=quantize)
+            dst.write(_quantize(data, offset) if quantize else data, 1, window=window)
+
+
+def _write_npy(dataset, target, quantize):
+    offset = _quantized_offset(dataset) if quantize else 0.0
+    dtype = 'int16' if quantize else dataset.dtypes[0]
+    array = np.lib.format.open_memmap(target, mode='w+', dtype=dtype, shape=(dataset.height, dataset.width))
+    for window in _row_windows(dataset):
+        rows = slice(window.row_off, window.row_off + window.height)
+        array[rows] = _quantize(dataset.read(1, window=window, masked=True), offset) if quantize \
+            else dataset.read(1, window=window)
+    array.flush()
+    del array
+    return {
+        'transform': list(dataset.transform)[:6],
+        'crs': dataset.crs.to_string() if dataset.crs else None,
+        'nodata': QUANTIZED_NODATA if quantize else dataset.nodata,
+        'scale': QUANTIZED_SCALE if quantize else 1.0,
+        'offset': offset
+    }
+
+
+def npy_paths(path):
+    path = Path(path)
+    return path.with_suffix('.npy'), path.with_name(f'{path.stem}.npy.json')
+
+
+def transcode_tile(source, path, tile_format, quantize=False):
+    """Converts a downloaded tile (`source`) for storage as the tile at `path`.
+
+    `tiled` rewrites `source` in place as a 256x256 tiled, DEFLATE compressed GeoTIFF, and is the
+    format that saves disk space. `npy` writes a raw array that can be memory-mapped, with its
+    georeference in a JSON sidecar, next to `path`, and leaves `source` as it is: the GeoTIFF is
+    still read for shared memory and validation, so the tile takes about twice the disk space.
+    With `quantize` the elevations are stored as int16 decimeters (with a per-tile offset)
+    instead of float32, at the cost of up to 5 cm of rounding.
+    """
+    if tile_format not in TILE_FORMATS:
+        raise ValueError(f'Unknown DEM tile format {tile_format}, expected one of {TILE_FORMATS}')
+    source = Path(source)
+    if tile_format == 'tiled':
+        target = source.with_name(f'{source.name}.transcode')
+        try:
+            with rasterio.open(source) as dataset:
+                _write_tiled(dataset, target, quantize)
+            os.replace(target, source)
+        finally:
+            target.unlink(missing_ok=True)
+    elif tile_format == 'npy':
+        npy_path, meta_path = npy_paths(path)
+        target = npy_path.with_name(f'{npy_path.name}.part')
+        try:
+            with rasterio.open(source) as dataset:
+                meta = _write_npy(dataset, target, quantize)
+            os.replace(target, npy_path)
+        finally:
+            target.unlink(missing_ok=True)
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+
+class MappedRaster:
+    """Reads windows of a tile transcoded to `npy` from a read-only memory map.
+
+    Only the pages under the windows are read, and they are shared through the OS page cache by
+    every process sampling the same tile. Quantized values are scaled back to meters.
+    """
+
+    def __init__(self, npy_path, meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.array = np.load(npy_path, mmap_mode='r')
+        self.height, self.width = self.array.shape
+        self.transform = Affine(*meta['transform'])
+        self.nodata = meta.get('nodata')
+        self.scale = meta.get('scale', 1.0)
+        self.offset = meta.get('offset', 0.0)
+        self.closed = False
+
+    def read(self, indexes, window, masked=False):
+        if indexes != 1:
+            raise ValueError(f'Only band 1 can be read from a mapped tile, not {indexes}')
+        rows = slice(max(int(window.row_off), 0), max(min(int(window.row_off + window.height), self.height), 0))
+        cols = slice(max(int(window.col_off), 0), max(min(int(window.col_off + window.width), self.width), 0))
+        values, mask = self._scaled(np.array(self.array[rows, cols]))
+        if not masked:
+            return values
+        return np.ma.masked_array(values, mask=mask, fill_value=self.nodata)
+
+    def gather(self, rows, cols):
+        """Values and mask of the pixels at (rows, cols), which must lie within the raster."""
+        return self._scaled(self.array[rows, cols])
+
+    def _scaled(self, values):
+        if self.nodata is None:
+            mask = np.zeros(values.shape, dtype=bool)
+        elif np.isnan(self.nodata):
+            mask = np.isnan(values)
+        else:
+            mask = values == self.nodata
+        if self.scale != 1.0 or self.offset:
+            values = (values * self.scale + self.offset).astype('float32')
+        return values, mask
+
+    def close(self):
+        self.array = None
+        self.closed = True
+
+
+def open_dem(dem_file, max_blocks=64):
+    """Opens a cached tile for sampling, from its memory-mappable copy when there is one."""
+    npy_path, meta_path = npy_paths(dem_file)
+    if npy_path.exists() and meta_path.exists():
+        return MappedRaster(npy_path=npy_path, meta_path=meta_path)
+    return BlockCachedRaster(rasterio.open(dem_file), max_blocks=max_blocks)
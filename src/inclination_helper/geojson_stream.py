@@ -0,0 +1,135 @@
+import json
+
+_WHITESPACE = ' \t\n\r'
+
+
+class GeoJSONFeatureReader:
+    """Incrementally reads the features of a GeoJSON FeatureCollection.
+
+    The file is read in `buffer_size` chunks and each feature is decoded on its own, so memory
+    is bounded by the largest feature rather than by the file. Top-level members other than
+    `features` (e.g. `$schema`) are collected in `members` as they are encountered. `opener`
+    opens `path` for reading as text, e.g. to read an entry of an archive. `offset` is the number
+    of characters decoded so far.
+    """
+
+    def __init__(self, path, buffer_size=1024 * 1024, opener=open):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.opener = opener
+        self.members = {}
+        self._decoder = json.JSONDecoder()
+        self._file = None
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._read = 0
+
+    @property
+    def offset(self):
+        return self._read - len(self._buffer) + self._pos
+
+    def __iter__(self):
+        with self.opener(self.path, 'r') as self._file:
+            self._buffer, self._pos, self._eof, self._read = '', 0, False, 0
+            self._expect('{')
+            if self._peek() == '}':
+                return
+            while True:
+                key = self._decode()
+                self._expect(':')
+                if key == 'features':
+                    yield from self._iter_array()
+                else:
+                    self.members[key] = self._decode()
+                if self._expect(',}') == '}':
+                    return
+
+    def _iter_array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._decode()
+            if self._expect(',]') == ']':
+                return
+
+    def _fill(self):
+        if self._eof:
+            return False
+        if self._pos:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        # Read at least as much as is already buffered, so a feature larger than the buffer
+        # is decoded after a logarithmic number of attempts
+        chunk = self._file.read(max(self.buffer_size, len(self._buffer)))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer += chunk
+        self._read += len(chunk)
+        return True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError(f'Unexpected end of GeoJSON file {self.path}')
+
+    def _expect(self, characters):
+        character = self._peek()
+        if character not in characters:
+            raise ValueError(f'Expected one of {characters!r} but found {character!r} in {self.path}')
+        self._pos += 1
+        return character
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            if not self._fill():
+                if self._pos >= len(self._buffer):
+                    raise ValueError(f'Unexpected end of GeoJSON file {self.path}')
+
+
+def iter_features(path, buffer_size=1024 * 1024):
+    return iter(GeoJSONFeatureReader(path=path, buffer_size=buffer_size))
+
+
+class FeatureCollectionWriter:
+    """Writes a GeoJSON FeatureCollection to a text file object one feature at a time."""
+
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+        self.members = {}
+
+    def __enter__(self):
+        self.file.write('{"type": "FeatureCollection", "features": [')
+        return self
+
+    def write(self, feature):
+        if self.count:
+            self.file.write(', ')
+        json.dump(feature, self.file)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.write(']')
+        for key, value in self.members.items():
+            if key not in ('type', 'features'):
+                self.file.write(f', {json.dumps(key)}: {json.dumps(value)}')
+        self.file.write('}')
+        return False
@@ -1,21 +1,34 @@
+import io
 import os
 import gc
-import json
+import math
+import zipfile
+import itertools
+import multiprocessing
 from pathlib import Path
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 from src.logger import Logger
 from src.config import Settings
 from python_ms_core import Core
 from urllib.parse import urlparse
-from osw_incline import OSWIncline
-from shapely.geometry import shape
-from src.inclination_helper.dem_downloader import DEMDownloader
-from src.inclination_helper.utils import get_unique_id, unzip, create_zip
+from src.inclination_helper.coverage import feature_bounds, bucket_by_tile
+from src.inclination_helper.incline_calculator import InclineCalculator, incline_shard
+from src.inclination_helper.shared_tiles import SharedTileLease
+from src.inclination_helper.incline_cache import InclineCache, JobInclineCache
+from src.inclination_helper.checkpoint import JobCheckpoint
+from src.inclination_helper.deadline import Deadline, JobTimeoutError
+from src.models.queue_message_content import SamplingOptions
+from src.inclination_helper.geojson_stream import GeoJSONFeatureReader, FeatureCollectionWriter
+from src.inclination_helper.dem_downloader import DEMDownloader, load_ned_13_index
+from src.inclination_helper.utils import get_unique_id, unzip
 
 
 class Inclination:
     _config = Settings()
 
-    def __init__(self, file_path=None, storage_client=None, prefix=None):
+    def __init__(self, file_path=None, storage_client=None, prefix=None, sampling=None, deadline=None,
+                 prefetched_tiles=None):
         self.core = Core()
         if storage_client:
             self.storage_client = storage_client
@@ -27,59 +40,322 @@ class Inclination:
         is_exists = os.path.exists(self.download_dir)
         self.file_path = file_path
         self.prefix = get_unique_id() if not prefix else prefix
+        self.sampling = (sampling or SamplingOptions()).with_defaults(method=self._config.incline_sampling_method)
+        self.deadline = deadline or Deadline()
+        # Tiles the service already fetched and counted for the job, see `DEMDownloader.prefetch`
+        self.prefetched_tiles = list(prefetched_tiles or [])
         parsed_url = urlparse(self.file_path)
         file_name = parsed_url.path.split('/')[-1]
         self.updated_file_name = file_name
         self.root_path = os.path.join(os.getcwd(), 'src')
+        self._checkpoint = None
         if not is_exists:
             os.makedirs(self.download_dir)
 
-    def calculate(self):
-        Logger.info(f'Calculating inclination for file: {self.file_path}')
+    @property
+    def checkpoint(self) -> JobCheckpoint:
+        directory = Path(self.download_dir, self.prefix)
+        if self._checkpoint is None or self._checkpoint.directory != directory:
+            self._checkpoint = JobCheckpoint(directory=directory)
+        return self._checkpoint
+
+    def download(self) -> str:
+        """Downloads the dataset, unless an earlier attempt of the job already did."""
+        downloaded_file_path = self.checkpoint.done('downloaded')
+        if downloaded_file_path and os.path.exists(downloaded_file_path):
+            Logger.info(f'Resuming with the dataset already downloaded: {downloaded_file_path}')
+            return downloaded_file_path
         downloaded_file_path = self.download_file(file_path=self.file_path)
-        Logger.info(f'Unzipping file: {downloaded_file_path}')
-        unzip_files, all_files = unzip(
-            zip_file=downloaded_file_path,
-            output=os.path.join(self.download_dir, self.prefix)
+        self.checkpoint.complete('downloaded', downloaded_file_path)
+        return downloaded_file_path
+
+    def dem_downloader(self) -> DEMDownloader:
+        return create_dem_downloader(
+            config=self._config,
+            ned_13_index=load_ned_13_index(f'{self.root_path}/ned_13_index.json'),
+            workdir=self.download_dir,
+            deadline=self.deadline,
+            counted_tiles=self.prefetched_tiles
         )
-        with open(f'{self.root_path}/ned_13_index.json') as f:
-            ned_13_index = json.load(f)['tiles']
 
-        dem_downloader = DEMDownloader(ned_13_index=ned_13_index, workdir=self.download_dir)
-        graph_nodes_path = Path(unzip_files['nodes'])
+    def calculate(self, downloaded_file_path=None):
+        Logger.info(f'Calculating inclination for file: {self.file_path}')
+        checkpoint = self.checkpoint
+        # Under its own directory, so it keeps the name of the dataset without replacing the downloaded
+        # archive, which a redelivery of the job reads again
+        zip_file_path = os.path.join(self.download_dir, self.prefix, 'output', self.updated_file_name)
+        if checkpoint.done('zipped') and os.path.exists(zip_file_path):
+            Logger.info(f'Resuming with the output already built: {zip_file_path}')
+            return zip_file_path
+        if downloaded_file_path is None:
+            downloaded_file_path = self.download()
+        self.deadline.check('download')
+
+        unzipped = checkpoint.done('unzipped')
+        if unzipped and all(os.path.exists(file) for file in unzipped['all_files']):
+            unzip_files, all_files = unzipped['files'], unzipped['all_files']
+        else:
+            Logger.info(f'Unzipping file: {downloaded_file_path}')
+            unzip_files, all_files = unzip(
+                zip_file=downloaded_file_path,
+                output=os.path.join(self.download_dir, self.prefix)
+            )
+            checkpoint.complete('unzipped', {'files': unzip_files, 'all_files': all_files})
+        self.deadline.check('unzip')
+
+        dem_downloader = self.dem_downloader()
         graph_edges_path = Path(unzip_files['edges'])
+        graph_nodes_path = Path(unzip_files['nodes']) if 'nodes' in unzip_files else None
+        # Moved to its place only once complete
+        part_path = f'{zip_file_path}.part'
+        os.makedirs(os.path.dirname(zip_file_path), exist_ok=True)
 
-        with open(graph_edges_path, 'r') as edge_file:
-            EDGE_FILE = json.load(edge_file)
+        Logger.info('Calculating inclination for the edges')
+        try:
+            # The other files are copied as they are, the nodes are rewritten and the inclined edges
+            # are written batch by batch straight into their archive entries
+            with zipfile.ZipFile(part_path, 'w') as zip_file:
+                for file in all_files:
+                    if not os.path.isdir(file) and Path(file) not in (graph_edges_path, graph_nodes_path):
+                        zip_file.write(file, os.path.basename(file))
+                if graph_nodes_path is not None:
+                    entry = zip_file.open(graph_nodes_path.name, 'w', force_zip64=True)
+                    with io.TextIOWrapper(entry, encoding='utf-8') as output:
+                        self.rewrite_nodes(nodes_path=graph_nodes_path, output=output)
+                entry = zip_file.open(graph_edges_path.name, 'w', force_zip64=True)
+                with io.TextIOWrapper(entry, encoding='utf-8') as output:
+                    edge_count = self.incline_edges(
+                        edges_path=graph_edges_path,
+                        dem_downloader=dem_downloader,
+                        output=output,
+                        checkpoint=checkpoint
+                    )
+            os.replace(part_path, zip_file_path)
+            checkpoint.complete('zipped', zip_file_path)
+        finally:
+            dem_downloader.release_tiles()
+        Logger.info(f'No of edges processed: {edge_count}')
+        Logger.info(f'No of NED13 files used: {len(dem_downloader.ned_13_tiles)}')
 
-        Logger.info(f'No of edges: {len(EDGE_FILE["features"])} to be processed')
+        gc.collect()
+
+        return zip_file_path
 
-        Logger.info('Calculating NED13 files for the bounds')
-        bounds = []
-        for feature in EDGE_FILE['features']:
-            bounds.append(shape(feature['geometry']).bounds)
+    @staticmethod
+    def rewrite_nodes(nodes_path: Path, output) -> int:
+        """Streams the nodes from `nodes_path` to `output` the way `OSWIncline` wrote them back.
 
-        dem_downloader.get_ned13_for_bounds(total_bounds=bounds)
+        `osm_id`, `lon` and `lat` are removed and `_id` is written as a string. Point features
+        (`is_point`) are left out, osw_incline only writes them to a points file.
+        """
+        reader = GeoJSONFeatureReader(path=nodes_path)
+        with FeatureCollectionWriter(output) as writer:
+            writer.members = reader.members
+            for feature in reader:
+                properties = feature.get('properties')
+                if properties is None:
+                    properties = feature['properties'] = {}
+                if 'is_point' in properties:
+                    continue
+                for key in ('osm_id', 'lon', 'lat'):
+                    properties.pop(key, None)
+                if '_id' in properties:
+                    properties['_id'] = str(properties['_id'])
+                writer.write(feature)
+        return writer.count
 
-        tile_sets = dem_downloader.list_ned13s_full_paths()
-        Logger.info(f'No of NED13 files: {len(tile_sets)} to be processed')
-        dem_processor = OSWIncline(
-            dem_files=tile_sets,
-            nodes_file=str(graph_nodes_path),
-            edges_file=str(graph_edges_path),
-            debug=True
-        )
-        result = dem_processor.calculate()
-        Logger.info(f"Inclination calculation result: {'Completed' if result else 'Failed'}")
-        Logger.info(f'Creating zip file for all files')
-        zip_file_path = create_zip(
-            files=all_files,
-            zip_file_path=os.path.join(self.download_dir, f'{self.prefix}/{self.updated_file_name}')
+    def incline_edges(self, edges_path: Path, dem_downloader: DEMDownloader, output, batch_size=None,
+                      workers=None, checkpoint: JobCheckpoint = None) -> int:
+        """Streams the edges from `edges_path` to `output` in batches of `batch_size` edges.
+
+        For each batch the covering tiles are resolved (and fetched if needed), the inclines are
+        calculated and the batch is written out, so memory is bounded by the batch size and not
+        by the size of the dataset. With more than one worker, the inclines of each batch are
+        computed in a process pool. With DEM_SHARED_MEMORY, the tiles are decoded once into shared
+        memory and read from there by this job, the pool workers and any concurrent job. With
+        INCLINE_CACHE, edges already computed by an earlier job are taken from the incline cache.
+        With a `checkpoint`, every computed batch is saved and the batches saved by an earlier
+        attempt of the job are written out as they are. The deadline of the job is checked before
+        every batch, a job cancelled on expiry resumes from its saved batches.
+        """
+        batch_size = max(1, batch_size or self._config.incline_batch_size)
+        workers = self._config.incline_workers if workers is None else workers
+        reader = GeoJSONFeatureReader(path=edges_path)
+        features = iter(reader)
+        shared_tiles = SharedTileLease() if self._config.dem.shared_memory else None
+        calculator = InclineCalculator(max_blocks=self._config.dem.block_cache_blocks, shared_tiles=shared_tiles,
+                                       **self.sampling.to_dict())
+        if checkpoint is not None:
+            checkpoint.start_chunks({'edges': edges_path.name, 'batch_size': batch_size,
+                                     'options': calculator.options})
+        dem_dir = dem_downloader.get_dem_dir()
+        cache = None
+        if self._config.incline_cache:
+            # Next to the tiles, the cached inclines are only valid for these tiles
+            cache = JobInclineCache(
+                cache=InclineCache.for_path(Path(dem_dir, 'inclines.sqlite3'),
+                                            max_bytes=self._config.incline_cache_max_bytes),
+                options=calculator.options
+            )
+        pool = None
+        if workers > 1:
+            # Spawned rather than forked, the job runs on a thread of the queue listener
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        resumed = 0
+        try:
+            with FeatureCollectionWriter(output) as writer:
+                writer.members = reader.members
+                for index in itertools.count():
+                    self.deadline.check('edges')
+                    batch = list(islice(features, batch_size))
+                    if not batch:
+                        break
+                    saved = checkpoint.load_chunk(index) if checkpoint is not None else None
+                    if saved is not None:
+                        batch = saved
+                        resumed += 1
+                    elif pool is None:
+                        self._incline_batch(batch=batch, dem_downloader=dem_downloader, calculator=calculator,
+                                            dem_dir=dem_dir, cache=cache)
+                    else:
+                        self._incline_batch_parallel(batch=batch, dem_downloader=dem_downloader, pool=pool,
+                                                     workers=workers, dem_dir=dem_dir,
+                                                     calculator_options=calculator.options, shared_tiles=shared_tiles,
+                                                     cache=cache, deadline=self.deadline)
+                    if checkpoint is not None and saved is None:
+                        checkpoint.save_chunk(index, batch)
+                    for feature in batch:
+                        writer.write(feature)
+                    del batch
+        finally:
+            calculator.close()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if shared_tiles is not None:
+                shared_tiles.release()
+            if cache is not None:
+                Logger.info(f'Incline cache: {cache.hits} of {cache.lookups} edges reused ({cache.hit_rate:.1%})')
+                cache.cache.evict()
+        if resumed:
+            Logger.info(f'Resumed {resumed} batches of edges computed by an earlier attempt')
+        return writer.count
+
+    @staticmethod
+    def _reuse_cached(batch, buckets, shared, dem_file, cache):
+        # Sets the cached inclines and returns what is left to compute, with the keys to cache it under
+        if cache is None:
+            return buckets, shared, {}
+        indices = [index for tile_indices in buckets.values() for index in tile_indices]
+        indices += [index for index, _ in shared]
+        dem_files = {index: [dem_file(tile)] for tile, tile_indices in buckets.items() for index in tile_indices}
+        dem_files.update((index, [dem_file(tile) for tile in covering]) for index, covering in shared)
+        found, pending = cache.lookup(geometries=[batch[index].get('geometry') for index in indices],
+                                      dem_files=[dem_files[index] for index in indices])
+        for position, incline in found.items():
+            InclineCalculator.update_feature(feature=batch[indices[position]], incline=incline)
+        pending = {indices[position]: key for position, key in pending.items()}
+        buckets = {tile: [index for index in tile_indices if index in pending]
+                   for tile, tile_indices in buckets.items()}
+        buckets = {tile: tile_indices for tile, tile_indices in buckets.items() if tile_indices}
+        shared = [(index, covering) for index, covering in shared if index in pending]
+        return buckets, shared, pending
+
+    @staticmethod
+    def _incline_batch(batch, dem_downloader, calculator, dem_dir, cache=None):
+        bounds = feature_bounds(feature.get('geometry') for feature in batch)
+        available_tiles = set(dem_downloader.get_ned13_for_bounds(total_bounds=bounds))
+        buckets, shared = bucket_by_tile(bounds=bounds, tiles=available_tiles)
+
+        def dem_file(tile):
+            return str(Path(dem_dir, f'{tile}.tif'))
+
+        buckets, shared, pending = Inclination._reuse_cached(batch=batch, buckets=buckets, shared=shared,
+                                                             dem_file=dem_file, cache=cache)
+        computed = {}
+
+        def apply(indices, dem_files):
+            inclines = calculator.inclines(geometries=[batch[index].get('geometry') for index in indices],
+                                           dem_files=dem_files)
+            for index, incline in zip(indices, inclines):
+                InclineCalculator.update_feature(feature=batch[index], incline=incline)
+                if index in pending:
+                    computed[pending[index]] = incline
+
+        # Edges owned by one tile are processed tile by tile and each raster is released once its
+        # bucket is done. The tile still open from the previous batch goes first and the last one
+        # is kept open for the next batch, so a tile spanning several batches is opened only once.
+        open_files = calculator.open_files
+        tiles = sorted(buckets, key=lambda tile: (dem_file(tile) not in open_files, tile))
+        for position, tile in enumerate(tiles):
+            apply(indices=buckets[tile], dem_files=[dem_file(tile)])
+            if position < len(tiles) - 1:
+                calculator.release(dem_file(tile))
+
+        # Edges crossing tile boundaries need every tile they touch, they are grouped by those tiles
+        groups = {}
+        for index, covering in shared:
+            groups.setdefault(tuple(covering), []).append(index)
+        for covering, indices in groups.items():
+            apply(indices=indices, dem_files=[dem_file(tile) for tile in covering])
+        calculator.close(keep=dem_file(tiles[-1]) if tiles else None)
+        if cache is not None:
+            cache.store(computed)
+
+    @staticmethod
+    def _incline_batch_parallel(batch, dem_downloader, pool, workers, dem_dir, calculator_options, shared_tiles=None,
+                                cache=None, deadline=None):
+        bounds = feature_bounds(feature.get('geometry') for feature in batch)
+        available_tiles = set(dem_downloader.get_ned13_for_bounds(total_bounds=bounds))
+        buckets, shared = bucket_by_tile(bounds=bounds, tiles=available_tiles)
+        buckets, shared, pending = Inclination._reuse_cached(
+            batch=batch, buckets=buckets, shared=shared, dem_file=lambda tile: str(Path(dem_dir, f'{tile}.tif')),
+            cache=cache
         )
 
-        gc.collect()
+        # Shards are cut from the tile buckets, so a worker reads from a single raster, and are
+        # sized so that even a batch covered by one tile is spread over all the workers
+        remaining = sum(len(indices) for indices in buckets.values()) + len(shared)
+        shard_size = max(1, math.ceil(remaining / workers))
+        shards = []
+        for tile in sorted(buckets):
+            indices = buckets[tile]
+            dem_files = [str(Path(dem_dir, f'{tile}.tif'))]
+            for start in range(0, len(indices), shard_size):
+                shard = indices[start:start + shard_size]
+                shards.append((shard, [dem_files] * len(shard)))
+        for start in range(0, len(shared), shard_size):
+            shard = shared[start:start + shard_size]
+            shards.append((
+                [index for index, _ in shard],
+                [[str(Path(dem_dir, f'{tile}.tif')) for tile in covering] for _, covering in shard]
+            ))
 
-        return zip_file_path
+        def shard_tiles(dem_files):
+            # Workers get the descriptors of the shared tiles of their shard, not the lease
+            if shared_tiles is None:
+                return None
+            files = {dem_file for edge_dem_files in dem_files for dem_file in edge_dem_files}
+            return {dem_file: shared_tiles.get(dem_file) for dem_file in files if shared_tiles.get(dem_file)}
+
+        futures = [
+            pool.submit(incline_shard, [batch[index].get('geometry') for index in indices], dem_files,
+                        shard_tiles(dem_files), **calculator_options)
+            for indices, dem_files in shards
+        ]
+        deadline = deadline or Deadline()
+        computed = {}
+        for (indices, _), future in zip(shards, futures):
+            try:
+                inclines = future.result(timeout=deadline.remaining())
+            except FutureTimeoutError:
+                # The shards still queued are cancelled when the pool is shut down
+                raise JobTimeoutError(seconds=deadline.seconds, stage='edges') from None
+            for index, incline in zip(indices, inclines):
+                InclineCalculator.update_feature(feature=batch[index], incline=incline)
+                if index in pending:
+                    computed[pending[index]] = incline
+        if cache is not None:
+            cache.store(computed)
 
     def download_file(self, file_path: str) -> str:
         Logger.info(f'Downloading file from: {file_path}')
@@ -100,3 +376,28 @@ class Inclination:
         except Exception as err:
             Logger.error(f'Error while downloading file: {err}')
             raise err
+
+
+def create_dem_downloader(config, ned_13_index, workdir, deadline=None, counted_tiles=()) -> DEMDownloader:
+    """A DEM downloader for `workdir` with the DEM settings of `config`."""
+    return DEMDownloader(
+        ned_13_index=ned_13_index,
+        workdir=workdir,
+        cache_max_bytes=config.dem.cache_max_bytes,
+        chunk_size=config.dem.download_chunk_size,
+        max_workers=config.dem.download_max_workers,
+        retries=config.dem.download_retries,
+        timeout=config.dem.download_timeout,
+        tile_format=config.dem.tile_format,
+        quantize=config.dem.tile_quantize,
+        deadline=deadline,
+        counted_tiles=counted_tiles
+    )
+
+
+def calculate_inclination(file_path, prefix, sampling=None, downloaded_file_path=None, deadline=None,
+                          prefetched_tiles=None):
+    """Job worker entry point: calculates the inclination of a dataset in the worker process."""
+    inclination = Inclination(file_path=file_path, prefix=prefix, sampling=sampling, deadline=deadline,
+                              prefetched_tiles=prefetched_tiles)
+    return inclination.calculate(downloaded_file_path=downloaded_file_path)
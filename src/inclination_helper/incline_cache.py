@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from src.logger import Logger
+from src.inclination_helper.dem_transcoder import npy_paths
+from src.inclination_helper.sampling import SAMPLER_VERSION
+from src.inclination_helper.sqlite_store import SQLiteStore
+
+# Calculator options that change how tiles are read, not the inclines
+_IGNORED_OPTIONS = ('max_blocks',)
+# Share of the entries removed at once when the cache is over budget, so that eviction does
+# not run after every job
+_EVICTION_SLACK = 0.1
+
+
+def tile_version(dem_file):
+    """What identifies the content of a cached tile: its ETag, size and modification times.
+
+    The tile and its memory-mappable copy are rewritten whenever the tile is downloaded or
+    transcoded again, which changes the version even if the server sent no ETag.
+    """
+    path = Path(dem_file)
+    version = {'tile': path.stem}
+    try:
+        with open(path.with_name(f'{path.name}.json')) as f:
+            version['etag'] = json.load(f).get('etag')
+    except (OSError, ValueError):
+        pass
+    for name, file in (('tif', path), ('npy', npy_paths(path)[0])):
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        version[name] = [stat.st_size, stat.st_mtime_ns]
+    return version
+
+
+class InclineCache(SQLiteStore):
+    """Persistent, size-bounded cache of edge inclines in a SQLite database.
+
+    Entries are content addressed (see `JobInclineCache`), so the same edge in a later
+    submission of a dataset is found again as long as its tiles and the sampling options did
+    not change. One instance is shared per database across the whole process (see `for_path`).
+    Once the database is over `max_bytes`, the least recently used entries are removed.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        super().__init__(path=path)
+
+    def _setup(self, connection):
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS inclines (key BLOB PRIMARY KEY, incline REAL, used REAL NOT NULL) '
+            'WITHOUT ROWID'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS inclines_used ON inclines (used)')
+
+    @classmethod
+    def _after_fork(cls):
+        cls._instances_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path, max_bytes=0):
+        key = str(Path(path).resolve())
+        with cls._instances_lock:
+            cache = cls._instances.get(key)
+            if cache is None:
+                cache = cls(path=path, max_bytes=max_bytes)
+                cls._instances[key] = cache
+            return cache
+
+    def get_many(self, keys):
+        """The cached inclines of `keys`, a dict without the keys that are not cached."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            # Chunked to stay under SQLite's limit of host parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ','.join('?' * len(chunk))
+                found.update(self._connection.execute(
+                    f'SELECT key, incline FROM inclines WHERE key IN ({marks})', chunk
+                ).fetchall())
+                self._connection.execute(f'UPDATE inclines SET used = ? WHERE key IN ({marks})', [now, *chunk])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO inclines (key, incline, used) VALUES (?, ?, ?)',
+                    [(key, incline, now) for key, incline in items.items()]
+                )
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def size(self):
+        # Pages in use, freed pages are reused by later inserts
+        with self._lock:
+            return self._size()
+
+    def _size(self):
+        page_size = self._connection.execute('PRAGMA page_size').fetchone()[0]
+        page_count = self._connection.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = self._connection.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        if not self.max_bytes or self.max_bytes <= 0:
+            return 0
+        with self._lock:
+            size = self._size()
+            if size <= self.max_bytes:
+                return 0
+            count = self._connection.execute('SELECT COUNT(*) FROM inclines').fetchone()[0]
+            share = 1 - self.max_bytes * (1 - _EVICTION_SLACK) / size
+            removed = self._connection.execute(
+                'DELETE FROM inclines WHERE key IN (SELECT key FROM inclines ORDER BY used LIMIT ?)',
+                (max(1, int(count * share)),)
+            ).rowcount
+            self.evictions += removed
+        Logger.info(f'Evicted {removed} cached inclines from {self.path}')
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bytes': self._size(),
+                'max_bytes': self.max_bytes
+            }
+
+
+
+os.register_at_fork(after_in_child=InclineCache._after_fork)
+
+
+class JobInclineCache:
+    """The incline cache as used by one job, with its own hit counters.
+
+    An edge is keyed by a hash of its geometry, the versions of the tiles it is computed from
+    (see `tile_version`), the options of the calculator of the job and the `SAMPLER_VERSION`.
+    """
+
+    def __init__(self, cache, options, sampler_version=SAMPLER_VERSION):
+        self.cache = cache
+        options = {name: value for name, value in options.items() if name not in _IGNORED_OPTIONS}
+        self._options = json.dumps({'sampler': sampler_version, **options}, sort_keys=True)
+        self.hits = 0
+        self.lookups = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def key(self, geometry, versions):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self._options.encode())
+        digest.update(json.dumps(versions, sort_keys=True).encode())
+        digest.update(json.dumps(geometry, sort_keys=True, separators=(',', ':')).encode())
+        return digest.digest()
+
+    def lookup(self, geometries, dem_files):
+        """Cached inclines of the edges, by position, and the keys of the ones that are not cached.
+
+        `dem_files` are the tiles of every edge, as a list for each edge.
+        """
+        versions = {}
+        keys = []
+        for geometry, edge_dem_files in zip(geometries, dem_files):
+            for dem_file in edge_dem_files:
+                if dem_file not in versions:
+                    versions[dem_file] = tile_version(dem_file)
+            keys.append(self.key(geometry, [versions[dem_file] for dem_file in edge_dem_files]))
+        cached = self.cache.get_many(keys)
+        found = {index: cached[key] for index, key in enumerate(keys) if key in cached}
+        pending = {index: key for index, key in enumerate(keys) if key not in cached}
+        self.hits += len(found)
+        self.lookups += len(keys)
+        return found, pending
+
+    def store(self, inclines):
+        """Caches the computed `inclines`, by key."""
+        if inclines:
+            self.cache.put_many(inclines)
@@ -0,0 +1,166 @@
+import numpy as np
+from src.inclination_helper.dem_transcoder import open_dem
+from src.inclination_helper.shared_tiles import SharedRaster
+from src.inclination_helper.sampling import edge_points, edge_inclines, projected_lengths, SAMPLING_METHODS, \
+    DEFAULT_INTERVAL, adaptive_intervals, densify, path_lengths, profile_inclines, sample_elevations
+
+
+class InclineCalculator:
+    """Adds `incline` to edge features with the vectorized sampling engine (see `sampling`).
+
+    Follows the same rules as `OSWIncline.calculate()`: the DEM tiles are tried in order and the
+    last one that yields an incline within [-1, 1] wins. With the default `idw` method the
+    values are the ones osw_incline computes. Tiles are opened on first use and kept open until
+    `close()`, and are read through a cache of at most `max_blocks` blocks each (or
+    memory-mapped when they were transcoded to `npy`). Tiles found in `shared_tiles` (a
+    `SharedTileLease` or a dict of `SharedTile`) are read from shared memory instead.
+
+    With an `interval` (in meters) or in `adaptive` mode, edges are instead sampled along their
+    length (at most `max_vertices` samples each) and the incline is the least-squares slope of
+    the elevation profile, see `sampling.densify` and `sampling.profile_inclines`.
+    """
+
+    def __init__(self, precision=3, max_blocks=64, shared_tiles=None, method='idw', interval=None,
+                 max_vertices=None, adaptive=False):
+        if method not in SAMPLING_METHODS:
+            raise ValueError(f'Unknown sampling method {method}, expected one of {SAMPLING_METHODS}')
+        self.precision = precision
+        self.max_blocks = max_blocks
+        self.shared_tiles = shared_tiles
+        self.method = method
+        self.interval = interval
+        self.max_vertices = max_vertices
+        self.adaptive = adaptive
+        self._datasets = {}
+
+    @property
+    def options(self):
+        """Keyword arguments to create a calculator computing the same values, e.g. in a worker."""
+        return {
+            'precision': self.precision,
+            'max_blocks': self.max_blocks,
+            'method': self.method,
+            'interval': self.interval,
+            'max_vertices': self.max_vertices,
+            'adaptive': self.adaptive
+        }
+
+    def _dataset(self, dem_file):
+        dataset = self._datasets.get(dem_file)
+        if dataset is None:
+            tile = self.shared_tiles.get(dem_file) if self.shared_tiles is not None else None
+            if tile is not None:
+                dataset = SharedRaster(tile)
+            else:
+                dataset = open_dem(dem_file, max_blocks=self.max_blocks)
+            self._datasets[dem_file] = dataset
+        return dataset
+
+    def inclines(self, geometries, dem_files):
+        """Inclines of all `geometries` against the same `dem_files`, None where there is none."""
+        points, offsets = edge_points(geometries)
+        result = self._end_inclines(points, offsets, dem_files)
+        if self.interval or self.adaptive:
+            result = self._profile_inclines(points, offsets, dem_files, end_inclines=result)
+        return [None if np.isnan(incline) else incline for incline in result.tolist()]
+
+    def _end_inclines(self, points, offsets, dem_files):
+        result = np.full(len(offsets) - 1, np.nan)
+        has_points = np.diff(offsets) > 0
+        if has_points.any():
+            # Lengths do not depend on the tile, project the end points once for all tiles
+            lengths = np.zeros(len(result))
+            lengths[has_points] = projected_lengths(points[offsets[:-1][has_points]],
+                                                    points[offsets[1:][has_points] - 1])
+            for dem_file in dem_files:
+                inclines = edge_inclines(self._dataset(dem_file), points=points, offsets=offsets,
+                                         lengths=lengths, method=self.method, precision=self.precision)
+                with np.errstate(invalid='ignore'):
+                    in_range = (inclines >= -1) & (inclines <= 1)
+                result[in_range] = inclines[in_range]
+        return result
+
+    def _profile_inclines(self, points, offsets, dem_files, end_inclines):
+        interval = self.interval or DEFAULT_INTERVAL
+        if self.adaptive:
+            has_points = np.diff(offsets) > 0
+            chord_lengths = np.zeros(len(end_inclines))
+            chord_lengths[has_points] = projected_lengths(points[offsets[:-1][has_points]],
+                                                          points[offsets[1:][has_points] - 1])
+            interval = adaptive_intervals(interval, path_lengths(points, offsets), chord_lengths, end_inclines)
+        samples, sample_offsets, distances = densify(points, offsets, intervals=interval,
+                                                     max_vertices=self.max_vertices)
+        # Samples take their elevation from the last tile that has one, so edges crossing tile
+        # boundaries get a full profile
+        elevations = np.full(len(samples), np.nan)
+        for dem_file in dem_files:
+            sampled = sample_elevations(self._dataset(dem_file), samples, method=self.method)
+            found = ~np.isnan(sampled)
+            elevations[found] = sampled[found]
+        inclines = profile_inclines(elevations, distances, sample_offsets, precision=self.precision)
+        with np.errstate(invalid='ignore'):
+            return np.where((inclines >= -1) & (inclines <= 1), inclines, np.nan)
+
+    def incline(self, geometry, dem_files):
+        return self.inclines(geometries=[geometry], dem_files=dem_files)[0]
+
+    def apply(self, feature, dem_files):
+        incline = self.incline(geometry=feature.get('geometry'), dem_files=dem_files)
+        return self.update_feature(feature=feature, incline=incline)
+
+    def apply_many(self, features, dem_files):
+        inclines = self.inclines(geometries=[feature.get('geometry') for feature in features], dem_files=dem_files)
+        for feature, incline in zip(features, inclines):
+            self.update_feature(feature=feature, incline=incline)
+        return features
+
+    @staticmethod
+    def update_feature(feature, incline):
+        properties = feature.get('properties')
+        if properties is None:
+            properties = feature['properties'] = {}
+        if incline is not None:
+            properties['incline'] = incline
+        # Same property clean up as osw_incline's OSMGraph.to_geojson
+        properties.pop('osm_id', None)
+        properties.pop('segment', None)
+        for key in ('_u_id', '_v_id'):
+            if key in properties:
+                properties[key] = str(properties[key])
+        return feature
+
+    @property
+    def open_files(self):
+        return set(self._datasets)
+
+    def release(self, dem_file):
+        dataset = self._datasets.pop(dem_file, None)
+        if dataset is not None:
+            dataset.close()
+
+    def close(self, keep=None):
+        for dem_file in list(self._datasets):
+            if dem_file != keep:
+                self.release(dem_file)
+
+
+def incline_shard(geometries, dem_files, shared_tiles=None, **options):
+    """Process pool entry point: the inclines of a shard of edges, in the order given.
+
+    `options` are the `InclineCalculator.options` of the calculator of the job.
+    """
+    calculator = InclineCalculator(shared_tiles=shared_tiles, **options)
+    # Edges with the same tiles are computed together
+    groups = {}
+    for index, edge_dem_files in enumerate(dem_files):
+        groups.setdefault(tuple(edge_dem_files), []).append(index)
+    result = [None] * len(geometries)
+    try:
+        for group_dem_files, indices in groups.items():
+            inclines = calculator.inclines(geometries=[geometries[index] for index in indices],
+                                           dem_files=list(group_dem_files))
+            for index, incline in zip(indices, inclines):
+                result[index] = incline
+        return result
+    finally:
+        calculator.close()
@@ -0,0 +1,279 @@
+import pyproj
+import numpy as np
+
+# Same projection as osw_incline's DEMProcessor, so lengths (and inclines) are unchanged
+_TRANSFORMER = pyproj.Transformer.from_crs(pyproj.CRS('EPSG:4326'), pyproj.CRS('EPSG:32610'), always_xy=True)
+_IDW_DIM = 3
+SAMPLING_METHODS = ('idw', 'bilinear')
+# Version of the sampling engine, to be bumped with any change to the inclines it computes. Part
+# of the keys of the reused results and inclines, and of the response messages
+SAMPLER_VERSION = '1'
+# Spacing of the samples along edges in adaptive mode when no interval is given, in meters
+DEFAULT_INTERVAL = 10.0
+
+
+def edge_points(geometries):
+    """Vertices of LineString geometries as one (M, 2) array, plus (N + 1) offsets into it.
+
+    The points of edge `i` are `points[offsets[i]:offsets[i + 1]]`. Other geometries, and lines
+    with fewer than two vertices, get no points and therefore no incline.
+    """
+    points = []
+    counts = []
+    for geometry in geometries:
+        coordinates = geometry.get('coordinates') if geometry and geometry.get('type') == 'LineString' else None
+        if not coordinates or len(coordinates) < 2:
+            counts.append(0)
+            continue
+        points.extend(coordinate[:2] for coordinate in coordinates)
+        counts.append(len(coordinates))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return np.asarray(points, dtype=float).reshape(-1, 2), offsets
+
+
+def projected_lengths(starts, ends):
+    """Length in meters between start and end points, as osw_incline measures edges."""
+    start_x, start_y = _TRANSFORMER.transform(starts[:, 0], starts[:, 1])
+    end_x, end_y = _TRANSFORMER.transform(ends[:, 0], ends[:, 1])
+    dx = np.asarray(end_x) - np.asarray(start_x)
+    dy = np.asarray(end_y) - np.asarray(start_y)
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def _project(points):
+    x, y = _TRANSFORMER.transform(points[:, 0], points[:, 1])
+    return np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)]).reshape(-1, 2)
+
+
+def adaptive_intervals(interval, path_lengths, chord_lengths, end_inclines):
+    """Per-edge sampling intervals: 4x `interval` for straight, flat edges, down to `interval / 4`.
+
+    The density grows with the sinuosity of the edge (path over chord length) and with the
+    steepness of its end to end incline (a 15% grade samples at `interval`).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sinuosity = np.where(chord_lengths > 0, path_lengths / chord_lengths, 1.0)
+    steepness = 1 + 20 * np.abs(np.nan_to_num(end_inclines))
+    return interval * 4 / np.clip(sinuosity * steepness, 1, 16)
+
+
+def _path_distances(points, offsets):
+    # Distance of every point along the projected polyline, cumulated over all edges, and the
+    # path length of every edge
+    counts = np.diff(offsets)
+    projected = _project(points)
+    segments = np.hypot(*(projected[1:] - projected[:-1]).T) if len(points) > 1 else np.zeros(0)
+    # Segments joining the last point of an edge to the first one of the next are not part of any edge
+    boundaries = (offsets[1:-1] - 1)[counts[:-1] > 0]
+    segments[boundaries[boundaries < len(segments)]] = 0
+    cumulative = np.concatenate([[0.0], np.cumsum(segments)])
+    has_points = counts > 0
+    lengths = np.zeros(len(counts))
+    lengths[has_points] = cumulative[offsets[1:][has_points] - 1] - cumulative[offsets[:-1][has_points]]
+    return cumulative, lengths
+
+
+def path_lengths(points, offsets):
+    """Length in meters of each edge along all its vertices, 0 for edges without points."""
+    return _path_distances(points, offsets)[1]
+
+
+def densify(points, offsets, intervals, max_vertices=None):
+    """Samples evenly spaced every `intervals` meters along each edge, both end points included.
+
+    Returns `(samples, sample_offsets, distances)`: sample points as a (K, 2) array, (N + 1)
+    offsets into it like `edge_points`, and the distance of every sample from the start of its
+    edge along the projected path. Each edge with points gets at least 2 and at most
+    `max_vertices` samples.
+    """
+    counts = np.diff(offsets)
+    edge_count = len(counts)
+    has_points = counts > 0
+    first = offsets[:-1]
+    last = offsets[1:] - 1
+    cumulative, lengths = _path_distances(points, offsets)
+    intervals = np.broadcast_to(np.asarray(intervals, dtype=float), (edge_count,))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sample_counts = np.ceil(lengths / intervals) + 1
+    sample_counts = np.clip(np.nan_to_num(sample_counts, nan=2, posinf=2), 2, max_vertices or np.inf).astype(np.int64)
+    sample_counts[~has_points] = 0
+
+    sample_offsets = np.zeros(edge_count + 1, dtype=np.int64)
+    np.cumsum(sample_counts, out=sample_offsets[1:])
+    edges = np.repeat(np.arange(edge_count), sample_counts)
+    steps = np.arange(sample_offsets[-1]) - sample_offsets[edges]
+    distances = lengths[edges] * steps / np.maximum(sample_counts[edges] - 1, 1)
+
+    # Locate every sample on its segment and interpolate its coordinates
+    targets = cumulative[first[edges]] + distances
+    segment = np.searchsorted(cumulative, targets, side='right') - 1
+    segment = np.clip(segment, first[edges], np.maximum(last[edges] - 1, first[edges]))
+    following = np.minimum(segment + 1, last[edges])
+    segment_lengths = cumulative[following] - cumulative[segment]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fractions = np.clip(np.where(segment_lengths > 0, (targets - cumulative[segment]) / segment_lengths, 0.0),
+                            0, 1)
+    samples = points[segment] + (points[following] - points[segment]) * fractions[:, None]
+    return samples, sample_offsets, distances
+
+
+def profile_inclines(elevations, distances, sample_offsets, precision=3):
+    """Least-squares slope of elevation over distance along each edge, NaN samples ignored.
+
+    Edges with fewer than two valid samples, or whose valid samples are all at the same
+    distance, get NaN.
+    """
+    counts = np.diff(sample_offsets)
+    inclines = np.full(len(counts), np.nan)
+    has_samples = counts > 0
+    if not has_samples.any():
+        return inclines
+    valid = ~np.isnan(elevations)
+    weights = valid.astype(float)
+    z = np.where(valid, elevations, 0.0)
+    d = np.where(valid, distances, 0.0)
+    starts = sample_offsets[:-1][has_samples]
+    n = np.add.reduceat(weights, starts)
+    sum_d = np.add.reduceat(d, starts)
+    sum_z = np.add.reduceat(z, starts)
+    sum_dd = np.add.reduceat(d * d, starts)
+    sum_dz = np.add.reduceat(d * z, starts)
+    denominator = n * sum_dd - sum_d * sum_d
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = np.where((n >= 2) & (denominator > 1e-9 * np.maximum(sum_dd, 1) * n),
+                          (n * sum_dz - sum_d * sum_z) / denominator, np.nan)
+    inclines[has_samples] = np.round(slopes, precision)
+    return inclines
+
+
+def pixel_coordinates(transform, x, y):
+    inverse = ~transform
+    return x * inverse.a + y * inverse.b + inverse.c, x * inverse.d + y * inverse.e + inverse.f
+
+
+def _gather(raster, rows, cols, valid):
+    rows, cols = np.broadcast_arrays(rows, cols)
+    values = np.zeros(rows.shape, dtype=float)
+    mask = np.ones(rows.shape, dtype=bool)
+    if valid.any():
+        valid_values, valid_mask = raster.gather(rows[valid], cols[valid])
+        values[valid] = valid_values
+        mask[valid] = valid_mask
+    return values, mask
+
+
+def _ordered_sum(values, counts):
+    # numpy sums up to 7 values one after the other and 8 or more pairwise in 8 lanes. Summing
+    # the same way keeps the result bit for bit equal to osw_incline's per-point sums.
+    sequential = values[:, 0].copy()
+    for column in range(1, values.shape[1]):
+        sequential += values[:, column]
+    lanes = values[:, :8]
+    pairwise = ((lanes[:, 0] + lanes[:, 1]) + (lanes[:, 2] + lanes[:, 3])) + \
+        ((lanes[:, 4] + lanes[:, 5]) + (lanes[:, 6] + lanes[:, 7]))
+    for column in range(8, values.shape[1]):
+        pairwise += values[:, column]
+    return np.where(counts >= 8, pairwise, sequential)
+
+
+def sample_idw(raster, x, y):
+    """Vectorized `DEMProcessor.idw` over a 3x3 window: elevations at (x, y), NaN where None."""
+    col, row = pixel_coordinates(raster.transform, x, y)
+    with np.errstate(invalid='ignore'):
+        offset_x = np.floor(col) - _IDW_DIM // 2
+        offset_y = np.floor(row) - _IDW_DIM // 2
+        # Windows clipped by the raster edge are not 3x3, which osw_incline treats as no value
+        valid = (offset_x >= 0) & (offset_y >= 0) & \
+            (offset_x + _IDW_DIM <= raster.width) & (offset_y + _IDW_DIM <= raster.height)
+    offset_x = np.where(valid, offset_x, 0).astype(np.int64)
+    offset_y = np.where(valid, offset_y, 0).astype(np.int64)
+    dx = col - offset_x
+    dy = row - offset_y
+
+    steps = np.arange(_IDW_DIM)
+    rows = offset_y[:, None, None] + steps[None, :, None]
+    cols = offset_x[:, None, None] + steps[None, None, :]
+    values, mask = _gather(raster, rows, cols, valid)
+    values = values.reshape(len(x), -1)
+    mask = mask.reshape(len(x), -1)
+    valid &= ~(mask.sum(axis=1) / mask.shape[1] >= 0.75)
+
+    xs = steps[None, :] - dx[:, None]
+    ys = steps[None, :] - dy[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = np.sqrt((ys ** 2)[:, :, None] * (xs ** 2)[:, None, :]).reshape(len(x), -1)
+        # Unmasked cells first, in window order, as in `distances[~mask]`
+        order = np.argsort(mask, axis=1, kind='stable')
+        kept = ~np.take_along_axis(mask, order, axis=1)
+        counts = kept.sum(axis=1)
+        inverse_distances = np.where(kept, 1 / np.take_along_axis(distances, order, axis=1), 0.0)
+        weights = inverse_distances / _ordered_sum(inverse_distances, counts)[:, None]
+        weighted = np.where(kept, np.take_along_axis(values, order, axis=1) * weights, 0.0)
+        elevations = _ordered_sum(weighted, counts)
+    return np.where(valid, elevations, np.nan)
+
+
+def sample_bilinear(raster, x, y):
+    """Bilinear elevations between the four pixel centres around (x, y), NaN where any is masked."""
+    col, row = pixel_coordinates(raster.transform, x, y)
+    col = col - 0.5
+    row = row - 0.5
+    with np.errstate(invalid='ignore'):
+        left = np.floor(col)
+        top = np.floor(row)
+        valid = (left >= 0) & (top >= 0) & (left + 2 <= raster.width) & (top + 2 <= raster.height)
+    left = np.where(valid, left, 0).astype(np.int64)
+    top = np.where(valid, top, 0).astype(np.int64)
+    fx = col - left
+    fy = row - top
+
+    steps = np.arange(2)
+    values, mask = _gather(raster, top[:, None, None] + steps[None, :, None],
+                           left[:, None, None] + steps[None, None, :], valid)
+    valid &= ~mask.any(axis=(1, 2))
+    elevations = (values[:, 0, 0] * (1 - fx) + values[:, 0, 1] * fx) * (1 - fy) + \
+        (values[:, 1, 0] * (1 - fx) + values[:, 1, 1] * fx) * fy
+    return np.where(valid, elevations, np.nan)
+
+
+SAMPLERS = {'idw': sample_idw, 'bilinear': sample_bilinear}
+
+
+def sample_elevations(raster, points, method='idw'):
+    if method not in SAMPLERS:
+        raise ValueError(f'Unknown sampling method {method}, expected one of {SAMPLING_METHODS}')
+    if not len(points):
+        return np.zeros(0)
+    return SAMPLERS[method](raster, points[:, 0], points[:, 1])
+
+
+def edge_inclines(raster, points, offsets, lengths=None, method='idw', precision=3):
+    """Rise over run of every edge against one raster, NaN where it cannot be computed.
+
+    Like osw_incline the rise is the elevation difference between the first and last vertex and
+    the run their projected distance. Edges without points, or of zero length, get NaN.
+    """
+    if method not in SAMPLERS:
+        raise ValueError(f'Unknown sampling method {method}, expected one of {SAMPLING_METHODS}')
+    counts = np.diff(offsets)
+    has_points = counts > 0
+    inclines = np.full(len(counts), np.nan)
+    if not has_points.any():
+        return inclines
+
+    first = offsets[:-1][has_points]
+    last = offsets[1:][has_points] - 1
+    starts, ends = points[first], points[last]
+    if lengths is None:
+        lengths = projected_lengths(starts, ends)
+    else:
+        lengths = lengths[has_points]
+
+    # Elevations of both ends in one call, starts then ends
+    elevations = sample_elevations(raster, np.concatenate([starts, ends]), method=method)
+    rise = elevations[len(starts):] - elevations[:len(starts)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        run = np.where(lengths == 0, np.nan, lengths)
+        inclines[has_points] = np.round(rise / run, precision)
+    return inclines
@@ -0,0 +1,208 @@
+import os
+import shutil
+import itertools
+import threading
+import rasterio
+import numpy as np
+from affine import Affine
+from multiprocessing import shared_memory
+from rasterio.windows import Window
+from src.logger import Logger
+from src.inclination_helper.single_flight import SingleFlight
+
+SHM_DIR = '/dev/shm'
+_ROWS_PER_WINDOW = 256
+
+
+class SharedTile:
+    """Picklable description of a tile decoded into shared memory.
+
+    The segment holds the band values followed by the mask, one byte per pixel, so readers in
+    any process see exactly what `DatasetReader.read(1, masked=True)` would return.
+    """
+
+    def __init__(self, name, shape, dtype, transform, nodata):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+        self.transform = tuple(transform)[:6]
+        self.nodata = nodata
+
+    @property
+    def nbytes(self):
+        pixels = self.shape[0] * self.shape[1]
+        return pixels * np.dtype(self.dtype).itemsize + pixels
+
+    def views(self, buffer):
+        pixels = self.shape[0] * self.shape[1]
+        data = np.ndarray(self.shape, dtype=self.dtype, buffer=buffer)
+        mask = np.ndarray(self.shape, dtype=bool, buffer=buffer, offset=pixels * np.dtype(self.dtype).itemsize)
+        return data, mask
+
+
+class SharedRaster:
+    """Reads windows of a `SharedTile` from read-only, zero-copy views of its segment."""
+
+    def __init__(self, tile):
+        self._shm = shared_memory.SharedMemory(name=tile.name)
+        self.data, self.mask = tile.views(self._shm.buf)
+        self.data.flags.writeable = False
+        self.mask.flags.writeable = False
+        self.height, self.width = tile.shape
+        self.transform = Affine(*tile.transform)
+        self.nodata = tile.nodata
+
+    @property
+    def closed(self):
+        return self._shm is None
+
+    def read(self, indexes, window, masked=False):
+        if indexes != 1:
+            raise ValueError(f'Only band 1 can be read from a shared tile, not {indexes}')
+        rows = slice(max(int(window.row_off), 0), max(min(int(window.row_off + window.height), self.height), 0))
+        cols = slice(max(int(window.col_off), 0), max(min(int(window.col_off + window.width), self.width), 0))
+        values = self.data[rows, cols].copy()
+        if not masked:
+            return values
+        return np.ma.masked_array(values, mask=self.mask[rows, cols].copy(), fill_value=self.nodata)
+
+    def gather(self, rows, cols):
+        """Values and mask of the pixels at (rows, cols), which must lie within the raster."""
+        return self.data[rows, cols], self.mask[rows, cols]
+
+    def close(self):
+        if self._shm is not None:
+            self.data = self.mask = None
+            self._shm.close()
+            self._shm = None
+
+
+class SharedTileRegistry:
+    """Process-wide, reference counted registry of tiles decoded into shared memory.
+
+    Each tile is decoded once, however many jobs (see `SharedTileLease`) and worker processes
+    read it. A segment is unlinked when the last job using the tile releases it. Tiles that do
+    not fit in the free space of /dev/shm are not shared, `acquire` then returns None.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+    _names = itertools.count()
+
+    def __init__(self):
+        self._tiles = {}
+        self._refcounts = {}
+        self._segments = {}
+        self._loads = SingleFlight()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def acquire(self, dem_file):
+        dem_file = str(dem_file)
+        while True:
+            tile = self._loads.do(dem_file, self._load, dem_file)
+            if tile is None:
+                return None
+            with self._lock:
+                # The tile may have been released by its last user in between
+                if self._tiles.get(dem_file) is tile:
+                    self._refcounts[dem_file] += 1
+                    return tile
+
+    def _load(self, dem_file):
+        with self._lock:
+            tile = self._tiles.get(dem_file)
+            if tile is not None:
+                return tile
+
+        with rasterio.open(dem_file) as dataset:
+            tile = SharedTile(
+                name=f'osw_dem_{os.getpid()}_{next(self._names)}',
+                shape=(dataset.height, dataset.width),
+                dtype=dataset.dtypes[0],
+                transform=dataset.transform,
+                nodata=dataset.nodata
+            )
+            if not self._has_room(tile.nbytes):
+                Logger.warning(f'Not enough shared memory for {dem_file} ({tile.nbytes} bytes), reading it from disk')
+                return None
+            segment = shared_memory.SharedMemory(name=tile.name, create=True, size=tile.nbytes)
+            try:
+                data, mask = tile.views(segment.buf)
+                for row_off in range(0, dataset.height, _ROWS_PER_WINDOW):
+                    window = Window(0, row_off, dataset.width, min(_ROWS_PER_WINDOW, dataset.height - row_off))
+                    values = dataset.read(1, window=window, masked=True)
+                    rows = slice(row_off, row_off + window.height)
+                    data[rows] = np.ma.getdata(values)
+                    mask[rows] = np.ma.getmaskarray(values)
+                del data, mask
+            except Exception:
+                segment.close()
+                segment.unlink()
+                raise
+
+        with self._lock:
+            self._tiles[dem_file] = tile
+            self._refcounts[dem_file] = 0
+            self._segments[dem_file] = segment
+        Logger.info(f'Shared {dem_file} in memory as {tile.name}')
+        return tile
+
+    @staticmethod
+    def _has_room(nbytes):
+        try:
+            return shutil.disk_usage(SHM_DIR).free >= nbytes
+        except OSError:
+            # No /dev/shm to check, e.g. not on Linux
+            return True
+
+    def release(self, dem_file):
+        dem_file = str(dem_file)
+        with self._lock:
+            count = self._refcounts.get(dem_file, 0) - 1
+            if count > 0:
+                self._refcounts[dem_file] = count
+                return
+            self._refcounts.pop(dem_file, None)
+            self._tiles.pop(dem_file, None)
+            segment = self._segments.pop(dem_file, None)
+        if segment is not None:
+            segment.close()
+            segment.unlink()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tiles': len(self._tiles),
+                'bytes': sum(tile.nbytes for tile in self._tiles.values()),
+                'users': sum(self._refcounts.values())
+            }
+
+
+class SharedTileLease:
+    """The shared tiles used by one job, acquired on first use and released together."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or SharedTileRegistry.get()
+        self._tiles = {}
+        self._lock = threading.Lock()
+
+    def get(self, dem_file, default=None):
+        dem_file = str(dem_file)
+        with self._lock:
+            if dem_file not in self._tiles:
+                self._tiles[dem_file] = self.registry.acquire(dem_file)
+            tile = self._tiles[dem_file]
+        return default if tile is None else tile
+
+    def release(self):
+        with self._lock:
+            tiles, self._tiles = self._tiles, {}
+        for dem_file, tile in tiles.items():
+            if tile is not None:
+                self.registry.release(dem_file)
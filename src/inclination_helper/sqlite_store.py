@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class SQLiteStore:
+    """Base of the stores kept in a SQLite database, with one connection per process.
+
+    A SQLite connection must not be used across a fork, nor closed in the child: closing what it
+    takes for the last connection to the database would checkpoint the WAL under the parent. A
+    forked process keeps the inherited connection aside, unused, and opens its own on first use,
+    with a new lock since another thread of the parent may have held the old one. Subclasses
+    create their tables in `_setup` and use the connection under `_lock`.
+    """
+    _connect_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._pid = None
+        self._inherited = []
+        self._connect()
+
+    def _setup(self, connection):
+        raise NotImplementedError
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        try:
+            self._setup(connection)
+        except Exception:
+            connection.close()
+            raise
+        if self._pid is not None:
+            self._inherited.append(self._connection)
+        self._connection = connection
+        self._process_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def _lock(self):
+        if self._pid != os.getpid():
+            with SQLiteStore._connect_lock:
+                if self._pid != os.getpid():
+                    self._connect()
+        return self._process_lock
+
+    @classmethod
+    def _after_fork(cls):
+        SQLiteStore._connect_lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+os.register_at_fork(after_in_child=SQLiteStore._after_fork)
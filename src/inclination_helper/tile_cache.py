@@ -0,0 +1,197 @@
+import os
+import time
+import fcntl
+import threading
+from pathlib import Path
+from src.logger import Logger
+
+
+class TileCache:
+    """Size-bounded LRU bookkeeping for the NED 1/3 tiles stored under a DEM directory.
+
+    One instance is shared per directory across the whole process (see `for_directory`), so
+    concurrent jobs see the same access times, pins and counters. Access times are also written
+    to the tile files (atime) so the LRU order survives restarts. A pinned tile holds a shared
+    lock on its `.pin` file, and a tile is only evicted under an exclusive one, so the pins of
+    other processes using the directory (e.g. job workers) are honoured too.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory, max_bytes=0):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pins = {}
+        self._pin_fds = {}
+        self._last_access = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def _after_fork(cls):
+        # The child shares the open files of the pins with the parent, and so their locks: it closes
+        # its copies, without unlocking, and starts with no pins of its own
+        cls._instances_lock = threading.Lock()
+        for cache in list(cls._instances.values()):
+            for fd in cache._pin_fds.values():
+                if fd is not None:
+                    os.close(fd)
+            cache._pins = {}
+            cache._pin_fds = {}
+            cache._lock = threading.RLock()
+
+    @classmethod
+    def for_directory(cls, directory, max_bytes=0):
+        key = str(Path(directory).resolve())
+        with cls._instances_lock:
+            cache = cls._instances.get(key)
+            if cache is None:
+                cache = cls(directory=directory, max_bytes=max_bytes)
+                cls._instances[key] = cache
+            return cache
+
+    def tile_path(self, tile):
+        return Path(self.directory, f'{tile}.tif')
+
+    def record_hits(self, tiles):
+        now = time.time()
+        with self._lock:
+            for tile in tiles:
+                self.hits += 1
+                self._last_access[tile] = now
+                try:
+                    # In nanoseconds, the modification time is part of the tile version (see `tile_version`)
+                    # and must not be rounded
+                    path = self.tile_path(tile)
+                    os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+                except OSError:
+                    pass
+
+    def record_misses(self, tiles):
+        now = time.time()
+        with self._lock:
+            for tile in tiles:
+                self.misses += 1
+                self._last_access[tile] = now
+
+    def pin(self, tiles):
+        with self._lock:
+            for tile in tiles:
+                if tile not in self._pins:
+                    self._pin_fds[tile] = self._lock_pin(tile, fcntl.LOCK_SH)
+                self._pins[tile] = self._pins.get(tile, 0) + 1
+
+    def unpin(self, tiles):
+        with self._lock:
+            for tile in tiles:
+                count = self._pins.get(tile, 0) - 1
+                if count > 0:
+                    self._pins[tile] = count
+                else:
+                    self._pins.pop(tile, None)
+                    self._unlock_pin(self._pin_fds.pop(tile, None))
+
+    def _lock_pin(self, tile, operation):
+        # The .pin files are kept, removing one could split the lock between two inodes
+        try:
+            fd = os.open(str(self.tile_path(tile).with_name(f'{tile}.tif.pin')), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as err:
+            Logger.warning(f'Could not lock tile {tile}: {err}')
+            return None
+        try:
+            fcntl.flock(fd, operation)
+        except OSError:
+            os.close(fd)
+            raise
+        return fd
+
+    @staticmethod
+    def _unlock_pin(fd):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def is_pinned(self, tile):
+        with self._lock:
+            return tile in self._pins
+
+    @staticmethod
+    def _derived_paths(path):
+        # Memory-mappable copy of the tile written by the transcoder, accounted with the tile
+        return [path.with_suffix('.npy'), path.with_name(f'{path.stem}.npy.json')]
+
+    def _entries(self):
+        entries = []
+        for path in self.directory.glob('*.tif'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            size = stat.st_size
+            for derived_path in self._derived_paths(path):
+                try:
+                    size += derived_path.stat().st_size
+                except OSError:
+                    pass
+            last_access = self._last_access.get(path.stem, stat.st_atime)
+            entries.append((last_access, path.stem, path, size))
+        return entries
+
+    def size(self):
+        with self._lock:
+            return sum(entry[3] for entry in self._entries())
+
+    def evict(self):
+        """Remove least recently used, unpinned tiles until the cache fits in `max_bytes`."""
+        if not self.max_bytes or self.max_bytes <= 0:
+            return []
+        evicted = []
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(entry[3] for entry in entries)
+            for _, tile, path, size in entries:
+                if total <= self.max_bytes:
+                    break
+                if tile in self._pins:
+                    continue
+                try:
+                    fd = self._lock_pin(tile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Pinned by another process
+                    continue
+                try:
+                    path.unlink()
+                    path.with_name(f'{path.name}.json').unlink(missing_ok=True)
+                    for derived_path in self._derived_paths(path):
+                        derived_path.unlink(missing_ok=True)
+                except OSError as err:
+                    Logger.warning(f'Could not evict tile {tile}: {err}')
+                    continue
+                finally:
+                    self._unlock_pin(fd)
+                total -= size
+                self.evictions += 1
+                self._last_access.pop(tile, None)
+                evicted.append(tile)
+            if total > self.max_bytes:
+                Logger.warning(f'DEM cache is {total} bytes, over its {self.max_bytes} byte budget, '
+                               f'because the remaining tiles are pinned')
+        if evicted:
+            Logger.info(f'Evicted DEM tiles: {evicted}')
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'pinned': len(self._pins),
+                'bytes': self.size(),
+                'max_bytes': self.max_bytes
+            }
+
+
+os.register_at_fork(after_in_child=TileCache._after_fork)
@@ -0,0 +1,68 @@
+import os
+import time
+import threading
+from pathlib import Path
+from src.inclination_helper.sqlite_store import SQLiteStore
+
+
+class TileUsage(SQLiteStore):
+    """Number of jobs that used each DEM tile, in a SQLite database so it survives restarts.
+
+    Shared by the processes using the same download directory, and by the whole process per
+    database (see `for_path`). Used to fetch the most used tiles when the service starts.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def _setup(self, connection):
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS usage (tile TEXT PRIMARY KEY, jobs INTEGER NOT NULL, used REAL NOT NULL) '
+            'WITHOUT ROWID'
+        )
+
+    @classmethod
+    def _after_fork(cls):
+        # Another thread of the parent may have held it, the instances reconnect on first use
+        cls._instances_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path):
+        key = str(Path(path).resolve())
+        with cls._instances_lock:
+            usage = cls._instances.get(key)
+            if usage is None:
+                usage = cls(path=path)
+                cls._instances[key] = usage
+            return usage
+
+    def record(self, tiles):
+        """Counts one more job using each of `tiles`."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany(
+                    'INSERT INTO usage (tile, jobs, used) VALUES (?, 1, ?) '
+                    'ON CONFLICT (tile) DO UPDATE SET jobs = jobs + 1, used = excluded.used',
+                    [(tile, now) for tile in tiles]
+                )
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def top(self, count):
+        """The `count` tiles used by the most jobs, the most recently used first among equals."""
+        with self._lock:
+            return [tile for tile, in self._connection.execute(
+                'SELECT tile FROM usage ORDER BY jobs DESC, used DESC LIMIT ?', (count,)
+            )]
+
+    def counts(self):
+        with self._lock:
+            return dict(self._connection.execute('SELECT tile, jobs FROM usage'))
+
+
+os.register_at_fork(after_in_child=TileUsage._after_fork)
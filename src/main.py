@@ -2,7 +2,7 @@ import os
 import psutil
 from src.config import Settings
 from functools import lru_cache
-from fastapi import FastAPI, APIRouter, Depends, status
+from fastapi import FastAPI, APIRouter, Depends, Response, status
 from src.services.inclination_service import InclinationService
 
 app = FastAPI()
@@ -27,6 +27,7 @@ async def startup_event(settings: Settings = Depends(get_settings)) -> None:
         if not os.path.exists(dl_directory):
             os.makedirs(dl_directory)
         app.incline_service = InclinationService()
+        app.incline_service.warm_up()
 
     except Exception as e:
         print(e)
@@ -66,4 +67,14 @@ def ping():
     return "I'm healthy !!"
 
 
+@app.get('/ready', status_code=status.HTTP_200_OK)
+@prefix_router.get('/ready', status_code=status.HTTP_200_OK)
+def ready(response: Response):
+    # Separate from liveness, the service is live but not ready while it warms up its DEM tiles
+    if app.incline_service is None or not app.incline_service.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return 'Not ready'
+    return "I'm ready !!"
+
+
 app.include_router(prefix_router)
\ No newline at end of file
@@ -1,5 +1,30 @@
-from typing import Dict
-from dataclasses import dataclass
+from typing import Dict, List, Optional
+from dataclasses import dataclass, asdict, field
+from src.logger import Logger
+from src.inclination_helper.sampling import SAMPLING_METHODS
+
+
+@dataclass
+class SamplingOptions:
+    method: Optional[str] = None
+    interval: Optional[float] = None
+    max_vertices: Optional[int] = None
+    adaptive: bool = False
+
+    def __post_init__(self):
+        if self.method is not None and self.method not in SAMPLING_METHODS:
+            raise ValueError(f'Invalid sampling method {self.method}, expected one of {SAMPLING_METHODS}')
+        if self.interval is not None and self.interval <= 0:
+            raise ValueError(f'Invalid sampling interval {self.interval}, it must be positive')
+        if self.max_vertices is not None and self.max_vertices < 2:
+            raise ValueError(f'Invalid max_vertices {self.max_vertices}, at least 2 are needed')
+
+    def with_defaults(self, method):
+        return SamplingOptions(method=self.method or method, interval=self.interval,
+                               max_vertices=self.max_vertices, adaptive=self.adaptive)
+
+    def to_dict(self):
+        return asdict(self)
 
 
 @dataclass
@@ -7,6 +32,36 @@ class IncomingData:
     dataset_url: str
     user_id: str
     jobId: str
+    sampling: Optional[SamplingOptions] = None
+    # Where the dataset is, if the sender knows: (minx, miny, maxx, maxy) in WGS 84 or NED 1/3 tile names
+    bbox: Optional[List[float]] = None
+    tiles: Optional[List[str]] = None
+    # Why the sampling options are invalid, the job is then reported as failed
+    sampling_error: Optional[str] = field(default=None, init=False)
+
+    def __post_init__(self):
+        if self.sampling is not None and not isinstance(self.sampling, SamplingOptions):
+            try:
+                self.sampling = SamplingOptions(**self.sampling)
+            except (TypeError, ValueError) as err:
+                self.sampling_error = f'Invalid sampling options {self.sampling}: {err}'
+                self.sampling = None
+        # The hints are only an optimisation, invalid ones are ignored
+        if self.bbox is not None and not self._valid_bbox(self.bbox):
+            Logger.warning(f'Ignoring invalid bbox {self.bbox}, expected [minx, miny, maxx, maxy] in degrees')
+            self.bbox = None
+        if self.tiles is not None and not (
+                isinstance(self.tiles, list) and all(isinstance(tile, str) for tile in self.tiles)):
+            Logger.warning(f'Ignoring invalid tiles {self.tiles}, expected NED 1/3 tile names')
+            self.tiles = None
+
+    @staticmethod
+    def _valid_bbox(bbox) -> bool:
+        if not isinstance(bbox, list) or len(bbox) != 4 or \
+                not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in bbox):
+            return False
+        minx, miny, maxx, maxy = bbox
+        return minx <= maxx and miny <= maxy and -180 <= minx and maxx <= 180 and -90 <= miny and maxy <= 90
 
 
 @dataclass
@@ -0,0 +1,162 @@
+import io
+import os
+import time
+import psutil
+import shutil
+import zipfile
+import threading
+from pathlib import Path
+from itertools import islice
+from contextlib import contextmanager
+from src.logger import Logger
+from src.inclination_helper.coverage import feature_bounds, tile_cells
+from src.inclination_helper.geojson_stream import GeoJSONFeatureReader
+
+# Rough sizes the estimates are built from, measured on NED 1/3 tiles and OSW datasets
+TILE_BYTES = 450 * 1024 ** 2
+BASE_MEMORY = 256 * 1024 ** 2
+EDGE_MEMORY = 4 * 1024
+WORKER_MEMORY = 256 * 1024 ** 2
+BLOCK_BYTES = 256 * 256 * 4
+_OPEN_TILES = 4
+# Edges read to estimate a job, more than a small job has so small jobs are counted exactly
+_SAMPLE_EDGES = 10000
+_CGROUP_MEMORY_LIMITS = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+
+def memory_limit():
+    """Memory available to the pod: its cgroup limit when it has one, the machine's otherwise."""
+    limit = psutil.virtual_memory().total
+    for path in _CGROUP_MEMORY_LIMITS:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            limit = min(limit, int(value))
+    return limit
+
+
+class JobEstimate:
+    def __init__(self, edges, tiles, missing_tiles, memory, disk):
+        self.edges = edges
+        self.tiles = tiles
+        self.missing_tiles = missing_tiles
+        self.memory = memory
+        self.disk = disk
+
+    def prefetched(self):
+        """The estimate once the missing tiles are on disk."""
+        return JobEstimate(edges=self.edges, tiles=self.tiles, missing_tiles=[], memory=self.memory,
+                           disk=self.disk - len(self.missing_tiles) * TILE_BYTES)
+
+    def __repr__(self):
+        return f'JobEstimate(edges={self.edges}, tiles={len(self.tiles)}, missing_tiles={len(self.missing_tiles)}, ' \
+               f'memory={self.memory}, disk={self.disk})'
+
+
+class JobEstimator:
+    """Estimates the size of a job, and its memory and disk needs, from its downloaded dataset."""
+
+    def __init__(self, download_dir, ned_13_index, batch_size, workers=1, block_cache_blocks=64):
+        self.download_dir = Path(download_dir)
+        self.ned_13_index = ned_13_index
+        self.batch_size = batch_size
+        self.workers = workers
+        self.block_cache_blocks = block_cache_blocks
+
+    def estimate(self, archive_path):
+        """Estimates the needs of the job for the dataset in `archive_path`.
+
+        Only the first `_SAMPLE_EDGES` edges are read, straight from the archive, so the edges are
+        not parsed twice per job. The edge count of a larger dataset is extrapolated from the size
+        of its edges file, and its tiles are the ones of the sampled edges, the others are fetched
+        when the job computes.
+        """
+        with zipfile.ZipFile(archive_path) as archive:
+            entries = archive.infolist()
+            edges_entry = next((entry for entry in entries if 'edges' in entry.filename
+                                and '__MACOSX' not in entry.filename), None)
+            edges, tiles = 0, set()
+            if edges_entry is not None:
+                reader = GeoJSONFeatureReader(
+                    path=edges_entry.filename,
+                    opener=lambda name, mode: io.TextIOWrapper(archive.open(name), encoding='utf-8')
+                )
+                features = iter(reader)
+                sample = list(islice(features, _SAMPLE_EDGES))
+                features.close()
+                edges = len(sample)
+                if edges == _SAMPLE_EDGES and reader.offset:
+                    edges = max(edges, round(edges * edges_entry.file_size / reader.offset))
+                bounds = feature_bounds(feature.get('geometry') for feature in sample)
+                tiles.update(f'n{n}w{w:03}' for n, w in tile_cells(bounds).tolist())
+        tiles = sorted(tile for tile in tiles if tile in self.ned_13_index)
+        dem_dir = Path(self.download_dir, 'dems')
+        missing_tiles = [tile for tile in tiles if not Path(dem_dir, f'{tile}.tif').exists()]
+
+        extracted = sum(entry.file_size for entry in entries)
+        edges_size = edges_entry.file_size if edges_entry is not None else 0
+        # Extracted files, output archive, checkpointed chunks and the tiles to download
+        disk = extracted + os.path.getsize(archive_path) + edges_size + len(missing_tiles) * TILE_BYTES
+        memory = BASE_MEMORY + min(edges, self.batch_size) * EDGE_MEMORY + \
+            min(len(tiles), _OPEN_TILES) * self.block_cache_blocks * BLOCK_BYTES
+        if self.workers > 1:
+            memory += self.workers * WORKER_MEMORY
+        return JobEstimate(edges=edges, tiles=tiles, missing_tiles=missing_tiles, memory=memory, disk=disk)
+
+
+class AdmissionController:
+    """Admits jobs while their estimated memory and disk needs fit the budget of the pod.
+
+    A job that does not fit is held back until running jobs complete, it is never failed. A job
+    is always admitted when no other job is running, even if it is over the budget on its own.
+    """
+
+    def __init__(self, memory_budget, download_dir):
+        self.memory_budget = memory_budget
+        self.download_dir = Path(download_dir)
+        self._running = {}
+        self._condition = threading.Condition()
+
+    def _fits(self, estimate):
+        if not self._running:
+            return True
+        memory = sum(running.memory for running in self._running.values())
+        disk = sum(running.disk for running in self._running.values())
+        try:
+            free = shutil.disk_usage(self.download_dir).free
+        except OSError:
+            free = float('inf')
+        return memory + estimate.memory <= self.memory_budget and disk + estimate.disk <= free
+
+    @contextmanager
+    def admit(self, estimate, job_id):
+        """Holds the calling thread until the job fits, and counts it as running until the block ends."""
+        start_time = time.time()
+        # A redelivered message can run next to the original one, so not keyed by job id
+        token = object()
+        with self._condition:
+            if not self._fits(estimate):
+                Logger.info(f'Holding back job {job_id} until it fits the budget: {estimate}')
+                self._condition.wait_for(lambda: self._fits(estimate))
+                Logger.info(f'Admitted job {job_id} after {time.time() - start_time:.1f} seconds')
+            elif estimate.memory > self.memory_budget:
+                Logger.warning(f'Job {job_id} is over the memory budget on its own: {estimate}')
+            self._running[token] = estimate
+        try:
+            yield estimate
+        finally:
+            with self._condition:
+                self._running.pop(token, None)
+                self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'running': len(self._running),
+                'memory': sum(running.memory for running in self._running.values()),
+                'disk': sum(running.disk for running in self._running.values()),
+                'memory_budget': self.memory_budget
+            }
@@ -1,31 +1,103 @@
 import os
 import gc
+import time
 import threading
+import contextlib
 import osw_incline
+import concurrent.futures
 from src.logger import Logger
 from python_ms_core import Core
 from src.config import Settings
-from src.inclination_helper.inclination import Inclination
-from src.models.queue_message_content import RequestMessage
+from src.services.result_index import ResultIndex
+from src.services.job_workers import JobWorkerPool
+from src.services.scheduler import JobScheduler
+from src.services.pipeline import JobPipeline
+from src.services.admission import AdmissionController, JobEstimate, JobEstimator, memory_limit, TILE_BYTES
+from src.services.warmup import TileWarmup
+from src.inclination_helper.coverage import tile_cells
+from src.inclination_helper.sampling import SAMPLER_VERSION
+from src.inclination_helper.dem_downloader import DEMDownloader, load_ned_13_index
+from src.inclination_helper.inclination import Inclination, calculate_inclination, create_dem_downloader
+from src.inclination_helper.checkpoint import JobCheckpoint
+from src.inclination_helper.deadline import Deadline, JobTimeoutError
+from src.models.queue_message_content import RequestMessage, SamplingOptions
 from src.inclination_helper.utils import get_unique_id, clean_up
 from python_ms_core.core.queue.models.queue_message import QueueMessage
 
+CALLBACK_EXECUTION_MODE = 'TOPIC_CALLBACK_EXECUTION_MODE'
+
 
 class InclinationService:
     _config = Settings()
 
     def __init__(self):
+        self._use_thread_callbacks()
         self.core = Core()
         self._subscription_name = self._config.event_bus.request_subscription
+        self.scheduler = JobScheduler(
+            slots=self._config.max_concurrent_messages,
+            small_slots=self._config.small_job_slots,
+            small_max_edges=self._config.small_job_max_edges,
+            small_max_tiles=self._config.small_job_max_tiles
+        )
+        self.pipeline = JobPipeline(
+            io_slots=self._config.pipeline_io_slots,
+            prefetch_jobs=self._config.pipeline_prefetch_jobs
+        )
+        # Extra messages are delivered for the small job lane and for the jobs fetched ahead,
+        # large jobs still compute at most max_concurrent_messages at a time
         self.request_topic = self.core.get_topic(
             topic_name=self._config.event_bus.request_topic,
-            max_concurrent_messages=self._config.max_concurrent_messages
+            max_concurrent_messages=self.pipeline.concurrency(self.scheduler.concurrency)
         )
         self.storage_client = self.core.get_storage_client()
         self.container_name = self._config.event_bus.container_name
+        self.result_index = ResultIndex(
+            path=os.path.join(self._config.get_download_directory(), 'job_results.sqlite3'),
+            ttl=self._config.job_dedup_ttl
+        )
+        self.estimator = JobEstimator(
+            download_dir=self._config.get_download_directory(),
+            ned_13_index=load_ned_13_index(os.path.join(os.getcwd(), 'src', 'ned_13_index.json')),
+            batch_size=self._config.incline_batch_size,
+            workers=self._config.incline_workers,
+            block_cache_blocks=self._config.dem.block_cache_blocks
+        )
+        self.admission = None
+        if self._config.admission_control:
+            self.admission = AdmissionController(
+                # 80% of the pod's memory by default, the rest is for the service itself
+                memory_budget=self._config.admission_memory_bytes or int(memory_limit() * 0.8),
+                download_dir=self._config.get_download_directory()
+            )
+        self.warmup = None
+        # Hinted tiles are downloaded in the background, for as many jobs as fetch at once
+        self.tile_hints = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self._config.pipeline_io_slots),
+                                                                thread_name_prefix='tile-hints')
+        self.job_workers = None
+        if self._config.job_workers > 0:
+            # On by default: the messages are processed in threads of this long-lived process, which
+            # would otherwise keep what GDAL and NumPy allocate for every job. One worker per job the
+            # scheduler lets compute at once, so an admitted job never waits for a worker, in
+            # particular a small job behind large ones
+            self.job_workers = JobWorkerPool(
+                workers=self.scheduler.concurrency,
+                max_jobs=self._config.job_worker_max_jobs,
+                max_rss=self._config.job_worker_max_rss
+            )
         self.listening_thread = threading.Thread(target=self.subscribe)
         self.listening_thread.start()
 
+    @staticmethod
+    def _use_thread_callbacks() -> None:
+        # python-ms-core runs each topic callback in a forked process by default. The scheduler,
+        # admission control, pipeline and job workers only bound the jobs of their own process, so
+        # the messages must be processed in threads of this one. Read when the topic is created.
+        mode = os.environ.get(CALLBACK_EXECUTION_MODE)
+        if mode and mode.strip().lower() != 'thread':
+            Logger.warning(f' {CALLBACK_EXECUTION_MODE}={mode} is not supported, messages are processed in threads')
+        os.environ[CALLBACK_EXECUTION_MODE] = 'thread'
+
     def subscribe(self) -> None:
         # Process the incoming message
         def process(message) -> None:
@@ -42,47 +114,114 @@ class InclinationService:
         prefix = request_msg.data.jobId if request_msg.data.jobId else get_unique_id()
         file_path = request_msg.data.dataset_url
         inclination = None
+        is_valid = False
+        deadline = Deadline(self._config.job_timeout)
         try:
             Logger.info(f' Message ID: {request_msg.messageId}')
             is_valid = True
+            sampling_error = getattr(request_msg.data, 'sampling_error', None)
             if file_path is None:
                 Logger.warning(' No file path found in the request!')
                 is_valid = False
+            elif isinstance(sampling_error, str):
+                Logger.warning(f' {sampling_error}')
+                is_valid = False
             else:
                 inclination = Inclination(
                     file_path=file_path,
                     storage_client=self.storage_client,
-                    prefix=prefix
+                    prefix=prefix,
+                    sampling=self._sampling_options(request_msg),
+                    deadline=deadline
                 )
-                file_path = inclination.calculate()
-                Logger.info(f' Calculated inclination for file: {file_path}')
-                if file_path:
-                    file_path = self.upload_to_azure(
-                        file_path=file_path,
-                        job_id=prefix
-                    )
+                # Fetched while other jobs compute, the job holds no compute slot until it is
+                # ready to compute
+                with self.pipeline.io('fetch', job_id=prefix, deadline=deadline):
+                    dem_downloader = inclination.dem_downloader()
+                    self._warm_hinted_tiles(dem_downloader=dem_downloader, request_message=request_msg, job_id=prefix)
+                    archive_path = inclination.download()
+                    result_key = self._result_key(archive_path=archive_path, request_message=request_msg)
+                    previous = self.result_index.get(result_key) if result_key else None
+                    if not previous:
+                        estimate = self._prefetch(inclination=inclination, dem_downloader=dem_downloader,
+                                                  archive_path=archive_path, job_id=prefix)
+                if previous:
+                    # Same archive and settings as a job completed within the TTL, its output is reused
+                    file_path, previous_job_id = previous
+                    Logger.info(f' Dataset already processed by job {previous_job_id}, reusing {file_path}')
                 else:
-                    is_valid = False
-                    file_path = request_msg.data.dataset_url
+                    try:
+                        with self._job_slot(estimate=estimate, job_id=prefix, deadline=deadline):
+                            file_path = self._calculate(inclination=inclination, archive_path=archive_path)
+                    finally:
+                        dem_downloader.release_tiles()
+                    Logger.info(f' Calculated inclination for file: {file_path}')
+                    if file_path:
+                        # Uploaded after the compute slot is freed for the next job
+                        with self.pipeline.io('publish', job_id=prefix, deadline=deadline):
+                            file_path = self.upload_to_azure(
+                                file_path=file_path,
+                                job_id=prefix
+                            )
+                        if file_path and result_key:
+                            self.result_index.put(result_key, url=file_path, job_id=prefix)
+                            self.result_index.purge()
+                    else:
+                        is_valid = False
+                        file_path = request_msg.data.dataset_url
 
             self.send_status(valid=is_valid, request_message=request_msg, file_path=file_path)
+        except JobTimeoutError as e:
+            # Cancelled, the files are kept like for any failure so a redelivery resumes the job
+            Logger.error(f' Timeout: {e}')
+            is_valid = False
+            self.send_status(valid=False, request_message=request_msg, file_path=file_path, timed_out=True)
         except Exception as e:
             Logger.error(f' Error: {e}')
+            is_valid = False
             self.send_status(valid=False, request_message=request_msg, file_path=file_path)
         finally:
-            Logger.info(f' Cleaning up files with prefix: {prefix}')
-            clean_up(path=f'{self._config.get_download_directory()}/{prefix}')
+            download_dir = self._config.get_download_directory()
+            if is_valid or not request_msg.data.jobId:
+                Logger.info(f' Cleaning up files with prefix: {prefix}')
+                clean_up(path=f'{download_dir}/{prefix}')
+            else:
+                # Kept for a redelivery of the message to resume from, until the checkpoint goes stale
+                Logger.info(f' Keeping files with prefix: {prefix} to resume the job')
+            JobCheckpoint.collect_garbage(directory=download_dir, max_age=self._config.checkpoint_ttl)
             del inclination
             gc.collect()
 
-    def send_status(self, valid: bool, request_message: RequestMessage, file_path: str) -> None:
+    def _result_key(self, archive_path: str, request_message: RequestMessage):
+        # Everything the output depends on besides the DEM tiles, whose changes the TTL bounds
+        if not self.result_index.enabled:
+            return None
+        return self.result_index.key(
+            archive_path,
+            python_ms_core=Core.__version__,
+            osw_incline=osw_incline.__version__,
+            sampler=SAMPLER_VERSION,
+            sampling=self._sampling_options(request_message).to_dict()
+        )
+
+    def _sampling_options(self, request_message: RequestMessage) -> SamplingOptions:
+        # The sampling parameters used for the job, as given in the request or the defaults
+        sampling = getattr(request_message.data, 'sampling', None)
+        if not isinstance(sampling, SamplingOptions):
+            sampling = SamplingOptions()
+        return sampling.with_defaults(method=self._config.incline_sampling_method)
+
+    def send_status(self, valid: bool, request_message: RequestMessage, file_path: str,
+                    timed_out: bool = False) -> None:
         response_message = {
-            'message': 'Success' if valid else 'Failed',
+            'message': 'Success' if valid else 'Timed out' if timed_out else 'Failed',
             'success': valid,
             'file_upload_path': file_path,
             'package': {
                 'python-ms-core': Core.__version__,
-                'osw-incline': osw_incline.__version__
+                'osw-incline': osw_incline.__version__,
+                'sampler': SAMPLER_VERSION,
+                'sampling': self._sampling_options(request_message).to_dict()
             }
         }
         Logger.info(
@@ -96,10 +235,106 @@ class InclinationService:
         response_topic.publish(data=data)
         return
 
+    def warm_up(self) -> None:
+        # The tiles are fetched in the background, at most as many as the DEM cache holds
+        cache_max_bytes = self._config.dem.cache_max_bytes
+        self.warmup = TileWarmup(
+            dem_downloader=create_dem_downloader(
+                config=self._config,
+                ned_13_index=self.estimator.ned_13_index,
+                workdir=self._config.get_download_directory()
+            ),
+            tiles=[tile.strip() for tile in self._config.tile_warmup_tiles.split(',') if tile.strip()],
+            top_tiles=self._config.tile_warmup_top_tiles,
+            max_tiles=cache_max_bytes // TILE_BYTES if cache_max_bytes > 0 else None
+        )
+        self.warmup.start()
+
+    @property
+    def ready(self) -> bool:
+        return self.warmup is None or self.warmup.ready
+
     def stop_listening(self):
         self.listening_thread.join(timeout=0)
+        self.tile_hints.shutdown(wait=False, cancel_futures=True)
+        if self.job_workers is not None:
+            self.job_workers.close()
         return
 
+    def _prefetch(self, inclination: Inclination, dem_downloader: DEMDownloader, archive_path: str,
+                  job_id: str) -> JobEstimate:
+        # The DEM tiles found by the estimate are fetched and pinned before the job waits for a
+        # compute slot, so it computes without waiting on the network
+        estimate = self.estimator.estimate(archive_path)
+        Logger.info(f' Job {job_id} estimate: {estimate}')
+        try:
+            dem_downloader.prefetch(estimate.tiles)
+        except Exception:
+            dem_downloader.release_tiles()
+            raise
+        inclination.prefetched_tiles = sorted(dem_downloader.ned_13_tiles)
+        return estimate.prefetched()
+
+    def _hinted_tiles(self, request_message: RequestMessage) -> list:
+        # The tiles named by the request and the ones its bounding box touches
+        tiles = getattr(request_message.data, 'tiles', None)
+        bbox = getattr(request_message.data, 'bbox', None)
+        tiles = set(tiles) if isinstance(tiles, list) else set()
+        if isinstance(bbox, list):
+            tiles.update(f'n{n}w{w:03}' for n, w in tile_cells([bbox]).tolist())
+        return sorted(tiles)
+
+    def _warm_hinted_tiles(self, dem_downloader: DEMDownloader, request_message: RequestMessage, job_id: str):
+        # The tiles hinted by the request are downloaded in the background while the dataset is.
+        # The job never waits for them: its prefetch joins the downloads still in flight for the
+        # tiles it needs only. A wrong hint only costs downloads.
+        tiles = self._hinted_tiles(request_message)
+        if len(tiles) > self._config.tile_hint_max_tiles:
+            Logger.warning(f' Ignoring the tile hint of job {job_id}, {len(tiles)} tiles is over the limit of '
+                           f'{self._config.tile_hint_max_tiles}')
+            return None
+        if not tiles:
+            return None
+
+        def log_failures(future):
+            try:
+                failed_tiles = future.result()
+                if failed_tiles:
+                    Logger.warning(f' Could not fetch hinted tiles {failed_tiles} for job {job_id}')
+            except Exception as err:
+                Logger.warning(f' Could not fetch hinted tiles for job {job_id}: {err}')
+
+        future = self.tile_hints.submit(dem_downloader.warm, tiles)
+        future.add_done_callback(log_failures)
+        return future
+
+    @contextlib.contextmanager
+    def _job_slot(self, estimate: JobEstimate, job_id: str, deadline: Deadline = None):
+        # Scheduled by size first, then admitted against the memory and disk budget
+        start_time = time.time()
+        with self.scheduler.slot(estimate, job_id=job_id):
+            admission = self.admission.admit(estimate, job_id=job_id) if self.admission is not None \
+                else contextlib.nullcontext(estimate)
+            with admission:
+                if deadline is not None:
+                    # The time the job was held back does not count against its deadline
+                    deadline.extend(time.time() - start_time)
+                yield estimate
+
+    def _calculate(self, inclination: Inclination, archive_path: str) -> str:
+        if self.job_workers is None:
+            return inclination.calculate(downloaded_file_path=archive_path)
+        # In a worker process, the listener thread only waits for the result
+        return self.job_workers.run(
+            calculate_inclination,
+            file_path=inclination.file_path,
+            prefix=inclination.prefix,
+            sampling=inclination.sampling,
+            downloaded_file_path=archive_path,
+            prefetched_tiles=inclination.prefetched_tiles,
+            deadline=inclination.deadline
+        )
+
     def upload_to_azure(self, job_id: str, file_path=None):
         Logger.info(f' Uploading file to Azure: {file_path}')
         try:
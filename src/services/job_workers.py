@@ -0,0 +1,141 @@
+import gc
+import queue
+import psutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from src.logger import Logger
+from src.inclination_helper.deadline import JobTimeoutError
+
+# Seconds a job is given past its deadline to stop at its own deadline checks, and keep its
+# checkpoint, before its worker process is killed
+KILL_GRACE = 30
+
+
+class JobWorkerError(Exception):
+    pass
+
+
+def _run_job(fn, args, kwargs):
+    # Runs in the worker process, which reports its memory once the job is done, failed or not
+    try:
+        result, error = fn(*args, **kwargs), None
+    except Exception as err:
+        result, error = None, err
+    gc.collect()
+    return result, error, psutil.Process().memory_info().rss
+
+
+class _JobWorker:
+    def __init__(self, number):
+        self.number = number
+        self.jobs = 0
+        self.rss = 0
+        # Spawned rather than forked, the jobs are submitted from the threads of the queue listener
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def kill(self):
+        # A process stuck in native code, e.g. a GDAL read, never reaches a deadline check
+        processes = list((self.executor._processes or {}).values())
+        for process in processes:
+            process.kill()
+        for process in processes:
+            process.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class JobWorkerPool:
+    """Runs jobs in `workers` separate processes, one job per process at a time.
+
+    Each worker process is replaced once it has run `max_jobs` jobs or its RSS after a job is
+    over `max_rss` bytes, so memory that GDAL and NumPy do not hand back to the OS is released
+    with the process. A worker that dies during a job (e.g. OOM-killed) is replaced too and the
+    job fails with a `JobWorkerError`. A worker still running a job `KILL_GRACE` seconds past its
+    deadline is killed and replaced, and the job fails with a `JobTimeoutError`. Processes are
+    started on first use.
+    """
+
+    def __init__(self, workers, max_jobs=0, max_rss=0):
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.recycled = 0
+        self._idle = queue.Queue()
+        self._numbers = iter(range(1, 1 << 31))
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(max(1, workers)):
+            self._idle.put(None)
+
+    def run(self, fn, *args, deadline=None, **kwargs):
+        """Runs `fn(*args, **kwargs)` in a worker process and returns its result.
+
+        Blocks the calling thread until a worker is free and the job is done. `fn` and its
+        arguments must be picklable. A `deadline` is passed on to `fn` and bounds the wait.
+        """
+        if deadline is not None:
+            kwargs['deadline'] = deadline
+        worker = self._idle.get()
+        try:
+            if self._closed:
+                raise JobWorkerError('The job worker pool is closed')
+            if worker is None:
+                worker = self._start()
+            future = worker.executor.submit(_run_job, fn, args, kwargs)
+            remaining = deadline.remaining() if deadline is not None else None
+            try:
+                result, error, worker.rss = future.result(
+                    timeout=remaining + KILL_GRACE if remaining is not None else None
+                )
+            except FutureTimeoutError:
+                Logger.error(f'Job worker {worker.number} is still running past the deadline, killing it')
+                worker.kill()
+                worker = None
+                raise JobTimeoutError(seconds=deadline.seconds, stage='job worker')
+            except BrokenProcessPool as err:
+                Logger.error(f'Job worker {worker.number} died: {err}')
+                worker = self._stop(worker)
+                raise JobWorkerError(f'The job worker process died: {err}') from err
+            worker.jobs += 1
+            if self._should_recycle(worker):
+                Logger.info(f'Recycling job worker {worker.number} after {worker.jobs} jobs, RSS {worker.rss} bytes')
+                worker = self._stop(worker)
+                with self._lock:
+                    self.recycled += 1
+            if error is not None:
+                raise error
+            return result
+        finally:
+            self._idle.put(worker)
+
+    def _should_recycle(self, worker):
+        return (self.max_jobs > 0 and worker.jobs >= self.max_jobs) or \
+            (self.max_rss > 0 and worker.rss > self.max_rss)
+
+    def _start(self):
+        with self._lock:
+            number = next(self._numbers)
+        Logger.info(f'Starting job worker {number}')
+        return _JobWorker(number=number)
+
+    @staticmethod
+    def _stop(worker):
+        worker.shutdown()
+        # Started again by the next job
+        return None
+
+    def close(self):
+        self._closed = True
+        workers = []
+        while True:
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in workers:
+            if worker is not None:
+                worker.shutdown()
+            self._idle.put(None)
@@ -0,0 +1,54 @@
+import time
+import threading
+from contextlib import contextmanager
+from src.logger import Logger
+
+
+class JobPipeline:
+    """Runs the I/O stages of the jobs in flight next to the computations of other jobs.
+
+    A job is fetched (dataset downloaded and estimated, DEM tiles prefetched), computed, then
+    published (output uploaded). The service receives `prefetch_jobs` more messages than it can
+    compute at once, so the next jobs are fetched while the running ones compute, and a job's
+    upload does not hold a compute slot. At most `io_slots` jobs are in an I/O stage at once,
+    the others queue at its entry.
+    """
+
+    def __init__(self, io_slots=2, prefetch_jobs=1):
+        self.io_slots = max(1, io_slots)
+        self.prefetch_jobs = max(0, prefetch_jobs)
+        self._stages = {}
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    def concurrency(self, compute_slots):
+        """Messages to receive at once for `compute_slots` jobs computing."""
+        return compute_slots + self.prefetch_jobs
+
+    @contextmanager
+    def io(self, stage, job_id, deadline=None):
+        """Holds the calling thread until an I/O slot is free, and keeps it until the block ends."""
+        start_time = time.time()
+        with self._condition:
+            self._waiting += 1
+            try:
+                self._condition.wait_for(lambda: sum(self._stages.values()) < self.io_slots)
+            finally:
+                self._waiting -= 1
+            self._stages[stage] = self._stages.get(stage, 0) + 1
+        waited = time.time() - start_time
+        if waited >= 1:
+            Logger.info(f'Job {job_id} waited {waited:.1f} seconds to {stage}')
+        if deadline is not None:
+            # The time the job was held back does not count against its deadline
+            deadline.extend(waited)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._stages[stage] -= 1
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {**self._stages, 'waiting': self._waiting}
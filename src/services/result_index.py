@@ -0,0 +1,66 @@
+import json
+import time
+import hashlib
+from src.logger import Logger
+from src.inclination_helper.sqlite_store import SQLiteStore
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultIndex(SQLiteStore):
+    """Index of the results of completed jobs by content, to answer resubmissions right away.
+
+    A result is keyed by the hash of the submitted archive and everything else its output depends
+    on (library versions, sampling options, see `key`), and is only returned for `ttl` seconds
+    after it was computed.
+    """
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        super().__init__(path=path)
+
+    def _setup(self, connection):
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, url TEXT NOT NULL, job_id TEXT, '
+            'created REAL NOT NULL)'
+        )
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @staticmethod
+    def key(archive_path, **params):
+        params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f'{file_digest(archive_path)}:{params}'.encode()).hexdigest()
+
+    def get(self, key):
+        """URL and job id of the result stored under `key`, None if there is none or it expired."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT url, job_id FROM results WHERE key = ? AND created > ?', (key, time.time() - self.ttl)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, key, url, job_id=None):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO results (key, url, job_id, created) VALUES (?, ?, ?, ?)',
+                                     (key, url, job_id, time.time()))
+
+    def purge(self):
+        """Remove the expired results."""
+        with self._lock:
+            removed = self._connection.execute('DELETE FROM results WHERE created <= ?',
+                                               (time.time() - self.ttl,)).rowcount
+        if removed:
+            Logger.info(f'Removed {removed} expired job results from {self.path}')
+        return removed
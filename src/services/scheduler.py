@@ -0,0 +1,75 @@
+import itertools
+import threading
+from contextlib import contextmanager
+from src.logger import Logger
+
+
+class JobScheduler:
+    """Orders jobs by size and keeps a lane of `small_slots` slots for small jobs.
+
+    At most `slots` jobs of any size run at once, and when a slot frees up it goes to the
+    smallest waiting job (by edge count). Small jobs (see `is_small`) can also run in the small
+    lane, so they never wait behind large jobs holding every slot. The subscription has to
+    deliver `slots + small_slots` messages at once for the lane to be used.
+    """
+
+    def __init__(self, slots, small_slots=1, small_max_edges=5000, small_max_tiles=1):
+        self.slots = max(1, slots)
+        self.small_slots = max(0, small_slots)
+        self.small_max_edges = small_max_edges
+        self.small_max_tiles = small_max_tiles
+        self._running = 0
+        self._running_small = 0
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+
+    @property
+    def concurrency(self):
+        return self.slots + self.small_slots
+
+    def is_small(self, estimate):
+        return estimate.edges <= self.small_max_edges and len(estimate.tiles) <= self.small_max_tiles
+
+    def _can_run(self, ticket):
+        # A free slot goes to the smallest waiting job
+        return self._running < self.slots and ticket == min(self._waiting)
+
+    @contextmanager
+    def slot(self, estimate, job_id):
+        """Holds the calling thread until the job can run, and keeps its slot until the block ends."""
+        small = self.is_small(estimate)
+        ticket = (estimate.edges, next(self._tickets))
+        with self._condition:
+            self._waiting.append(ticket)
+            try:
+                self._condition.wait_for(lambda: self._can_run(ticket) or
+                                         (small and self._running_small < self.small_slots))
+                in_lane = not self._can_run(ticket)
+            finally:
+                self._waiting.remove(ticket)
+            if in_lane:
+                self._running_small += 1
+            else:
+                self._running += 1
+            # The next smallest job may be able to start
+            self._condition.notify_all()
+        Logger.info(f'Scheduled {"small" if small else "large"} job {job_id} with {estimate.edges} edges'
+                    f'{" in the small job lane" if in_lane else ""}')
+        try:
+            yield in_lane
+        finally:
+            with self._condition:
+                if in_lane:
+                    self._running_small -= 1
+                else:
+                    self._running -= 1
+                self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'running': self._running,
+                'running_small': self._running_small,
+                'waiting': len(self._waiting)
+            }
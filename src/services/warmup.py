@@ -0,0 +1,67 @@
+import time
+import sqlite3
+import threading
+from src.logger import Logger
+
+
+class TileWarmup:
+    """Fetches the DEM tiles that jobs are likely to need, in the background, when the service starts.
+
+    These are the configured `tiles`, then the `top_tiles` tiles used by the most jobs so far
+    (see `TileUsage`), at most `max_tiles` in all. Until they are fetched, or failed to be,
+    the service is not ready. It is still live and still processes messages.
+    """
+
+    def __init__(self, dem_downloader, tiles=(), top_tiles=0, max_tiles=None):
+        self.dem_downloader = dem_downloader
+        self.configured_tiles = list(tiles)
+        self.top_tiles = max(0, top_tiles)
+        self.max_tiles = max_tiles
+        self.failed_tiles = []
+        self._tiles = []
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def tiles(self):
+        tiles = list(dict.fromkeys(self.configured_tiles))
+        if self.top_tiles:
+            try:
+                used = self.dem_downloader.usage.top(self.top_tiles)
+            except sqlite3.Error as err:
+                Logger.warning(f'Could not read the tile usage: {err}')
+                used = []
+            tiles += [tile for tile in used if tile not in tiles]
+        if self.max_tiles is not None:
+            tiles = tiles[:max(0, self.max_tiles)]
+        return tiles
+
+    def start(self):
+        self._tiles = self.tiles()
+        if not self._tiles:
+            self._ready.set()
+            return
+        self._thread = threading.Thread(target=self._run, name='tile-warmup', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start_time = time.time()
+        Logger.info(f'Warming up DEM tiles {self._tiles}')
+        try:
+            self.failed_tiles = self.dem_downloader.warm(self._tiles)
+            if self.failed_tiles:
+                Logger.warning(f'Could not warm up DEM tiles {self.failed_tiles}')
+        except Exception as err:
+            Logger.error(f'DEM tile warm-up failed: {err}')
+        finally:
+            Logger.info(f'DEM tile warm-up done in {time.time() - start_time:.1f} seconds')
+            self._ready.set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout=timeout)
+
+    def stats(self):
+        return {'ready': self.ready, 'tiles': list(self._tiles), 'failed': list(self.failed_tiles)}
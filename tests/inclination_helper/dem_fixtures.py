@@ -0,0 +1,71 @@
+import os
+import json
+import rasterio
+import numpy as np
+from rasterio.transform import from_origin
+
+# Synthetic NED 1/3 like tile n48w123: covers lon [-123, -122] and lat [47, 48]
+TILE = 'n48w123'
+RESOLUTION = 0.005
+SIZE = 200
+
+
+def elevation(lon, lat):
+    return 100.0 + 800.0 * (lon + 123.0) + 300.0 * np.sin(6.0 * (48.0 - lat))
+
+
+def write_dem(directory, tile=TILE, size=SIZE, resolution=RESOLUTION, nodata=None):
+    north = int(tile[1:3])
+    west = int(tile[4:7])
+    path = os.path.join(directory, f'{tile}.tif')
+    cols = -west + (np.arange(size) + 0.5) * resolution
+    rows = north - (np.arange(size) + 0.5) * resolution
+    lon, lat = np.meshgrid(cols, rows)
+    data = elevation(lon, lat).astype('float32')
+    with rasterio.open(
+        path, 'w', driver='GTiff', height=size, width=size, count=1, dtype='float32',
+        crs='EPSG:4326', transform=from_origin(-west, north, resolution, resolution), nodata=nodata,
+        tiled=True, blockxsize=64, blockysize=64
+    ) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def sample_edges(count=50, seed=0, west=-122.98, east=-122.02, south=47.02, north=47.98):
+    rng = np.random.default_rng(seed)
+    features = []
+    for i in range(count):
+        start = [rng.uniform(west, east), rng.uniform(south, north)]
+        end = [start[0] + rng.uniform(-0.004, 0.004), start[1] + rng.uniform(-0.004, 0.004)]
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [start, end]},
+            'properties': {'_id': str(i), '_u_id': f'u{i}', '_v_id': f'v{i}', 'highway': 'footway'}
+        })
+    return features
+
+
+def write_dataset(directory, features):
+    nodes = []
+    for feature in features:
+        properties = feature['properties']
+        coordinates = feature['geometry']['coordinates']
+        for node_id, point in ((properties['_u_id'], coordinates[0]), (properties['_v_id'], coordinates[-1])):
+            nodes.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': point},
+                'properties': {'_id': node_id}
+            })
+    nodes_path = os.path.join(directory, 'test.nodes.geojson')
+    edges_path = os.path.join(directory, 'test.edges.geojson')
+    with open(nodes_path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': nodes}, f)
+    with open(edges_path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+    return nodes_path, edges_path
+
+
+def read_inclines(edges_path):
+    with open(edges_path) as f:
+        features = json.load(f)['features']
+    return {feature['properties']['_id']: feature['properties'].get('incline') for feature in features}
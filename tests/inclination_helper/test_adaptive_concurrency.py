@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import patch
+from src.inclination_helper.adaptive_concurrency import AdaptiveConcurrency
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    @patch('src.inclination_helper.adaptive_concurrency.time.monotonic')
+    def test_limit_grows_while_throughput_improves(self, mock_monotonic):
+        # Arrange
+        mock_monotonic.side_effect = [0, 1, 1, 2, 2]
+        concurrency = AdaptiveConcurrency(initial=1, maximum=4)
+
+        # Act
+        concurrency.record_success(100)
+        concurrency.record_success(100)
+        concurrency.record_success(200)
+
+        # Assert
+        self.assertEqual(concurrency.limit, 3)
+
+    @patch('src.inclination_helper.adaptive_concurrency.time.monotonic')
+    def test_limit_shrinks_when_throughput_drops(self, mock_monotonic):
+        # Arrange
+        mock_monotonic.side_effect = [0, 1, 1, 11, 11]
+        concurrency = AdaptiveConcurrency(initial=1, maximum=4)
+
+        # Act
+        concurrency.record_success(1000)
+        concurrency.record_success(100)
+        concurrency.record_success(100)
+
+        # Assert
+        self.assertEqual(concurrency.limit, 1)
+
+    def test_failure_halves_limit(self):
+        # Arrange
+        concurrency = AdaptiveConcurrency(initial=8, maximum=8)
+
+        # Act
+        concurrency.record_failure()
+        concurrency.record_failure()
+        concurrency.record_failure()
+        concurrency.record_failure()
+
+        # Assert
+        self.assertEqual(concurrency.limit, 1)
+
+    def test_initial_limit_is_clamped(self):
+        self.assertEqual(AdaptiveConcurrency(initial=10, maximum=4).limit, 4)
+        self.assertEqual(AdaptiveConcurrency(initial=0, minimum=1).limit, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
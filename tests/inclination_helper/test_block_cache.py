@@ -0,0 +1,101 @@
+import tempfile
+import unittest
+import rasterio
+import numpy as np
+from rasterio.windows import Window
+from tests.inclination_helper import dem_fixtures
+from src.inclination_helper.block_cache import BlockCachedRaster
+
+
+class TestBlockCachedRaster(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dem_file = dem_fixtures.write_dem(self.temp_dir.name, nodata=-9999)
+        with rasterio.open(self.dem_file, 'r+') as dataset:
+            # Some nodata around a block corner, to check that masks survive the cache
+            data = dataset.read(1)
+            data[60:70, 60:70] = -9999
+            dataset.write(data, 1)
+        self.dataset = rasterio.open(self.dem_file)
+        self.raster = BlockCachedRaster(rasterio.open(self.dem_file), max_blocks=4, block_size=64)
+
+    def tearDown(self):
+        self.dataset.close()
+        self.raster.close()
+        self.temp_dir.cleanup()
+
+    def assert_same_window(self, window):
+        expected = self.dataset.read(1, window=window, masked=True)
+        result = self.raster.read(1, window=window, masked=True)
+        self.assertEqual(result.shape, expected.shape, window)
+        np.testing.assert_array_equal(np.ma.getdata(result), np.ma.getdata(expected))
+        np.testing.assert_array_equal(np.ma.getmaskarray(result), np.ma.getmaskarray(expected))
+
+    def test_windows_match_dataset_reads(self):
+        for offset in [(0, 0), (62, 62), (63, 10), (10, 127), (60, 60), (-1, -1), (-2, 100), (198, 198),
+                       (199, 5), (300, 300), (5, 300), (-5, -5)]:
+            self.assert_same_window(Window(offset[0], offset[1], 3, 3))
+
+    def test_gather_matches_dataset(self):
+        # Arrange
+        rng = np.random.default_rng(0)
+        rows = rng.integers(0, 200, (50, 3))
+        cols = rng.integers(0, 200, (50, 3))
+        expected = self.dataset.read(1, masked=True)
+
+        # Act
+        values, mask = self.raster.gather(rows, cols)
+
+        # Assert
+        np.testing.assert_array_equal(values, np.ma.getdata(expected)[rows, cols])
+        np.testing.assert_array_equal(mask, np.ma.getmaskarray(expected)[rows, cols])
+
+    def test_unmasked_read(self):
+        # Act
+        result = self.raster.read(1, window=Window(62, 62, 3, 3))
+
+        # Assert
+        self.assertNotIsInstance(result, np.ma.MaskedArray)
+        np.testing.assert_array_equal(result, self.dataset.read(1, window=Window(62, 62, 3, 3)))
+
+    def test_blocks_are_read_once(self):
+        # Act
+        self.raster.read(1, window=Window(10, 10, 3, 3), masked=True)
+        self.raster.read(1, window=Window(20, 20, 3, 3), masked=True)
+        self.raster.read(1, window=Window(62, 10, 3, 3), masked=True)
+
+        # Assert
+        self.assertEqual(self.raster.misses, 2)
+        self.assertEqual(self.raster.hits, 2)
+
+    def test_least_recently_used_blocks_are_dropped(self):
+        # Act
+        for block_row, block_col in [(0, 0), (0, 1), (0, 2), (0, 3), (0, 1), (1, 0)]:
+            self.raster.read(1, window=Window(block_col * 64 + 1, block_row * 64 + 1, 3, 3), masked=True)
+
+        # Assert
+        self.assertEqual(list(self.raster._blocks), [(0, 2), (0, 3), (0, 1), (1, 0)])
+        self.assertEqual(self.raster.misses, 5)
+
+    def test_block_shape_follows_raster_tiling(self):
+        # Act
+        raster = BlockCachedRaster(self.dataset, block_size=100)
+
+        # Assert
+        self.assertEqual((raster.block_height, raster.block_width), (128, 128))
+
+    def test_only_band_one(self):
+        with self.assertRaises(ValueError):
+            self.raster.read(2, window=Window(0, 0, 3, 3))
+
+    def test_close(self):
+        # Act
+        self.raster.close()
+
+        # Assert
+        self.assertTrue(self.raster.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from src.inclination_helper.checkpoint import JobCheckpoint
+
+
+class TestJobCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temp_dir.name, 'job_1')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_stages_survive_restarts(self):
+        # Arrange
+        checkpoint = JobCheckpoint(directory=self.directory)
+        checkpoint.complete('downloaded', '/tmp/dataset.zip')
+
+        # Act
+        resumed = JobCheckpoint(directory=self.directory)
+
+        # Assert
+        self.assertEqual(resumed.done('downloaded'), '/tmp/dataset.zip')
+        self.assertIsNone(resumed.done('zipped'))
+
+    def test_chunks(self):
+        # Arrange
+        checkpoint = JobCheckpoint(directory=self.directory)
+        checkpoint.start_chunks({'batch_size': 2})
+        features = [{'type': 'Feature', 'properties': {'incline': 0.1}}, {'type': 'Feature', 'properties': {}}]
+
+        # Act
+        checkpoint.save_chunk(0, features)
+
+        # Assert
+        resumed = JobCheckpoint(directory=self.directory)
+        resumed.start_chunks({'batch_size': 2})
+        self.assertEqual(resumed.load_chunk(0), features)
+        self.assertIsNone(resumed.load_chunk(1))
+        self.assertEqual(os.listdir(checkpoint.chunk_dir), ['00000000.jsonl'])
+
+    def test_chunks_dropped_when_fingerprint_changes(self):
+        # Arrange
+        checkpoint = JobCheckpoint(directory=self.directory)
+        checkpoint.start_chunks({'batch_size': 2})
+        checkpoint.save_chunk(0, [{'type': 'Feature'}])
+        checkpoint.complete('zipped', 'output.zip')
+
+        # Act
+        resumed = JobCheckpoint(directory=self.directory)
+        resumed.start_chunks({'batch_size': 3})
+
+        # Assert
+        self.assertIsNone(resumed.load_chunk(0))
+        self.assertIsNone(resumed.done('zipped'))
+
+    def test_collect_garbage_removes_stale_checkpoints_only(self):
+        # Arrange
+        JobCheckpoint(directory=self.directory).complete('downloaded', 'a.zip')
+        JobCheckpoint(directory=Path(self.temp_dir.name, 'job_2')).complete('downloaded', 'b.zip')
+        os.makedirs(Path(self.temp_dir.name, 'dems'))
+        Path(self.temp_dir.name, 'job_results.sqlite3').write_bytes(b'')
+        stale = time.time() - 3600
+        for path in [Path(self.directory, JobCheckpoint.FILE_NAME), self.directory,
+                     Path(self.temp_dir.name, 'dems'), Path(self.temp_dir.name, 'job_results.sqlite3')]:
+            os.utime(path, times=(stale, stale))
+
+        # Act
+        removed = JobCheckpoint.collect_garbage(directory=self.temp_dir.name, max_age=600)
+
+        # Assert
+        self.assertEqual(removed, ['job_1'])
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ['dems', 'job_2', 'job_results.sqlite3'])
+
+    def test_collect_garbage_removes_stale_jobs_without_checkpoint(self):
+        # Arrange
+        stale_job = Path(self.temp_dir.name, 'job_2')
+        os.makedirs(stale_job)
+        os.makedirs(self.directory)
+        Path(stale_job, 'b.zip').write_bytes(b'partial')
+        Path(self.directory, 'a.zip').write_bytes(b'downloading')
+        stale = time.time() - 3600
+        for path in [Path(stale_job, 'b.zip'), stale_job, self.directory]:
+            os.utime(path, times=(stale, stale))
+
+        # Act
+        removed = JobCheckpoint.collect_garbage(directory=self.temp_dir.name, max_age=600)
+
+        # Assert
+        self.assertEqual(removed, ['job_2'])
+        self.assertEqual(os.listdir(self.temp_dir.name), ['job_1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import numpy as np
+from src.inclination_helper.coverage import feature_bounds, tile_cells, bucket_by_tile
+
+
+class TestCoverage(unittest.TestCase):
+
+    def test_feature_bounds(self):
+        # Arrange
+        geometries = [
+            {'type': 'LineString', 'coordinates': [[-122.3, 47.6], [-122.2, 47.7], [-122.25, 47.65]]},
+            {'type': 'Point', 'coordinates': [-118.5, 35.5]},
+            {'type': 'LineString', 'coordinates': [[-122.3, 47.6, 10.0], [-122.1, 47.5, 12.0]]},
+            {'type': 'MultiLineString', 'coordinates': [[[-1.0, 1.0], [0.0, 2.0]], [[3.0, -1.0]]]},
+            None
+        ]
+
+        # Act
+        bounds = feature_bounds(geometries)
+
+        # Assert
+        np.testing.assert_array_equal(bounds[0], [-122.3, 47.6, -122.2, 47.7])
+        np.testing.assert_array_equal(bounds[1], [-118.5, 35.5, -118.5, 35.5])
+        np.testing.assert_array_equal(bounds[2], [-122.3, 47.5, -122.1, 47.6])
+        np.testing.assert_array_equal(bounds[3], [-1.0, -1.0, 3.0, 2.0])
+        self.assertTrue(np.isnan(bounds[4]).all())
+
+    def test_feature_bounds_empty(self):
+        self.assertEqual(feature_bounds([]).shape, (0, 4))
+
+    def test_tile_cells_single_cell(self):
+        # Act
+        cells = tile_cells([(-122.5, 47.5, -122.4, 47.6)] * 3)
+
+        # Assert
+        self.assertEqual(cells.tolist(), [[48, 123]])
+
+    def test_tile_cells_edge_crossing_tiles(self):
+        # Act
+        cells = tile_cells([(-122.5, 47.5, -121.5, 48.5)])
+
+        # Assert
+        self.assertEqual(cells.tolist(), [[48, 122], [48, 123], [49, 122], [49, 123]])
+
+    def test_tile_cells_includes_tiles_touching_boundary(self):
+        # Act
+        cells = tile_cells([(-122.0, 48.0, -122.0, 48.0)])
+
+        # Assert
+        self.assertEqual(cells.tolist(), [[48, 122], [48, 123], [49, 122], [49, 123]])
+
+    def test_tile_cells_skips_missing_bounds(self):
+        # Act
+        cells = tile_cells([(np.nan, np.nan, np.nan, np.nan)])
+
+        # Assert
+        self.assertEqual(cells.shape, (0, 2))
+
+    def test_tile_cells_large_dataset(self):
+        # Arrange
+        rng = np.random.default_rng(0)
+        minx = rng.uniform(-122.9, -121.1, 1_000_000)
+        miny = rng.uniform(47.1, 47.9, 1_000_000)
+        bounds = np.column_stack([minx, miny, minx + 0.001, miny + 0.001])
+
+        # Act
+        cells = tile_cells(bounds)
+
+        # Assert
+        self.assertEqual(cells.tolist(), [[48, 122], [48, 123]])
+
+    def test_bucket_by_tile(self):
+        # Arrange
+        bounds = np.array([
+            (-122.5, 47.5, -122.4, 47.6),  # n48w123
+            (-121.5, 47.5, -121.4, 47.6),  # n48w122
+            (-122.1, 47.5, -121.9, 47.6),  # crosses n48w123 and n48w122
+            (-122.6, 47.5, -122.5, 47.6),  # n48w123
+            (-100.5, 40.5, -100.4, 40.6),  # tile not available
+            (np.nan, np.nan, np.nan, np.nan)
+        ])
+
+        # Act
+        buckets, shared = bucket_by_tile(bounds=bounds, tiles={'n48w123', 'n48w122'})
+
+        # Assert
+        self.assertEqual(buckets, {'n48w123': [0, 3], 'n48w122': [1]})
+        self.assertEqual(shared, [(2, ['n48w122', 'n48w123']), (4, []), (5, [])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import time
+import pickle
+import unittest
+from unittest.mock import patch
+from src.inclination_helper.deadline import Deadline, JobTimeoutError
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_no_deadline(self):
+        # Arrange
+        deadline = Deadline(0)
+
+        # Act
+        deadline.check('edges')
+
+        # Assert
+        self.assertIsNone(deadline.remaining())
+        self.assertFalse(deadline.expired())
+        self.assertEqual(deadline.timeout(60), 60)
+
+    def test_check_raises_once_expired(self):
+        # Arrange
+        deadline = Deadline(10)
+
+        # Act
+        with patch('src.inclination_helper.deadline.time.time', return_value=time.time() + 11):
+            with self.assertRaises(JobTimeoutError) as context:
+                deadline.check('edges')
+
+        # Assert
+        self.assertEqual(context.exception.stage, 'edges')
+        self.assertEqual(context.exception.seconds, 10)
+        self.assertIn('10 seconds during edges', str(context.exception))
+
+    def test_timeout_capped_by_remaining_time(self):
+        # Arrange
+        deadline = Deadline(5)
+
+        # Act
+        timeout = deadline.timeout(60)
+
+        # Assert
+        self.assertLessEqual(timeout, 5)
+        self.assertGreater(timeout, 4)
+        self.assertEqual(deadline.timeout(1), 1)
+
+    def test_extend(self):
+        # Arrange
+        deadline = Deadline(10)
+        expires_at = deadline.expires_at
+
+        # Act
+        deadline.extend(30)
+
+        # Assert
+        self.assertEqual(deadline.expires_at, expires_at + 30)
+
+    def test_picklable(self):
+        # Arrange
+        deadline = Deadline(10)
+        error = JobTimeoutError(seconds=10, stage='edges')
+
+        # Act
+        copy = pickle.loads(pickle.dumps(deadline))
+        error_copy = pickle.loads(pickle.dumps(error))
+
+        # Assert
+        self.assertEqual(copy.expires_at, deadline.expires_at)
+        self.assertEqual(error_copy.stage, 'edges')
+        self.assertEqual(str(error_copy), str(error))
+
+
+if __name__ == '__main__':
+    unittest.main()
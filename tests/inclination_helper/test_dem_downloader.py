@@ -1,15 +1,101 @@
+import os
+import json
+import pickle
+import time
+import tempfile
 import unittest
+import threading
 from pathlib import Path
-from unittest.mock import patch, MagicMock, mock_open
-from src.inclination_helper.dem_downloader import DEMDownloader
+from unittest.mock import patch, MagicMock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.inclination_helper.dem_downloader import DEMDownloader, DEMDownloadError, is_valid_tile, load_ned_13_index
+from src.inclination_helper.deadline import Deadline, JobTimeoutError
+from tests.inclination_helper.test_tile_cache import run_in_fork
+
+TIFF_DATA = b'II*\x00' + b'0123456789'
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """Stand-in for the S3 endpoint: serves TIFF_DATA with ETag and Range support."""
+    etag = '"tile-v1"'
+
+    @classmethod
+    def reset(cls):
+        cls.requests = []
+        cls.ranges = []
+        cls.failures = 0
+        cls.truncate = False
+
+    def do_GET(self):
+        TileRequestHandler.requests.append(self.path)
+        if self.path.startswith('/missing/'):
+            self.send_error(404)
+            return
+        if TileRequestHandler.failures > 0:
+            TileRequestHandler.failures -= 1
+            self.send_error(503)
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == self.etag:
+            TileRequestHandler.ranges.append(range_header)
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(TIFF_DATA):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(TIFF_DATA)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(TIFF_DATA) - 1}/{len(TIFF_DATA)}')
+        else:
+            self.send_response(200)
+        body = TIFF_DATA[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        if TileRequestHandler.truncate:
+            body = body[:6]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
 
 
 class TestDEMDownloader(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), TileRequestHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
     def setUp(self):
         self.ned_13_index = ['n35w119', 'n36w119', 'n48w122']
         self.workdir = '/tmp/test_workdir'
         self.dem_downloader = DEMDownloader(ned_13_index=self.ned_13_index, workdir=self.workdir)
+        TileRequestHandler.reset()
+
+    def _local_downloader(self, workdir, retries=3, deadline=None, counted_tiles=()):
+        dem_downloader = DEMDownloader(
+            ned_13_index=self.ned_13_index,
+            workdir=workdir,
+            chunk_size=4,
+            retries=retries,
+            backoff=0.01,
+            timeout=5,
+            deadline=deadline,
+            counted_tiles=counted_tiles
+        )
+        dem_downloader.TEMPLATE = self.base_url + '/{e}.tif'
+        return dem_downloader
 
     @patch('src.inclination_helper.dem_downloader.Path.mkdir')
     def test_get_dem_dir(self, mock_mkdir):
@@ -21,7 +107,7 @@ class TestDEMDownloader(unittest.TestCase):
         self.assertEqual(str(dem_dir), f'{self.workdir}/dems')
 
     @patch('src.inclination_helper.dem_downloader.DEMDownloader.get_dem_dir', return_value=Path('/mocked/dem_dir'))
-    @patch('src.inclination_helper.dem_downloader.DEMDownloader.fetch_ned_tiles')
+    @patch('src.inclination_helper.dem_downloader.DEMDownloader.fetch_ned_tiles', return_value=[])
     def test_get_ned13_for_bounds_fetch_tile(self, mock_fetch_ned_tile, mock_get_dem_dir):
         bounds = (-122.5, 47.5, -121.5, 48.0)  # Adjusted bounds
 
@@ -41,10 +127,27 @@ class TestDEMDownloader(unittest.TestCase):
         # Assert
         self.assertNotIn('n37w121', self.dem_downloader.ned_13_tiles)
 
+    @patch('src.inclination_helper.dem_downloader.DEMDownloader.get_dem_dir', return_value=Path('/mocked/dem_dir'))
+    @patch('src.inclination_helper.dem_downloader.DEMDownloader.fetch_ned_tiles', return_value=[])
+    def test_get_ned13_for_bounds_pins_until_released(self, mock_fetch_ned_tile, mock_get_dem_dir):
+        bounds = (-122.5, 47.5, -121.5, 48.0)
+        self.dem_downloader._cache = MagicMock()
+
+        # Act
+        self.dem_downloader.get_ned13_for_bounds([bounds])
+        self.dem_downloader.release_tiles()
+
+        # Assert
+        self.dem_downloader.cache.pin.assert_called_once_with(['n48w122'])
+        self.dem_downloader.cache.record_misses.assert_called_once_with(['n48w122'])
+        self.dem_downloader.cache.unpin.assert_called_once_with({'n48w122'})
+        self.dem_downloader.cache.evict.assert_called()
+
     # Fix for FileNotFoundError: Ensure mkdir is mocked for list_ned13s and list_ned13s_full_paths
+    @patch('src.inclination_helper.dem_downloader.is_valid_tile', return_value=True)
     @patch('src.inclination_helper.dem_downloader.Path.glob')
     @patch('src.inclination_helper.dem_downloader.Path.mkdir')
-    def test_list_ned13s(self, mock_mkdir, mock_glob):
+    def test_list_ned13s(self, mock_mkdir, mock_glob, mock_is_valid_tile):
         mock_glob.return_value = [Path('/tmp/test_workdir/dems/n35w119.tif'),
                                   Path('/tmp/test_workdir/dems/n36w119.tif')]
 
@@ -55,9 +158,10 @@ class TestDEMDownloader(unittest.TestCase):
         mock_mkdir.assert_called_once_with(exist_ok=True)  # Ensure the directory is created
         self.assertEqual(result, ['n35w119', 'n36w119'])
 
+    @patch('src.inclination_helper.dem_downloader.is_valid_tile', return_value=True)
     @patch('src.inclination_helper.dem_downloader.Path.glob')
     @patch('src.inclination_helper.dem_downloader.Path.mkdir')
-    def test_list_ned13s_full_paths(self, mock_mkdir, mock_glob):
+    def test_list_ned13s_full_paths(self, mock_mkdir, mock_glob, mock_is_valid_tile):
         mock_glob.return_value = [Path('/tmp/test_workdir/dems/n35w119.tif'),
                                   Path('/tmp/test_workdir/dems/n36w119.tif')]
         self.dem_downloader.ned_13_tiles = ['n35w119', 'n36w119']
@@ -69,26 +173,380 @@ class TestDEMDownloader(unittest.TestCase):
         mock_mkdir.assert_called_once_with(exist_ok=True)  # Ensure the directory is created
         self.assertEqual(result, ['/tmp/test_workdir/dems/n35w119.tif', '/tmp/test_workdir/dems/n36w119.tif'])
 
-    # Fix for file write not being called
-    @patch('src.inclination_helper.dem_downloader.requests.get')
-    @patch('src.inclination_helper.dem_downloader.open', new_callable=mock_open)
-    @patch('src.inclination_helper.dem_downloader.Path.mkdir')
-    def test_fetch_ned_tile_success(self, mock_mkdir, mock_open_file, mock_requests_get):
+    def test_fetch_ned_tile_success(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+
+            # Act
+            failed_tiles = dem_downloader.fetch_ned_tiles(['n36w119', 'n35w119'])
+
+            # Assert
+            self.assertEqual(failed_tiles, [])
+            self.assertEqual(Path(workdir, 'dems', 'n36w119.tif').read_bytes(), TIFF_DATA)
+            self.assertFalse(Path(workdir, 'dems', 'n36w119.tif.part').exists())
+            self.assertEqual(sorted(dem_downloader.list_ned13s()), ['n35w119', 'n36w119'])
+            self.assertEqual(sorted(TileRequestHandler.requests), ['/n35w119.tif', '/n36w119.tif'])
+
+    @patch('src.inclination_helper.dem_downloader.transcode_tile')
+    def test_fetch_ned_tile_transcodes_before_caching(self, mock_transcode_tile):
+        def transcode(source, path, tile_format, quantize=False):
+            # The tile must not be visible before it is transcoded
+            self.assertFalse(path.exists())
+            with open(source, 'ab') as f:
+                f.write(b'transcoded')
+
+        mock_transcode_tile.side_effect = transcode
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_downloader.tile_format = 'tiled'
+            dem_downloader.quantize = True
+
+            # Act
+            failed_tiles = dem_downloader.fetch_ned_tiles(['n36w119'])
+
+            # Assert
+            path = Path(workdir, 'dems', 'n36w119.tif')
+            self.assertEqual(failed_tiles, [])
+            mock_transcode_tile.assert_called_once_with(source=Path(f'{path}.part'), path=path, tile_format='tiled',
+                                                        quantize=True)
+            with open(f'{path}.json') as f:
+                meta = json.load(f)
+            self.assertEqual(meta['format'], 'tiled')
+            self.assertEqual(meta['size'], len(TIFF_DATA) + len(b'transcoded'))
+            self.assertTrue(is_valid_tile(path))
+
+    @patch('src.inclination_helper.dem_downloader.transcode_tile')
+    def test_fetch_ned_tile_does_not_resume_interrupted_transcode(self, mock_transcode_tile):
+        def interrupted_transcode(source, path, tile_format, quantize=False):
+            # The .part file is rewritten, then the process is killed
+            source.write_bytes(b'half transcoded')
+            raise KeyboardInterrupt
+
+        mock_transcode_tile.side_effect = interrupted_transcode
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_downloader.tile_format = 'tiled'
+            with self.assertRaises(KeyboardInterrupt):
+                dem_downloader.download_tile('n36w119')
+            path = Path(workdir, 'dems', 'n36w119.tif')
+            self.assertFalse(Path(f'{path}.part.json').exists())
+            TileRequestHandler.ranges = []
+            mock_transcode_tile.side_effect = None
+
+            # Act
+            dem_downloader.download_tile('n36w119')
+
+            # Assert
+            self.assertEqual(TileRequestHandler.ranges, [])
+            self.assertEqual(path.read_bytes(), TIFF_DATA)
+
+    def test_fetch_ned_tile_retries_transient_errors(self):
         # Arrange
-        mock_response = MagicMock()
-        mock_response.iter_content = MagicMock(return_value=[b'data_chunk'])
-        mock_requests_get.return_value.__enter__.return_value = mock_response
+        TileRequestHandler.failures = 2
+
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+
+            # Act
+            failed_tiles = dem_downloader.fetch_ned_tiles(['n36w119'])
+
+            # Assert
+            self.assertEqual(failed_tiles, [])
+            self.assertEqual(len(TileRequestHandler.requests), 3)
+            self.assertEqual(Path(workdir, 'dems', 'n36w119.tif').read_bytes(), TIFF_DATA)
+
+    def test_fetch_ned_tile_reports_missing_tiles(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_downloader.TEMPLATE = self.base_url + '/missing/{e}.tif'
+
+            # Act
+            failed_tiles = dem_downloader.fetch_ned_tiles(['n36w119'])
+
+            # Assert
+            self.assertEqual(failed_tiles, ['n36w119'])
+            self.assertEqual(len(TileRequestHandler.requests), 1)  # 404 is not retried
+
+    def test_get_ned13_for_bounds_raises_for_failed_tiles(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_downloader.TEMPLATE = self.base_url + '/missing/{e}.tif'
+
+            # Act
+            with self.assertRaises(DEMDownloadError) as context:
+                dem_downloader.get_ned13_for_bounds([(-118.5, 35.2, -118.4, 35.3)])
+
+            # Assert
+            self.assertEqual(context.exception.tiles, ['n36w119'])
 
+    def test_forked_process_does_not_reuse_session(self):
+        # Arrange
+        session = DEMDownloader.get_session()
+
+        def child():
+            assert DEMDownloader._session is None
+            assert DEMDownloader.get_session() is not session
+            assert not DEMDownloader._downloads.in_flight('n48w123')
+
+        with DEMDownloader._session_lock:
+            # Held by another thread when the process forks
+            DEMDownloader._downloads._calls['n48w123'] = MagicMock()
+            try:
+                # Act
+                exit_code = run_in_fork(child)
+            finally:
+                DEMDownloader._downloads._calls.pop('n48w123')
+
+        # Assert
+        self.assertEqual(exit_code, 0)
+        self.assertIs(DEMDownloader.get_session(), session)
+
+    def test_download_error_pickles(self):
         # Act
-        self.dem_downloader.fetch_ned_tiles(['n36w119'])
+        error = pickle.loads(pickle.dumps(DEMDownloadError(['n48w123', 'n36w119'])))
 
         # Assert
-        mock_requests_get.assert_called_once_with(
-            'https://prd-tnm.s3.amazonaws.com/StagedProducts/Elevation/13/TIFF/current/n36w119/USGS_13_n36w119.tif',
-            stream=True
-        )
-        mock_open_file.assert_called_once_with(Path('/tmp/test_workdir/dems/n36w119.tif'), 'wb')
-        mock_open_file().write.assert_called_once_with(b'data_chunk')
+        self.assertEqual(error.tiles, ['n36w119', 'n48w123'])
+        self.assertEqual(str(error), 'Failed to download DEM tiles: n36w119, n48w123')
+
+    def test_fetch_ned_tile_resumes_partial_download(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_dir = dem_downloader.get_dem_dir()
+            Path(dem_dir, 'n36w119.tif.part').write_bytes(TIFF_DATA[:6])
+            Path(dem_dir, 'n36w119.tif.part.json').write_text(json.dumps({'etag': TileRequestHandler.etag}))
+
+            # Act
+            dem_downloader.download_tile('n36w119')
+
+            # Assert
+            self.assertEqual(TileRequestHandler.ranges, ['bytes=6-'])
+            self.assertEqual(Path(dem_dir, 'n36w119.tif').read_bytes(), TIFF_DATA)
+
+    def test_fetch_ned_tile_finalizes_complete_partial_download(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_dir = dem_downloader.get_dem_dir()
+            Path(dem_dir, 'n36w119.tif.part').write_bytes(TIFF_DATA)
+            Path(dem_dir, 'n36w119.tif.part.json').write_text(json.dumps({'etag': TileRequestHandler.etag}))
+
+            # Act
+            dem_downloader.download_tile('n36w119')
+
+            # Assert
+            self.assertEqual(TileRequestHandler.ranges, [f'bytes={len(TIFF_DATA)}-'])
+            self.assertEqual(len(TileRequestHandler.requests), 1)
+            self.assertEqual(Path(dem_dir, 'n36w119.tif').read_bytes(), TIFF_DATA)
+            self.assertFalse(Path(dem_dir, 'n36w119.tif.part.json').exists())
+
+    def test_fetch_ned_tile_restarts_partial_download_longer_than_remote(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_dir = dem_downloader.get_dem_dir()
+            Path(dem_dir, 'n36w119.tif.part').write_bytes(TIFF_DATA + b'junk')
+            Path(dem_dir, 'n36w119.tif.part.json').write_text(json.dumps({'etag': TileRequestHandler.etag}))
+
+            # Act
+            dem_downloader.download_tile('n36w119')
+
+            # Assert
+            self.assertEqual(len(TileRequestHandler.requests), 2)
+            self.assertEqual(Path(dem_dir, 'n36w119.tif').read_bytes(), TIFF_DATA)
+
+    def test_fetch_ned_tile_restarts_when_remote_changed(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+            dem_dir = dem_downloader.get_dem_dir()
+            Path(dem_dir, 'n36w119.tif.part').write_bytes(b'stale!')
+            Path(dem_dir, 'n36w119.tif.part.json').write_text(json.dumps({'etag': '"old"'}))
+
+            # Act
+            dem_downloader.download_tile('n36w119')
+
+            # Assert
+            self.assertEqual(Path(dem_dir, 'n36w119.tif').read_bytes(), TIFF_DATA)
+
+    def test_fetch_ned_tile_truncated_download_is_not_cached(self):
+        # Arrange
+        TileRequestHandler.truncate = True
+
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir, retries=0)
+
+            # Act
+            with self.assertRaises(IOError):
+                dem_downloader.download_tile('n36w119')
+
+            # Assert
+            self.assertFalse(Path(workdir, 'dems', 'n36w119.tif').exists())
+            self.assertTrue(Path(workdir, 'dems', 'n36w119.tif.part').exists())
+            self.assertEqual(dem_downloader.list_ned13s(), [])
+
+    def test_fetch_ned_tile_stops_at_deadline(self):
+        # Arrange
+        deadline = Deadline(60)
+        check = deadline.check
+        checks = []
+
+        def expire_after_second_chunk(stage):
+            checks.append(stage)
+            if len(checks) == 3:
+                deadline.expires_at = time.time() - 1
+            check(stage)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir, deadline=deadline)
+            with patch.object(deadline, 'check', side_effect=expire_after_second_chunk):
+
+                # Act
+                with self.assertRaises(JobTimeoutError):
+                    dem_downloader.download_tile('n36w119')
+
+            # Assert
+            self.assertEqual(len(TileRequestHandler.requests), 1)  # Not retried
+            self.assertFalse(Path(workdir, 'dems', 'n36w119.tif').exists())
+            self.assertEqual(Path(workdir, 'dems', 'n36w119.tif.part').read_bytes(), TIFF_DATA[:8])
+
+    def test_get_ned13_for_bounds_raises_once_deadline_expired(self):
+        # Arrange
+        deadline = Deadline(60)
+        deadline.expires_at -= 61
+
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir, deadline=deadline)
+
+            # Act
+            with self.assertRaises(JobTimeoutError) as context:
+                dem_downloader.get_ned13_for_bounds([(-118.5, 35.2, -118.4, 35.3)])
+
+            # Assert
+            self.assertEqual(context.exception.stage, 'tile downloads')
+            self.assertEqual(TileRequestHandler.requests, [])
+
+    def test_prefetch_fetches_and_pins_tiles(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir)
+
+            # Act
+            dem_downloader.prefetch(['n36w119', 'n99w999'])
+            dem_downloader.prefetch(['n36w119'])
+
+            # Assert
+            self.assertEqual(TileRequestHandler.requests, ['/n36w119.tif'])
+            self.assertEqual(dem_downloader.ned_13_tiles, {'n36w119'})
+            self.assertEqual(dem_downloader.usage.counts(), {'n36w119': 1})
+            self.assertTrue(dem_downloader.cache.is_pinned('n36w119'))
+            dem_downloader.release_tiles()
+            self.assertFalse(dem_downloader.cache.is_pinned('n36w119'))
+
+    def test_computation_does_not_count_prefetched_tiles_again(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            # Arrange
+            service_downloader = self._local_downloader(workdir)
+            service_downloader.prefetch(['n36w119'])
+            job_downloader = self._local_downloader(workdir, counted_tiles=service_downloader.ned_13_tiles)
+
+            # Act
+            job_downloader.get_ned13_for_bounds([(-118.5, 35.2, -118.4, 35.3), (-118.5, 34.2, -118.4, 34.3)])
+
+            # Assert
+            self.assertEqual(job_downloader.ned_13_tiles, {'n35w119', 'n36w119'})
+            self.assertEqual(job_downloader.usage.counts(), {'n36w119': 1, 'n35w119': 1})
+            self.assertEqual(job_downloader.cache.stats()['hits'], 0)
+            service_downloader.release_tiles()
+            job_downloader.release_tiles()
+
+    def test_warm_downloads_without_resolving(self):
+        # Arrange
+        TileRequestHandler.failures = 10
+
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_downloader = self._local_downloader(workdir, retries=0)
+
+            # Act
+            failed_tiles = dem_downloader.warm(['n36w119', 'n99w999'])
+            TileRequestHandler.failures = 0
+            dem_downloader.warm(['n36w119'])
+            dem_downloader.warm(['n36w119'])
+
+            # Assert
+            self.assertEqual(failed_tiles, ['n36w119'])
+            self.assertEqual(TileRequestHandler.requests, ['/n36w119.tif'] * 2)
+            self.assertEqual(dem_downloader.list_ned13s(), ['n36w119'])
+            self.assertEqual(dem_downloader.ned_13_tiles, set())
+            self.assertFalse(dem_downloader.cache.is_pinned('n36w119'))
+
+    def test_get_ned13_for_bounds_deduplicates_cells(self):
+        # Arrange
+        bounds = [(-118.5, 35.2, -118.4, 35.3)] * 1000 + [(-118.5, 34.2, -118.4, 34.3)]
+        self.dem_downloader._cache = MagicMock()
+
+        with patch.object(DEMDownloader, 'list_ned13s', return_value=['n36w119', 'n35w119']):
+            # Act
+            self.dem_downloader.get_ned13_for_bounds(bounds)
+
+        # Assert
+        self.assertEqual(self.dem_downloader.ned_13_tiles, {'n35w119', 'n36w119'})
+        self.dem_downloader.cache.record_hits.assert_called_once_with(['n35w119', 'n36w119'])
+
+    def test_load_ned_13_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, 'ned_13_index.json')
+            with open(index_path, 'w') as f:
+                json.dump({'tiles': ['n35w119', 'n36w119']}, f)
+
+            # Act
+            index = load_ned_13_index(index_path)
+
+            # Assert
+            self.assertEqual(index, frozenset(['n35w119', 'n36w119']))
+            self.assertIs(load_ned_13_index(index_path), index)
+
+    def test_get_session_is_shared(self):
+        self.assertIs(DEMDownloader.get_session(), DEMDownloader.get_session())
+
+    def test_is_valid_tile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tile = Path(directory, 'n36w119.tif')
+            not_a_tile = Path(directory, 'n35w119.tif')
+            tile.write_bytes(TIFF_DATA)
+            not_a_tile.write_bytes(b'<html>error</html>')
+
+            # Act and Assert
+            self.assertTrue(is_valid_tile(tile))
+            self.assertFalse(is_valid_tile(not_a_tile))
+            Path(directory, 'n36w119.tif.json').write_text(json.dumps({'size': 100}))
+            self.assertFalse(is_valid_tile(tile))
+
+    @patch('src.inclination_helper.dem_downloader.DEMDownloader._fetch_tile')
+    def test_download_tile_single_flight(self, mock_fetch_tile):
+        # Arrange
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_fetch(tile_name, path):
+            started.set()
+            release.wait(timeout=5)
+            path.write_bytes(TIFF_DATA)
+
+        mock_fetch_tile.side_effect = slow_fetch
+        with tempfile.TemporaryDirectory() as workdir:
+            first = DEMDownloader(ned_13_index=self.ned_13_index, workdir=workdir)
+            second = DEMDownloader(ned_13_index=self.ned_13_index, workdir=workdir)
+
+            # Act
+            leader = threading.Thread(target=first.download_tile, args=('n36w119',))
+            leader.start()
+            started.wait(timeout=5)
+            follower = threading.Thread(target=second.download_tile, args=('n36w119',))
+            follower.start()
+            release.set()
+            leader.join(timeout=5)
+            follower.join(timeout=5)
+
+            # Assert
+            mock_fetch_tile.assert_called_once()
+            self.assertTrue(Path(workdir, 'dems', 'n36w119.tif').exists())
 
     def test_fetch_ned_tile_invalid_tile(self):
         ned_13_index = []
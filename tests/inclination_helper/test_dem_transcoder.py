@@ -0,0 +1,142 @@
+import json
+import shutil
+import tempfile
+import unittest
+import rasterio
+import numpy as np
+from pathlib import Path
+from rasterio.windows import Window
+from tests.inclination_helper import dem_fixtures
+from src.inclination_helper.block_cache import BlockCachedRaster
+from src.inclination_helper.incline_calculator import InclineCalculator
+from src.inclination_helper.dem_transcoder import transcode_tile, open_dem, npy_paths, MappedRaster, \
+    TileRangeError, QUANTIZED_NODATA
+
+WINDOWS = [Window(0, 0, 3, 3), Window(62, 62, 3, 3), Window(60, 60, 3, 3), Window(-1, -1, 3, 3),
+           Window(198, 198, 3, 3), Window(199, 5, 3, 3), Window(300, 300, 3, 3), Window(5, 300, 3, 3)]
+
+
+class TestDEMTranscoder(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        source_dir = Path(self.temp_dir.name, 'source')
+        source_dir.mkdir()
+        self.source = dem_fixtures.write_dem(source_dir, nodata=-9999)
+        with rasterio.open(self.source, 'r+') as dataset:
+            data = dataset.read(1)
+            data[60:70, 60:70] = -9999
+            dataset.write(data, 1)
+        self.path = Path(self.temp_dir.name, 'n48w123.tif')
+        shutil.copy(self.source, self.path)
+        self.dataset = rasterio.open(self.source)
+
+    def tearDown(self):
+        self.dataset.close()
+        self.temp_dir.cleanup()
+
+    def assert_windows(self, raster, decimal=None):
+        for window in WINDOWS:
+            expected = self.dataset.read(1, window=window, masked=True)
+            result = raster.read(1, window=window, masked=True)
+            self.assertEqual(result.shape, expected.shape, window)
+            np.testing.assert_array_equal(np.ma.getmaskarray(result), np.ma.getmaskarray(expected))
+            if decimal is None:
+                np.testing.assert_array_equal(result.compressed(), expected.compressed())
+            else:
+                np.testing.assert_allclose(result.compressed(), expected.compressed(), atol=decimal)
+
+    def test_tiled(self):
+        # Act
+        transcode_tile(source=self.path, path=self.path, tile_format='tiled')
+
+        # Assert
+        with rasterio.open(self.path) as dataset:
+            self.assertEqual(dataset.block_shapes[0], (256, 256))
+            self.assertEqual(dataset.compression.value, 'DEFLATE')
+            self.assertEqual(dataset.dtypes[0], 'float32')
+            self.assert_windows(BlockCachedRaster(dataset))
+        self.assertEqual(sorted(p.name for p in self.path.parent.iterdir()), ['n48w123.tif', 'source'])
+
+    def test_tiled_quantized(self):
+        # Act
+        transcode_tile(source=self.path, path=self.path, tile_format='tiled', quantize=True)
+
+        # Assert
+        with rasterio.open(self.path) as dataset:
+            self.assertEqual(dataset.dtypes[0], 'int16')
+            self.assertEqual(dataset.nodata, QUANTIZED_NODATA)
+            self.assertEqual(dataset.scales[0], 0.1)
+            self.assert_windows(BlockCachedRaster(dataset), decimal=0.0501)
+
+    def test_npy(self):
+        # Act
+        transcode_tile(source=self.path, path=self.path, tile_format='npy')
+
+        # Assert
+        npy_path, meta_path = npy_paths(self.path)
+        self.assertTrue(npy_path.exists())
+        with open(meta_path) as f:
+            self.assertEqual(json.load(f)['transform'], list(self.dataset.transform)[:6])
+        raster = open_dem(self.path)
+        self.assertIsInstance(raster, MappedRaster)
+        self.assert_windows(raster)
+        raster.close()
+        self.assertTrue(raster.closed)
+
+    def test_npy_quantized(self):
+        # Act
+        transcode_tile(source=self.path, path=self.path, tile_format='npy', quantize=True)
+
+        # Assert
+        npy_path, _ = npy_paths(self.path)
+        self.assertEqual(np.load(npy_path, mmap_mode='r').dtype, np.int16)
+        self.assert_windows(open_dem(self.path), decimal=0.0501)
+
+    def test_npy_inclines_match_geotiff(self):
+        # Arrange
+        features = dem_fixtures.sample_edges()
+        expected = InclineCalculator()
+        result = InclineCalculator()
+
+        # Act
+        transcode_tile(source=self.path, path=self.path, tile_format='npy')
+
+        # Assert
+        for feature in features:
+            self.assertEqual(
+                result.incline(geometry=feature['geometry'], dem_files=[str(self.path)]),
+                expected.incline(geometry=feature['geometry'], dem_files=[self.source])
+            )
+        self.assertIsInstance(result._datasets[str(self.path)], MappedRaster)
+        expected.close()
+        result.close()
+
+    def test_quantize_out_of_range(self):
+        # Arrange
+        with rasterio.open(self.path, 'r+') as dataset:
+            data = dataset.read(1)
+            data[0, 0] = 8000
+            dataset.write(data, 1)
+
+        # Act and Assert
+        with self.assertRaises(TileRangeError):
+            transcode_tile(source=self.path, path=self.path, tile_format='tiled', quantize=True)
+        self.assertFalse(Path(f'{self.path}.transcode').exists())
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            transcode_tile(source=self.path, path=self.path, tile_format='png')
+
+    def test_open_dem_without_npy(self):
+        # Act
+        raster = open_dem(self.path, max_blocks=2)
+
+        # Assert
+        self.assertIsInstance(raster, BlockCachedRaster)
+        self.assertEqual(raster.max_blocks, 2)
+        raster.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import io
+import os
+import json
+import tempfile
+import unittest
+from src.inclination_helper.geojson_stream import GeoJSONFeatureReader, FeatureCollectionWriter, iter_features
+
+
+class TestGeoJSONStream(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.features = [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': [[-122.3, 47.6], [-122.2, 47.7]]},
+                'properties': {'_id': str(i), 'length': 12.5 * i, 'name': 'Street, "North"'}
+            }
+            for i in range(25)
+        ]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, content):
+        path = os.path.join(self.temp_dir.name, 'edges.geojson')
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_reads_all_features_with_small_buffer(self):
+        # Arrange
+        path = self._write(json.dumps({
+            'type': 'FeatureCollection',
+            'features': self.features,
+            '$schema': 'https://sidewalks.washington.edu/opensidewalks/0.2/schema.json'
+        }, indent=2))
+        reader = GeoJSONFeatureReader(path=path, buffer_size=7)
+
+        # Act
+        features = list(reader)
+
+        # Assert
+        self.assertEqual(features, self.features)
+        self.assertEqual(reader.members['type'], 'FeatureCollection')
+        self.assertEqual(reader.members['$schema'], 'https://sidewalks.washington.edu/opensidewalks/0.2/schema.json')
+
+    def test_reads_members_after_features(self):
+        # Arrange
+        path = self._write('{"features": [], "count": 12345}')
+        reader = GeoJSONFeatureReader(path=path, buffer_size=3)
+
+        # Act
+        features = list(reader)
+
+        # Assert
+        self.assertEqual(features, [])
+        self.assertEqual(reader.members, {'count': 12345})
+
+    def test_iter_features(self):
+        # Arrange
+        path = self._write(json.dumps({'type': 'FeatureCollection', 'features': self.features}))
+
+        # Act
+        count = sum(1 for _ in iter_features(path, buffer_size=64))
+
+        # Assert
+        self.assertEqual(count, 25)
+
+    def test_truncated_file_raises(self):
+        # Arrange
+        content = json.dumps({'type': 'FeatureCollection', 'features': self.features})
+        path = self._write(content[:len(content) // 2])
+
+        # Act and Assert
+        with self.assertRaises(ValueError):
+            list(iter_features(path, buffer_size=64))
+
+    def test_writer_round_trip(self):
+        # Arrange
+        output = io.StringIO()
+
+        # Act
+        with FeatureCollectionWriter(output) as writer:
+            writer.members = {'type': 'FeatureCollection', '$schema': 'schema.json'}
+            for feature in self.features:
+                writer.write(feature)
+
+        # Assert
+        result = json.loads(output.getvalue())
+        self.assertEqual(writer.count, 25)
+        self.assertEqual(result['type'], 'FeatureCollection')
+        self.assertEqual(result['features'], self.features)
+        self.assertEqual(result['$schema'], 'schema.json')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,18 @@
+import io
 import os
 import json
+import time
+import zipfile
+import rasterio
+import tempfile
 import unittest
+from pathlib import Path
 from unittest.mock import patch, MagicMock, mock_open
+from tests.inclination_helper import dem_fixtures
 from src.inclination_helper.inclination import Inclination
+from src.inclination_helper.shared_tiles import SharedTileRegistry
+from src.inclination_helper.checkpoint import JobCheckpoint
+from src.inclination_helper.deadline import Deadline, JobTimeoutError
 
 
 class TestInclination(unittest.TestCase):
@@ -33,60 +43,345 @@ class TestInclination(unittest.TestCase):
         mock_exists.assert_called_once_with(inclination.download_dir)
         mock_core.return_value.get_storage_client.assert_called_once()
 
-    @patch('src.inclination_helper.inclination.open', new_callable=mock_open)
-    @patch('src.inclination_helper.inclination.create_zip')
-    @patch('src.inclination_helper.inclination.OSWIncline')
+    @patch('src.inclination_helper.inclination.load_ned_13_index', return_value=frozenset(['n48w123']))
+    @patch('src.inclination_helper.inclination.DEMDownloader')
+    @patch('src.inclination_helper.inclination.Core')
+    def test_calculate_inclination(self, mock_core, mock_dem_downloader, mock_load_ned_13_index):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            dem_dir = os.path.join(directory, 'dems')
+            os.makedirs(dem_dir)
+            dem_fixtures.write_dem(dem_dir)
+            nodes_path, edges_path = dem_fixtures.write_dataset(directory, dem_fixtures.sample_edges(count=30))
+            # Downloaded under the name of the dataset, like the output
+            archive_path = os.path.join(directory, self.prefix, 'test.zip')
+            os.makedirs(os.path.dirname(archive_path))
+            with zipfile.ZipFile(archive_path, 'w') as archive:
+                archive.write(nodes_path, os.path.basename(nodes_path))
+                archive.write(edges_path, os.path.basename(edges_path))
+            mock_dem_downloader.return_value.get_dem_dir.return_value = Path(dem_dir)
+            mock_dem_downloader.return_value.get_ned13_for_bounds.return_value = ['n48w123']
+
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+            inclination.download_dir = directory
+            inclination.download_file = MagicMock(return_value=archive_path)
+
+            # Act
+            with patch.object(Inclination._config, 'incline_batch_size', 7):
+                result = inclination.calculate()
+
+            # Assert
+            self.assertEqual(result, os.path.join(directory, self.prefix, 'output', inclination.updated_file_name))
+            # The downloaded archive is left as it is for a redelivery of the job
+            with zipfile.ZipFile(archive_path) as archive:
+                self.assertEqual(archive.read('test.edges.geojson'), Path(edges_path).read_bytes())
+            self.assertEqual(inclination.checkpoint.done('downloaded'), archive_path)
+            with zipfile.ZipFile(result) as output:
+                self.assertEqual(sorted(output.namelist()), ['test.edges.geojson', 'test.nodes.geojson'])
+                edges = json.loads(output.read('test.edges.geojson'))
+                nodes = json.loads(output.read('test.nodes.geojson'))
+            self.assertEqual(len(edges['features']), 30)
+            self.assertEqual(len(nodes['features']), 60)
+            self.assertTrue(all(isinstance(feature['properties']['_id'], str) for feature in nodes['features']))
+            self.assertTrue(all('incline' in feature['properties'] for feature in edges['features']))
+            # 30 edges in batches of 7
+            self.assertEqual(mock_dem_downloader.return_value.get_ned13_for_bounds.call_count, 5)
+            mock_dem_downloader.return_value.release_tiles.assert_called_once()
+            mock_load_ned_13_index.assert_called_once_with(f'{inclination.root_path}/ned_13_index.json')
+
+    @patch('src.inclination_helper.inclination.Inclination.incline_edges', side_effect=Exception('Tile error'))
     @patch('src.inclination_helper.inclination.DEMDownloader')
-    @patch('src.inclination_helper.inclination.Path')
     @patch('src.inclination_helper.inclination.unzip')
     @patch('src.inclination_helper.inclination.Core')
-    def test_calculate_inclination(self, mock_core, mock_unzip, mock_path, mock_dem_downloader, mock_osw_incline,
-                                   mock_create_zip, mock_open):
-        # Arrange
-        # Mock for the 'ned_13_index.json' file
-        ned_13_index_content = json.dumps({"tiles": ["tile1", "tile2"]})
-
-        # Mock for the 'edges' file content with valid geometry
-        edge_file_content = json.dumps({
-            "features": [
-                {
-                    "geometry": {
-                        "type": "Point",
-                        "coordinates": [100.0, 0.0]
-                    }
-                }
-            ]
-        })
-
-        # Set up the mock 'open' to return correct content when 'read' is called
-        mock_open().read.side_effect = [ned_13_index_content, edge_file_content]
+    def test_calculate_inclination_releases_tiles_on_error(self, mock_core, mock_unzip, mock_dem_downloader,
+                                                           mock_incline_edges):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            mock_unzip.return_value = ({'edges': 'edges_file_path'}, ['edges_file_path'])
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+            inclination.download_dir = directory
+            os.makedirs(os.path.join(directory, self.prefix))
+            inclination.download_file = MagicMock(return_value='downloaded.zip')
 
-        mock_storage_client = MagicMock()
-        mock_core.return_value.get_storage_client.return_value = mock_storage_client
+            # Act and Assert
+            with self.assertRaises(Exception):
+                inclination.calculate()
+            mock_dem_downloader.return_value.release_tiles.assert_called_once()
 
-        # Mocking unzip to return file paths for nodes and edges
-        mock_unzip.return_value = (
-            {'nodes': 'nodes_file_path', 'edges': 'edges_file_path'},
-            ['nodes_file_path', 'edges_file_path']
-        )
+    def test_rewrite_nodes_like_osw_incline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            nodes_path = Path(directory, 'test.nodes.geojson')
+            point = {'type': 'Point', 'coordinates': [-122.3, 47.6]}
+            with open(nodes_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', '$schema': 'schema.json', 'features': [
+                    {'type': 'Feature', 'geometry': point,
+                     'properties': {'_id': 1, 'osm_id': 10, 'lon': -122.3, 'lat': 47.6, 'barrier': 'kerb'}},
+                    {'type': 'Feature', 'geometry': point, 'properties': {'_id': '2', 'is_point': True}},
+                    {'type': 'Feature', 'geometry': point, 'properties': {'_id': '3'}}
+                ]}, f)
+            output = io.StringIO()
 
-        mock_osw_incline.return_value.calculate.return_value = True
-        mock_create_zip.return_value = 'output.zip'
+            # Act
+            count = Inclination.rewrite_nodes(nodes_path=nodes_path, output=output)
 
-        inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+            # Assert
+            nodes = json.loads(output.getvalue())
+            self.assertEqual(count, 2)
+            self.assertEqual(nodes['$schema'], 'schema.json')
+            self.assertEqual([feature['properties'] for feature in nodes['features']],
+                             [{'_id': '1', 'barrier': 'kerb'}, {'_id': '3'}])
+            self.assertEqual(nodes['features'][0]['geometry'], point)
 
-        # Act
-        result = inclination.calculate()
+    @patch('src.inclination_helper.inclination.Core')
+    def test_incline_edges(self, mock_core):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            dem_fixtures.write_dem(directory)
+            features = dem_fixtures.sample_edges(count=20)
+            features.append({'type': 'Feature', 'geometry': None, 'properties': {'_id': 'no-geometry'}})
+            edges_path = os.path.join(directory, 'test.edges.geojson')
+            with open(edges_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            dem_downloader = MagicMock()
+            dem_downloader.get_dem_dir.return_value = Path(directory)
+            dem_downloader.get_ned13_for_bounds.return_value = ['n48w123']
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
 
-        # Assert
-        self.assertEqual(result, 'output.zip')
-        mock_unzip.assert_called_once()
-        mock_create_zip.assert_called_once_with(
-            files=['nodes_file_path', 'edges_file_path'],
-            zip_file_path=os.path.join(inclination.download_dir, f'{self.prefix}/{inclination.updated_file_name}')
-        )
-        mock_osw_incline.return_value.calculate.assert_called_once()
-        mock_dem_downloader.return_value.get_ned13_for_bounds.assert_called()
+            output_path = os.path.join(directory, 'output.geojson')
+
+            # Act
+            with open(output_path, 'w') as output:
+                count = inclination.incline_edges(
+                    edges_path=Path(edges_path),
+                    dem_downloader=dem_downloader,
+                    output=output,
+                    batch_size=4
+                )
+
+            # Assert
+            self.assertEqual(count, 21)
+            inclines = dem_fixtures.read_inclines(output_path)
+            self.assertEqual(len(inclines), 21)
+            self.assertIsNone(inclines['no-geometry'])
+            self.assertTrue(all(inclines[str(i)] is not None for i in range(20)))
+            self.assertEqual(dem_downloader.get_ned13_for_bounds.call_count, 6)
+
+    @patch('src.inclination_helper.inclination.Core')
+    def test_incline_edges_opens_each_tile_once(self, mock_core):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            dem_fixtures.write_dem(directory, tile='n48w123')
+            dem_fixtures.write_dem(directory, tile='n48w122')
+            features = dem_fixtures.sample_edges(count=10, west=-122.98, east=-122.02)
+            features += dem_fixtures.sample_edges(count=10, seed=1, west=-121.98, east=-121.02)
+            for i, feature in enumerate(features):
+                feature['properties']['_id'] = str(i)
+            edges_path = os.path.join(directory, 'test.edges.geojson')
+            with open(edges_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            dem_downloader = MagicMock()
+            dem_downloader.get_dem_dir.return_value = Path(directory)
+            dem_downloader.get_ned13_for_bounds.return_value = ['n48w122', 'n48w123']
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+
+            # Act
+            with patch('src.inclination_helper.dem_transcoder.rasterio.open',
+                       wraps=rasterio.open) as mock_rasterio_open, open(os.devnull, 'w') as output:
+                inclination.incline_edges(
+                    edges_path=Path(edges_path),
+                    dem_downloader=dem_downloader,
+                    output=output,
+                    batch_size=3
+                )
+
+            # Assert
+            opened = [call.args[0] for call in mock_rasterio_open.call_args_list]
+            self.assertEqual(sorted(opened), sorted([
+                os.path.join(directory, 'n48w123.tif'),
+                os.path.join(directory, 'n48w122.tif')
+            ]))
+
+    @patch('src.inclination_helper.inclination.Core')
+    def test_incline_edges_parallel_matches_serial(self, mock_core):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            dem_fixtures.write_dem(directory, tile='n48w123')
+            dem_fixtures.write_dem(directory, tile='n48w122')
+            features = dem_fixtures.sample_edges(count=15, west=-122.98, east=-122.02)
+            features += dem_fixtures.sample_edges(count=15, seed=1, west=-122.5, east=-121.5)
+            for i, feature in enumerate(features):
+                feature['properties']['_id'] = str(i)
+            edges_path = os.path.join(directory, 'test.edges.geojson')
+            with open(edges_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            dem_downloader = MagicMock()
+            dem_downloader.get_dem_dir.return_value = Path(directory)
+            dem_downloader.get_ned13_for_bounds.return_value = ['n48w122', 'n48w123']
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+            serial_path = os.path.join(directory, 'serial.geojson')
+            parallel_path = os.path.join(directory, 'parallel.geojson')
+
+            shared_path = os.path.join(directory, 'shared.geojson')
+
+            # Act
+            with patch.object(Inclination._config, 'incline_cache', False):
+                with open(serial_path, 'w') as output:
+                    inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                              output=output, batch_size=8, workers=1)
+                with open(parallel_path, 'w') as output:
+                    inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                              output=output, batch_size=8, workers=2)
+                with patch.object(Inclination._config.dem, 'shared_memory', True), \
+                        open(shared_path, 'w') as output:
+                    inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                              output=output, batch_size=8, workers=2)
+
+            # Assert
+            with open(serial_path) as serial, open(parallel_path) as parallel, open(shared_path) as shared:
+                expected = json.load(serial)
+                self.assertEqual(json.load(parallel), expected)
+                self.assertEqual(json.load(shared), expected)
+            self.assertTrue(any(incline is not None for incline in dem_fixtures.read_inclines(parallel_path).values()))
+            self.assertEqual(SharedTileRegistry.get().stats()['tiles'], 0)
+
+    @patch('src.inclination_helper.inclination.Core')
+    def test_incline_edges_resumes_from_checkpoint(self, mock_core):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            dem_fixtures.write_dem(directory)
+            features = dem_fixtures.sample_edges(count=10)
+            edges_path = os.path.join(directory, 'test.edges.geojson')
+            with open(edges_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            dem_downloader = MagicMock()
+            dem_downloader.get_dem_dir.return_value = Path(directory)
+            dem_downloader.get_ned13_for_bounds.return_value = ['n48w123']
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+            checkpoint = JobCheckpoint(directory=os.path.join(directory, self.prefix))
+            first_path = os.path.join(directory, 'first.geojson')
+            resumed_path = os.path.join(directory, 'resumed.geojson')
+            with patch.object(Inclination._config, 'incline_cache', False), open(first_path, 'w') as output:
+                inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                          output=output, batch_size=4, checkpoint=checkpoint)
+            # The last batch was not saved by the interrupted attempt
+            os.remove(checkpoint.chunk_path(2))
+            dem_downloader.reset_mock()
+
+            # Act
+            with patch.object(Inclination._config, 'incline_cache', False), open(resumed_path, 'w') as output:
+                count = inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                                  output=output, batch_size=4,
+                                                  checkpoint=JobCheckpoint(directory=checkpoint.directory))
+
+            # Assert
+            self.assertEqual(count, 10)
+            self.assertEqual(dem_downloader.get_ned13_for_bounds.call_count, 1)
+            with open(first_path) as first, open(resumed_path) as resumed:
+                self.assertEqual(json.load(resumed), json.load(first))
+            self.assertTrue(checkpoint.chunk_path(2).exists())
+
+    @patch('src.inclination_helper.inclination.Core')
+    def test_incline_edges_stops_at_deadline(self, mock_core):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            dem_fixtures.write_dem(directory)
+            features = dem_fixtures.sample_edges(count=10)
+            edges_path = os.path.join(directory, 'test.edges.geojson')
+            with open(edges_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            dem_downloader = MagicMock()
+            dem_downloader.get_dem_dir.return_value = Path(directory)
+            dem_downloader.get_ned13_for_bounds.return_value = ['n48w123']
+            deadline = Deadline(60)
+            check = deadline.check
+            checks = []
+
+            def expire_after_second_batch(stage):
+                checks.append(stage)
+                if len(checks) == 3:
+                    deadline.expires_at = time.time() - 1
+                check(stage)
+
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix, deadline=deadline)
+            checkpoint = JobCheckpoint(directory=os.path.join(directory, self.prefix))
+
+            # Act
+            with patch.object(Inclination._config, 'incline_cache', False), \
+                    patch.object(deadline, 'check', side_effect=expire_after_second_batch), \
+                    open(os.path.join(directory, 'output.geojson'), 'w') as output:
+                with self.assertRaises(JobTimeoutError) as context:
+                    inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                              output=output, batch_size=4, checkpoint=checkpoint)
+
+            # Assert
+            self.assertEqual(context.exception.stage, 'edges')
+            self.assertEqual(dem_downloader.get_ned13_for_bounds.call_count, 2)
+            # The batches computed before the deadline are kept for a redelivery to resume from
+            self.assertTrue(checkpoint.chunk_path(1).exists())
+            self.assertFalse(checkpoint.chunk_path(2).exists())
+
+    @patch('src.inclination_helper.inclination.DEMDownloader')
+    @patch('src.inclination_helper.inclination.Core')
+    def test_calculate_returns_output_built_by_earlier_attempt(self, mock_core, mock_dem_downloader):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+            inclination.download_dir = directory
+            zip_file_path = os.path.join(directory, self.prefix, 'output', inclination.updated_file_name)
+            os.makedirs(os.path.dirname(zip_file_path))
+            with zipfile.ZipFile(zip_file_path, 'w') as archive:
+                archive.writestr('test.edges.geojson', '{}')
+            inclination.checkpoint.complete('zipped', zip_file_path)
+            inclination.download_file = MagicMock()
+
+            # Act
+            result = inclination.calculate()
+
+            # Assert
+            self.assertEqual(result, zip_file_path)
+            inclination.download_file.assert_not_called()
+            mock_dem_downloader.assert_not_called()
+
+    @patch('src.inclination_helper.inclination.Core')
+    def test_incline_edges_reuses_cached_inclines(self, mock_core):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange
+            dem_fixtures.write_dem(directory, tile='n48w123')
+            dem_fixtures.write_dem(directory, tile='n48w122')
+            features = dem_fixtures.sample_edges(count=15, west=-122.98, east=-122.02)
+            features += dem_fixtures.sample_edges(count=15, seed=1, west=-122.5, east=-121.5)
+            for i, feature in enumerate(features):
+                feature['properties']['_id'] = str(i)
+            edges_path = os.path.join(directory, 'test.edges.geojson')
+            with open(edges_path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            dem_downloader = MagicMock()
+            dem_downloader.get_dem_dir.return_value = Path(directory)
+            dem_downloader.get_ned13_for_bounds.return_value = ['n48w122', 'n48w123']
+            inclination = Inclination(file_path=self.file_path, prefix=self.prefix)
+            paths = [os.path.join(directory, f'run_{run}.geojson') for run in range(3)]
+
+            # Act
+            with patch.object(Inclination._config, 'incline_cache', True):
+                with open(paths[0], 'w') as output:
+                    inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                              output=output, batch_size=8, workers=1)
+                with patch('src.inclination_helper.dem_transcoder.rasterio.open') as mock_rasterio_open, \
+                        open(paths[1], 'w') as output:
+                    inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                              output=output, batch_size=8, workers=1)
+                with open(paths[2], 'w') as output:
+                    inclination.incline_edges(edges_path=Path(edges_path), dem_downloader=dem_downloader,
+                                              output=output, batch_size=8, workers=2)
+
+            # Assert
+            mock_rasterio_open.assert_not_called()
+            with open(paths[0]) as first, open(paths[1]) as second, open(paths[2]) as third:
+                expected = json.load(first)
+                self.assertEqual(json.load(second), expected)
+                self.assertEqual(json.load(third), expected)
+            self.assertTrue(os.path.exists(os.path.join(directory, 'inclines.sqlite3')))
 
     @patch('src.inclination_helper.inclination.open', new_callable=mock_open,
            read_data='{"features":[]}')  # Mock the JSON file reading
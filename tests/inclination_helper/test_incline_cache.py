@@ -0,0 +1,120 @@
+import os
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from src.inclination_helper.incline_cache import InclineCache, JobInclineCache, tile_version
+from src.inclination_helper.tile_cache import TileCache
+
+GEOMETRY = {'type': 'LineString', 'coordinates': [[-122.5, 47.5], [-122.4, 47.6]]}
+
+
+class TestInclineCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dem_file = os.path.join(self.temp_dir.name, 'n48w123.tif')
+        Path(self.dem_file).write_bytes(b'II*\x00' + b'0' * 100)
+        self.cache = InclineCache(path=os.path.join(self.temp_dir.name, 'inclines.sqlite3'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_for_path_returns_shared_instance(self):
+        # Act
+        first = InclineCache.for_path(os.path.join(self.temp_dir.name, 'shared.sqlite3'), max_bytes=10)
+        second = InclineCache.for_path(Path(self.temp_dir.name, 'shared.sqlite3'))
+
+        # Assert
+        self.assertIs(first, second)
+        self.assertEqual(first.max_bytes, 10)
+        first.close()
+
+    def test_put_and_get_many(self):
+        # Arrange
+        self.cache.put_many({b'a': 0.1, b'b': None})
+
+        # Act
+        found = self.cache.get_many([b'a', b'b', b'c'])
+
+        # Assert
+        self.assertEqual(found, {b'a': 0.1, b'b': None})
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_evict_removes_least_recently_used(self):
+        # Arrange
+        for start in range(0, 20000, 1000):
+            self.cache.put_many({f'{i:08d}'.encode() * 4: i / 20000 for i in range(start, start + 1000)})
+        self.cache.get_many([f'{i:08d}'.encode() * 4 for i in range(19000, 20000)])
+        self.cache.max_bytes = self.cache.size() // 2
+
+        # Act
+        removed = self.cache.evict()
+
+        # Assert
+        self.assertGreater(removed, 0)
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+        self.assertEqual(len(self.cache.get_many([f'{i:08d}'.encode() * 4 for i in range(19000, 20000)])), 1000)
+        self.assertEqual(self.cache.get_many([b'00000000' * 4]), {})
+
+    def test_evict_without_budget(self):
+        self.cache.put_many({b'a': 0.1})
+        self.assertEqual(self.cache.evict(), 0)
+
+    def test_job_cache_keys_on_options_and_tiles(self):
+        # Arrange
+        job = JobInclineCache(cache=self.cache, options={'method': 'idw', 'max_blocks': 64})
+        _, pending = job.lookup(geometries=[GEOMETRY], dem_files=[[self.dem_file]])
+        job.store({pending[0]: 0.2})
+
+        # Act
+        same, _ = JobInclineCache(cache=self.cache, options={'method': 'idw', 'max_blocks': 8}).lookup(
+            geometries=[GEOMETRY], dem_files=[[self.dem_file]])
+        other_method, _ = JobInclineCache(cache=self.cache, options={'method': 'bilinear'}).lookup(
+            geometries=[GEOMETRY], dem_files=[[self.dem_file]])
+        other_sampler, _ = JobInclineCache(cache=self.cache, options={'method': 'idw'}, sampler_version='0').lookup(
+            geometries=[GEOMETRY], dem_files=[[self.dem_file]])
+        with open(f'{self.dem_file}.json', 'w') as f:
+            json.dump({'size': 104, 'etag': '"v2"'}, f)
+        other_tile, _ = job.lookup(geometries=[GEOMETRY], dem_files=[[self.dem_file]])
+
+        # Assert
+        self.assertEqual(same, {0: 0.2})
+        self.assertEqual(other_method, {})
+        self.assertEqual(other_sampler, {})
+        self.assertEqual(other_tile, {})
+        self.assertEqual((job.hits, job.lookups), (0, 2))
+        self.assertEqual(job.hit_rate, 0.0)
+
+    def test_tile_version(self):
+        # Arrange
+        with open(f'{self.dem_file}.json', 'w') as f:
+            json.dump({'size': 104, 'etag': '"abc"'}, f)
+
+        # Act
+        version = tile_version(self.dem_file)
+
+        # Assert
+        self.assertEqual(version['tile'], 'n48w123')
+        self.assertEqual(version['etag'], '"abc"')
+        self.assertEqual(version['tif'][0], 104)
+        self.assertNotIn('npy', version)
+
+    def test_tile_version_unchanged_by_cache_hits(self):
+        # Arrange
+        os.utime(self.dem_file, ns=(1_700_000_000_123_456_789, 1_700_000_000_987_654_321))
+        cache = TileCache(directory=self.temp_dir.name)
+        first_job = tile_version(self.dem_file)
+
+        # Act
+        cache.record_hits(['n48w123'])
+        second_job = tile_version(self.dem_file)
+
+        # Assert
+        self.assertEqual(second_job, first_job)
+        self.assertGreater(os.stat(self.dem_file).st_atime_ns, 1_700_000_000_123_456_789)
+
+
+if __name__ == '__main__':
+    unittest.main()
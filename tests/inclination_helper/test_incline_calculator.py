@@ -0,0 +1,142 @@
+import copy
+import tempfile
+import unittest
+from osw_incline import OSWIncline
+from tests.inclination_helper import dem_fixtures
+from src.inclination_helper.incline_calculator import InclineCalculator, incline_shard
+
+
+class TestInclineCalculator(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dem_file = dem_fixtures.write_dem(self.temp_dir.name)
+        self.features = dem_fixtures.sample_edges()
+        self.calculator = InclineCalculator()
+
+    def tearDown(self):
+        self.calculator.close()
+        self.temp_dir.cleanup()
+
+    def test_matches_osw_incline(self):
+        # Arrange
+        nodes_path, edges_path = dem_fixtures.write_dataset(self.temp_dir.name, copy.deepcopy(self.features))
+        OSWIncline(dem_files=[self.dem_file], nodes_file=nodes_path, edges_file=edges_path).calculate()
+        expected = dem_fixtures.read_inclines(edges_path)
+
+        # Act
+        result = {}
+        for feature in self.features:
+            self.calculator.apply(feature=feature, dem_files=[self.dem_file])
+            result[feature['properties']['_id']] = feature['properties'].get('incline')
+
+        # Assert
+        self.assertEqual(result, expected)
+        self.assertTrue(any(incline is not None for incline in result.values()))
+
+    def test_apply_cleans_properties_like_osw_incline(self):
+        # Arrange
+        feature = self.features[0]
+        feature['properties'].update({'osm_id': 1, 'segment': 2, '_u_id': 10})
+
+        # Act
+        self.calculator.apply(feature=feature, dem_files=[self.dem_file])
+
+        # Assert
+        self.assertNotIn('osm_id', feature['properties'])
+        self.assertNotIn('segment', feature['properties'])
+        self.assertEqual(feature['properties']['_u_id'], '10')
+
+    def test_incline_outside_dem_is_none(self):
+        # Arrange
+        geometry = {'type': 'LineString', 'coordinates': [[-100.0, 40.0], [-100.001, 40.001]]}
+
+        # Act
+        incline = self.calculator.incline(geometry=geometry, dem_files=[self.dem_file])
+
+        # Assert
+        self.assertIsNone(incline)
+
+    def test_incline_without_line_geometry_is_none(self):
+        self.assertIsNone(self.calculator.incline(geometry=None, dem_files=[self.dem_file]))
+        self.assertIsNone(self.calculator.incline(
+            geometry={'type': 'Point', 'coordinates': [-122.5, 47.5]}, dem_files=[self.dem_file]
+        ))
+
+    def test_release_closes_dataset(self):
+        # Arrange
+        self.calculator.incline(geometry=self.features[0]['geometry'], dem_files=[self.dem_file])
+        dataset = self.calculator._datasets[self.dem_file]
+
+        # Act
+        self.calculator.release(self.dem_file)
+
+        # Assert
+        self.assertTrue(dataset.closed)
+        self.assertNotIn(self.dem_file, self.calculator._datasets)
+
+    def test_apply_many_matches_apply(self):
+        # Arrange
+        features = copy.deepcopy(self.features)
+
+        # Act
+        self.calculator.apply_many(features=features, dem_files=[self.dem_file])
+
+        # Assert
+        for feature, expected in zip(features, self.features):
+            self.calculator.apply(feature=expected, dem_files=[self.dem_file])
+            self.assertEqual(feature, expected)
+
+    def test_unknown_sampling_method(self):
+        with self.assertRaises(ValueError):
+            InclineCalculator(method='spline')
+
+    def test_incline_shard_matches_calculator(self):
+        # Arrange
+        geometries = [feature['geometry'] for feature in self.features]
+        expected = [self.calculator.incline(geometry=geometry, dem_files=[self.dem_file]) for geometry in geometries]
+
+        # Act
+        result = incline_shard(geometries=geometries, dem_files=[[self.dem_file]] * len(geometries))
+
+        # Assert
+        self.assertEqual(result, expected)
+
+    def test_sampled_profile_close_to_end_to_end_incline(self):
+        # Arrange
+        geometries = [feature['geometry'] for feature in self.features]
+        expected = self.calculator.inclines(geometries=geometries, dem_files=[self.dem_file])
+        calculator = InclineCalculator(interval=20, max_vertices=50)
+
+        # Act
+        try:
+            result = calculator.inclines(geometries=geometries, dem_files=[self.dem_file])
+        finally:
+            calculator.close()
+
+        # Assert
+        self.assertEqual(len(result), len(expected))
+        compared = [(a, b) for a, b in zip(result, expected) if a is not None and b is not None]
+        self.assertTrue(compared)
+        for sampled, end_to_end in compared:
+            self.assertAlmostEqual(sampled, end_to_end, delta=0.01)
+
+    def test_incline_shard_with_sampling_options(self):
+        # Arrange
+        geometries = [feature['geometry'] for feature in self.features]
+        calculator = InclineCalculator(method='bilinear', adaptive=True, max_vertices=20)
+        try:
+            expected = calculator.inclines(geometries=geometries, dem_files=[self.dem_file])
+            options = calculator.options
+        finally:
+            calculator.close()
+
+        # Act
+        result = incline_shard(geometries=geometries, dem_files=[[self.dem_file]] * len(geometries), **options)
+
+        # Assert
+        self.assertEqual(result, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import tempfile
+import unittest
+import rasterio
+import numpy as np
+from shapely.geometry import shape
+from osw_incline.dem_processor import DEMProcessor
+from tests.inclination_helper import dem_fixtures
+from src.inclination_helper.block_cache import BlockCachedRaster
+from src.inclination_helper.sampling import edge_points, edge_inclines, projected_lengths, sample_idw, \
+    sample_bilinear, densify, path_lengths, profile_inclines, adaptive_intervals
+
+
+class TestSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dem_file = dem_fixtures.write_dem(self.temp_dir.name, nodata=-9999)
+        with rasterio.open(self.dem_file, 'r+') as dataset:
+            data = dataset.read(1)
+            data[np.random.default_rng(1).random(data.shape) < 0.3] = -9999
+            data[100:140, 100:140] = -9999
+            dataset.write(data, 1)
+        self.dataset = rasterio.open(self.dem_file)
+        self.raster = BlockCachedRaster(rasterio.open(self.dem_file), block_size=64)
+
+    def tearDown(self):
+        self.dataset.close()
+        self.raster.close()
+        self.temp_dir.cleanup()
+
+    def test_edge_points(self):
+        # Act
+        points, offsets = edge_points([
+            {'type': 'LineString', 'coordinates': [[0, 1], [2, 3], [4, 5, 6]]},
+            None,
+            {'type': 'Point', 'coordinates': [0, 1]},
+            {'type': 'LineString', 'coordinates': [[7, 8]]},
+            {'type': 'LineString', 'coordinates': [[9, 10], [11, 12]]}
+        ])
+
+        # Assert
+        np.testing.assert_array_equal(points, [[0, 1], [2, 3], [4, 5], [9, 10], [11, 12]])
+        np.testing.assert_array_equal(offsets, [0, 3, 3, 3, 3, 5])
+
+    def test_projected_lengths_match_osw_incline(self):
+        # Arrange
+        processor = DEMProcessor(osm_graph=None, dem_files=[])
+        points, offsets = edge_points([feature['geometry'] for feature in dem_fixtures.sample_edges()])
+
+        # Act
+        lengths = projected_lengths(points[offsets[:-1]], points[offsets[1:] - 1])
+
+        # Assert
+        expected = [processor.calculate_projected_length(tuple(points[first]), tuple(points[last - 1]))
+                    for first, last in zip(offsets[:-1], offsets[1:])]
+        self.assertEqual(lengths.tolist(), expected)
+
+    def test_idw_matches_osw_incline(self):
+        # Arrange
+        processor = DEMProcessor(osm_graph=None, dem_files=[])
+        features = dem_fixtures.sample_edges(count=2000, west=-123.01, east=-121.99, south=46.99, north=48.01)
+        points, offsets = edge_points([feature['geometry'] for feature in features])
+
+        # Act
+        inclines = edge_inclines(self.raster, points=points, offsets=offsets)
+
+        # Assert
+        with np.errstate(divide='ignore', invalid='ignore'):
+            expected = [processor.infer_incline(linestring=shape(feature['geometry']), dem=self.dataset)
+                        for feature in features]
+        result = [None if np.isnan(incline) else incline for incline in inclines.tolist()]
+        expected = [None if incline is None or np.isnan(incline) else incline for incline in expected]
+        self.assertEqual(result, expected)
+        self.assertGreater(sum(incline is not None for incline in result), 1000)
+
+    def test_idw_outside_raster_is_nan(self):
+        # Act
+        elevations = sample_idw(self.raster, np.array([-130.0, -122.999, np.nan]), np.array([40.0, 47.5, 47.5]))
+
+        # Assert
+        self.assertTrue(np.isnan(elevations).all())
+
+    def test_bilinear_at_pixel_centres_and_between(self):
+        # Arrange
+        transform = self.dataset.transform
+        data = self.dataset.read(1)
+        row, col = next((row, col) for row in range(10, 50) for col in range(10, 50)
+                        if (data[row:row + 2, col:col + 2] != -9999).all())
+        x, y = transform * (col + 0.5, row + 0.5)
+        x_between, _ = transform * (col + 1, row + 0.5)
+
+        # Act
+        elevations = sample_bilinear(self.raster, np.array([x, x_between]), np.array([y, y]))
+
+        # Assert
+        self.assertAlmostEqual(elevations[0], data[row, col], places=4)
+        self.assertAlmostEqual(elevations[1], (float(data[row, col]) + float(data[row, col + 1])) / 2, places=4)
+
+    def test_bilinear_next_to_nodata_is_nan(self):
+        # Arrange
+        x, y = self.dataset.transform * (100.5, 100.5)
+
+        # Act
+        elevations = sample_bilinear(self.raster, np.array([x]), np.array([y]))
+
+        # Assert
+        self.assertTrue(np.isnan(elevations[0]))
+
+    def test_zero_length_edge_is_nan(self):
+        # Arrange
+        points, offsets = edge_points([{'type': 'LineString', 'coordinates': [[-122.5, 47.5], [-122.5, 47.5]]}])
+
+        # Act
+        inclines = edge_inclines(self.raster, points=points, offsets=offsets)
+
+        # Assert
+        self.assertTrue(np.isnan(inclines[0]))
+
+    def test_unknown_method(self):
+        points, offsets = edge_points([])
+        with self.assertRaises(ValueError):
+            edge_inclines(self.raster, points=points, offsets=offsets, method='spline')
+
+    def test_densify_spaces_samples_along_the_path(self):
+        # Arrange
+        points, offsets = edge_points([
+            {'type': 'LineString', 'coordinates': [[-122.5, 47.5], [-122.5, 47.501], [-122.499, 47.501]]},
+            None,
+            {'type': 'LineString', 'coordinates': [[-122.4, 47.4], [-122.4, 47.4001]]}
+        ])
+        lengths = path_lengths(points, offsets)
+
+        # Act
+        samples, sample_offsets, distances = densify(points, offsets, intervals=10.0)
+
+        # Assert
+        self.assertEqual(sample_offsets[1], sample_offsets[2])
+        self.assertEqual(sample_offsets[1], int(np.ceil(lengths[0] / 10)) + 1)
+        self.assertEqual(sample_offsets[3] - sample_offsets[2], 3)
+        np.testing.assert_allclose(samples[[0, sample_offsets[1] - 1]], points[[0, 2]])
+        np.testing.assert_allclose(samples[-1], points[-1])
+        self.assertAlmostEqual(distances[sample_offsets[1] - 1], lengths[0])
+        self.assertTrue((np.diff(distances[:sample_offsets[1]]) <= 10).all())
+        # The sample halfway along the first edge is on its corner
+        middle = np.argmin(np.abs(distances[:sample_offsets[1]] - lengths[0] * 111 / (111 + 75)))
+        self.assertAlmostEqual(samples[middle][1], 47.501, places=4)
+
+    def test_densify_caps_samples(self):
+        # Arrange
+        points, offsets = edge_points([{'type': 'LineString', 'coordinates': [[-122.5, 47.5], [-122.5, 47.6]]}])
+
+        # Act
+        samples, sample_offsets, _ = densify(points, offsets, intervals=1.0, max_vertices=5)
+
+        # Assert
+        self.assertEqual(sample_offsets.tolist(), [0, 5])
+
+    def test_profile_inclines_fits_the_slope(self):
+        # Arrange
+        distances = np.array([0, 10, 20, 30, 0, 5, 0, 10.0])
+        elevations = np.array([0, 1, np.nan, 3, 4, np.nan, 7, 7.0])
+        sample_offsets = np.array([0, 4, 6, 6, 8])
+
+        # Act
+        inclines = profile_inclines(elevations, distances, sample_offsets)
+
+        # Assert
+        self.assertEqual(inclines[0], 0.1)
+        self.assertTrue(np.isnan(inclines[1]))
+        self.assertTrue(np.isnan(inclines[2]))
+        self.assertEqual(inclines[3], 0.0)
+
+    def test_adaptive_intervals(self):
+        # Act
+        intervals = adaptive_intervals(10.0, path_lengths=np.array([100, 100, 300, 100.0]),
+                                       chord_lengths=np.array([100, 100, 100, 0.0]),
+                                       end_inclines=np.array([0, 0.15, 0.5, np.nan]))
+
+        # Assert
+        np.testing.assert_allclose(intervals, [40, 10, 2.5, 40])
+
+
+if __name__ == '__main__':
+    unittest.main()
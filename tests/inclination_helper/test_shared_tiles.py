@@ -0,0 +1,125 @@
+import tempfile
+import unittest
+import threading
+import rasterio
+import numpy as np
+from unittest.mock import patch
+from multiprocessing import shared_memory
+from rasterio.windows import Window
+from tests.inclination_helper import dem_fixtures
+from src.inclination_helper.block_cache import BlockCachedRaster
+from src.inclination_helper.incline_calculator import InclineCalculator
+from src.inclination_helper.shared_tiles import SharedTileRegistry, SharedTileLease, SharedRaster
+
+
+class TestSharedTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dem_file = dem_fixtures.write_dem(self.temp_dir.name, nodata=-9999)
+        with rasterio.open(self.dem_file, 'r+') as dataset:
+            data = dataset.read(1)
+            data[60:70, 60:70] = -9999
+            dataset.write(data, 1)
+        self.registry = SharedTileRegistry()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_windows_match_dataset_reads(self):
+        # Arrange
+        tile = self.registry.acquire(self.dem_file)
+        raster = SharedRaster(tile)
+
+        # Act and Assert
+        with rasterio.open(self.dem_file) as dataset:
+            for window in [Window(0, 0, 3, 3), Window(60, 60, 3, 3), Window(-1, -1, 3, 3),
+                           Window(199, 5, 3, 3), Window(300, 300, 3, 3)]:
+                expected = dataset.read(1, window=window, masked=True)
+                result = raster.read(1, window=window, masked=True)
+                self.assertEqual(result.shape, expected.shape)
+                np.testing.assert_array_equal(np.ma.getdata(result), np.ma.getdata(expected))
+                np.testing.assert_array_equal(np.ma.getmaskarray(result), np.ma.getmaskarray(expected))
+        self.assertFalse(raster.data.flags.writeable)
+        raster.close()
+        self.assertTrue(raster.closed)
+        self.registry.release(self.dem_file)
+
+    def test_tile_is_freed_after_last_lease(self):
+        # Arrange
+        first = SharedTileLease(self.registry)
+        second = SharedTileLease(self.registry)
+
+        # Act
+        tile = first.get(self.dem_file)
+        self.assertIs(second.get(self.dem_file), tile)
+        stats = self.registry.stats()
+        first.release()
+
+        # Assert
+        self.assertEqual(stats['tiles'], 1)
+        self.assertEqual(stats['users'], 2)
+        self.assertEqual(self.registry.stats()['users'], 1)
+        shared_memory.SharedMemory(name=tile.name).close()
+        second.release()
+        self.assertEqual(self.registry.stats()['tiles'], 0)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=tile.name)
+
+    def test_concurrent_acquire_decodes_once(self):
+        # Arrange
+        tiles = []
+        with patch('src.inclination_helper.shared_tiles.rasterio.open', wraps=rasterio.open) as mock_open:
+            threads = [threading.Thread(target=lambda: tiles.append(self.registry.acquire(self.dem_file)))
+                       for _ in range(4)]
+
+            # Act
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # Assert
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(len({tile.name for tile in tiles}), 1)
+        self.assertEqual(self.registry.stats()['users'], 4)
+        for _ in tiles:
+            self.registry.release(self.dem_file)
+        self.assertEqual(self.registry.stats()['tiles'], 0)
+
+    @patch('src.inclination_helper.shared_tiles.SharedTileRegistry._has_room', return_value=False)
+    def test_falls_back_to_disk_without_room(self, mock_has_room):
+        # Arrange
+        lease = SharedTileLease(self.registry)
+        calculator = InclineCalculator(shared_tiles=lease)
+
+        # Act
+        calculator.incline(geometry=dem_fixtures.sample_edges(count=1)[0]['geometry'], dem_files=[self.dem_file])
+
+        # Assert
+        self.assertIsNone(lease.get(self.dem_file))
+        self.assertIsInstance(calculator._datasets[self.dem_file], BlockCachedRaster)
+        calculator.close()
+        lease.release()
+
+    def test_calculator_inclines_match(self):
+        # Arrange
+        lease = SharedTileLease(self.registry)
+        shared = InclineCalculator(shared_tiles=lease)
+        expected = InclineCalculator()
+
+        # Act and Assert
+        for feature in dem_fixtures.sample_edges():
+            self.assertEqual(
+                shared.incline(geometry=feature['geometry'], dem_files=[self.dem_file]),
+                expected.incline(geometry=feature['geometry'], dem_files=[self.dem_file])
+            )
+        self.assertIsInstance(shared._datasets[self.dem_file], SharedRaster)
+        shared.close()
+        expected.close()
+        lease.release()
+        self.assertEqual(self.registry.stats()['tiles'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+import threading
+from src.inclination_helper.single_flight import SingleFlight, file_lock
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+
+    def test_do_returns_result(self):
+        # Act
+        result = self.single_flight.do('key', lambda value: value * 2, 21)
+
+        # Assert
+        self.assertEqual(result, 42)
+        self.assertFalse(self.single_flight.in_flight('key'))
+
+    def test_do_coalesces_concurrent_calls(self):
+        # Arrange
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(timeout=5)
+            return 'done'
+
+        def call():
+            results.append(self.single_flight.do('key', work))
+
+        # Act
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(timeout=5)
+        followers = [threading.Thread(target=call) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        self.assertTrue(self.single_flight.in_flight('key'))
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(timeout=5)
+
+        # Assert
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['done'] * 4)
+
+    def test_do_shares_exception(self):
+        # Arrange
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def work():
+            started.set()
+            release.wait(timeout=5)
+            raise ValueError('download failed')
+
+        def call():
+            try:
+                self.single_flight.do('key', work)
+            except ValueError as err:
+                errors.append(str(err))
+
+        # Act
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(timeout=5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        release.set()
+        leader.join(timeout=5)
+        follower.join(timeout=5)
+
+        # Assert
+        self.assertEqual(errors, ['download failed', 'download failed'])
+
+    def test_file_lock_creates_lock_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tile.tif.lock')
+
+            # Act
+            with file_lock(path):
+                exists = os.path.exists(path)
+
+            # Assert
+            self.assertTrue(exists)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from src.inclination_helper.tile_usage import TileUsage
+from tests.inclination_helper.test_tile_cache import run_in_fork
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_forked_process_reconnects_each_store_on_first_use(self):
+        # Arrange
+        gone = TileUsage(path=Path(self.temp_dir.name, 'gone', 'tile_usage.sqlite3'))
+        usage = TileUsage(path=Path(self.temp_dir.name, 'kept', 'tile_usage.sqlite3'))
+        connection = usage._connection
+        shutil.rmtree(Path(self.temp_dir.name, 'gone'))
+
+        def child():
+            # A store that cannot reconnect fails on its own use only
+            try:
+                gone.record(['n48w123'])
+                raise AssertionError('The store reconnected without its directory')
+            except sqlite3.Error:
+                pass
+            usage.record(['n48w123'])
+            assert usage._connection is not connection
+
+        # Act
+        exit_code = run_in_fork(child)
+
+        # Assert
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(usage.counts(), {'n48w123': 1})
+        self.assertIs(usage._connection, connection)
+        usage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from src.inclination_helper.tile_cache import TileCache
+
+
+def run_in_fork(fn):
+    """Exit code of a forked child process running `fn`, 0 if it returned."""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            fn()
+            code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+class TestTileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temp_dir.name)
+        self.cache = TileCache(directory=self.directory, max_bytes=250)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _create_tile(self, tile, size=100, accessed=None):
+        path = Path(self.directory, f'{tile}.tif')
+        path.write_bytes(b'0' * size)
+        if accessed is not None:
+            os.utime(path, times=(accessed, accessed))
+        return path
+
+    def test_for_directory_returns_shared_instance(self):
+        # Act
+        first = TileCache.for_directory(self.directory, max_bytes=10)
+        second = TileCache.for_directory(str(self.directory))
+
+        # Assert
+        self.assertIs(first, second)
+        self.assertEqual(first.max_bytes, 10)
+
+    def test_evict_removes_least_recently_used(self):
+        # Arrange
+        now = time.time()
+        self._create_tile('n35w119', accessed=now - 300)
+        self._create_tile('n36w119', accessed=now - 200)
+        self._create_tile('n48w122', accessed=now - 100)
+
+        # Act
+        evicted = self.cache.evict()
+
+        # Assert
+        self.assertEqual(evicted, ['n35w119'])
+        self.assertFalse(Path(self.directory, 'n35w119.tif').exists())
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_evict_counts_and_removes_npy_copies(self):
+        # Arrange
+        now = time.time()
+        self._create_tile('n35w119', size=50, accessed=now - 300)
+        self._create_tile('n36w119', size=50, accessed=now - 200)
+        self._create_tile('n48w122', size=100, accessed=now - 100)
+        Path(self.directory, 'n35w119.npy').write_bytes(b'0' * 100)
+        Path(self.directory, 'n35w119.npy.json').write_text('{}')
+
+        # Act
+        size = self.cache.size()
+        evicted = self.cache.evict()
+
+        # Assert
+        self.assertEqual(size, 302)
+        self.assertEqual(evicted, ['n35w119'])
+        self.assertFalse(Path(self.directory, 'n35w119.npy').exists())
+        self.assertFalse(Path(self.directory, 'n35w119.npy.json').exists())
+
+    def test_record_hits_refreshes_access_time(self):
+        # Arrange
+        now = time.time()
+        self._create_tile('n35w119', accessed=now - 300)
+        self._create_tile('n36w119', accessed=now - 200)
+        self._create_tile('n48w122', accessed=now - 100)
+
+        # Act
+        self.cache.record_hits(['n35w119'])
+        evicted = self.cache.evict()
+
+        # Assert
+        self.assertEqual(evicted, ['n36w119'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_evict_skips_pinned_tiles(self):
+        # Arrange
+        now = time.time()
+        self._create_tile('n35w119', accessed=now - 300)
+        self._create_tile('n36w119', accessed=now - 200)
+        self._create_tile('n48w122', accessed=now - 100)
+        self.cache.pin(['n35w119'])
+
+        # Act
+        evicted = self.cache.evict()
+
+        # Assert
+        self.assertEqual(evicted, ['n36w119'])
+        self.assertTrue(self.cache.is_pinned('n35w119'))
+
+    def test_evict_skips_tiles_pinned_by_another_process(self):
+        # Arrange
+        now = time.time()
+        self._create_tile('n35w119', accessed=now - 300)
+        self._create_tile('n36w119', accessed=now - 200)
+        self._create_tile('n48w122', accessed=now - 100)
+        # Another process using the directory, the pin files are locked per instance all the same
+        other_process = TileCache(directory=self.directory, max_bytes=250)
+        other_process.pin(['n35w119'])
+
+        # Act
+        evicted = self.cache.evict()
+        other_process.unpin(['n35w119'])
+        self.cache.max_bytes = 100
+        evicted_after_unpin = self.cache.evict()
+
+        # Assert
+        self.assertEqual(evicted, ['n36w119'])
+        self.assertFalse(self.cache.is_pinned('n35w119'))
+        self.assertEqual(evicted_after_unpin, ['n35w119'])
+
+    def test_unpin_releases_after_last_user(self):
+        # Arrange
+        self.cache.pin(['n35w119'])
+        self.cache.pin(['n35w119'])
+
+        # Act
+        self.cache.unpin(['n35w119'])
+        still_pinned = self.cache.is_pinned('n35w119')
+        self.cache.unpin(['n35w119'])
+
+        # Assert
+        self.assertTrue(still_pinned)
+        self.assertFalse(self.cache.is_pinned('n35w119'))
+
+    def test_evict_without_budget_keeps_everything(self):
+        # Arrange
+        cache = TileCache(directory=self.directory, max_bytes=0)
+        self._create_tile('n35w119', size=1000)
+
+        # Act
+        evicted = cache.evict()
+
+        # Assert
+        self.assertEqual(evicted, [])
+
+    def test_stats(self):
+        # Arrange
+        self._create_tile('n35w119', size=100)
+        self.cache.record_misses(['n36w119'])
+
+        # Act
+        stats = self.cache.stats()
+
+        # Assert
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['bytes'], 100)
+        self.assertEqual(stats['max_bytes'], 250)
+
+    def test_forked_process_does_not_hold_parent_pins(self):
+        # Arrange
+        now = time.time()
+        self._create_tile('n35w119', accessed=now - 300)
+        self._create_tile('n36w119', accessed=now - 200)
+        self._create_tile('n48w122', accessed=now - 100)
+        cache = TileCache.for_directory(self.directory, max_bytes=250)
+        cache.pin(['n35w119'])
+
+        def child():
+            assert not cache.is_pinned('n35w119')
+            # Still pinned by the parent
+            assert cache.evict() == ['n36w119']
+
+        # Act
+        exit_code = run_in_fork(child)
+        cache.unpin(['n35w119'])
+        cache.max_bytes = 100
+        evicted = cache.evict()
+
+        # Assert
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(evicted, ['n35w119'])
+        TileCache._instances.pop(str(self.directory.resolve()), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
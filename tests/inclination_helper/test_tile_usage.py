@@ -0,0 +1,73 @@
+import tempfile
+import unittest
+from pathlib import Path
+from src.inclination_helper.tile_usage import TileUsage
+from tests.inclination_helper.test_tile_cache import run_in_fork
+
+
+class TestTileUsage(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name, 'tile_usage.sqlite3')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_top_tiles(self):
+        # Arrange
+        usage = TileUsage(path=self.path)
+        usage.record(['n48w123', 'n48w122'])
+        usage.record(['n48w123'])
+        usage.record(['n36w119'])
+
+        # Act
+        top = usage.top(2)
+
+        # Assert
+        self.assertEqual(top, ['n48w123', 'n36w119'])
+        self.assertEqual(usage.counts(), {'n48w123': 2, 'n48w122': 1, 'n36w119': 1})
+        usage.close()
+
+    def test_counts_survive_restarts(self):
+        # Arrange
+        usage = TileUsage(path=self.path)
+        usage.record(['n48w123'])
+        usage.close()
+
+        # Act
+        resumed = TileUsage(path=self.path)
+        resumed.record(['n48w123'])
+
+        # Assert
+        self.assertEqual(resumed.counts(), {'n48w123': 2})
+        resumed.close()
+
+    def test_for_path_is_shared(self):
+        self.assertIs(TileUsage.for_path(self.path), TileUsage.for_path(self.path))
+        TileUsage.for_path(self.path).close()
+        TileUsage._instances.pop(str(self.path.resolve()))
+
+    def test_forked_process_uses_own_connection(self):
+        # Arrange
+        usage = TileUsage(path=self.path)
+        usage.record(['n48w123'])
+        connection = usage._connection
+
+        def child():
+            usage.record(['n48w123'])
+            # Opened on first use, the inherited one is kept aside unused
+            assert usage._connection is not connection
+            assert usage._inherited == [connection]
+
+        # Act
+        exit_code = run_in_fork(child)
+
+        # Assert
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(usage.counts(), {'n48w123': 2})
+        usage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from src.models.queue_message_content import RequestMessage, IncomingData
+from src.models.queue_message_content import RequestMessage, IncomingData, SamplingOptions
 
 
 class TestRequestMessage(unittest.TestCase):
@@ -64,6 +64,92 @@ class TestRequestMessage(unittest.TestCase):
         # Ensure the error message is related to the missing 'user_id' field
         self.assertIn("missing 1 required positional argument: 'user_id'", str(context.exception))
 
+    def test_from_dict_with_sampling_options(self):
+        # Arrange
+        data = {
+            'messageId': '12345',
+            'messageType': 'JobRequest',
+            'data': {
+                'dataset_url': 'http://example.com/data',
+                'user_id': 'user_001',
+                'jobId': 'job_001',
+                'sampling': {'interval': 5, 'max_vertices': 100, 'adaptive': True}
+            }
+        }
+
+        # Act
+        result = RequestMessage.from_dict(data)
+
+        # Assert
+        self.assertEqual(result.data.sampling, SamplingOptions(interval=5, max_vertices=100, adaptive=True))
+        self.assertEqual(result.data.sampling.with_defaults(method='idw').to_dict(),
+                         {'method': 'idw', 'interval': 5, 'max_vertices': 100, 'adaptive': True})
+
+    def test_from_dict_without_sampling_options(self):
+        # Arrange
+        data = {
+            'messageId': '12345',
+            'messageType': 'JobRequest',
+            'data': {'dataset_url': 'http://example.com/data', 'user_id': 'user_001', 'jobId': 'job_001'}
+        }
+
+        # Act
+        result = RequestMessage.from_dict(data)
+
+        # Assert
+        self.assertIsNone(result.data.sampling)
+
+    def test_from_dict_with_tile_hints(self):
+        # Arrange
+        data = {
+            'messageId': '12345',
+            'messageType': 'JobRequest',
+            'data': {
+                'dataset_url': 'http://example.com/data',
+                'user_id': 'user_001',
+                'jobId': 'job_001',
+                'bbox': [-122.5, 47.5, -122.1, 47.8],
+                'tiles': ['n48w123']
+            }
+        }
+
+        # Act
+        result = RequestMessage.from_dict(data)
+
+        # Assert
+        self.assertEqual(result.data.bbox, [-122.5, 47.5, -122.1, 47.8])
+        self.assertEqual(result.data.tiles, ['n48w123'])
+
+    def test_invalid_tile_hints_are_ignored(self):
+        base = {'dataset_url': 'http://example.com/data', 'user_id': 'user_001', 'jobId': 'job_001'}
+        for hint in [{'bbox': [1, 2, 3]}, {'bbox': [-122, 48, -123, 47]}, {'bbox': [0, 0, 200, 1]},
+                     {'bbox': ['a', 0, 1, 1]}, {'bbox': 'world'}, {'tiles': [48]}, {'tiles': 'n48w123'}]:
+            with self.subTest(hint=hint):
+                data = IncomingData(**base, **hint)
+                self.assertIsNone(data.bbox)
+                self.assertIsNone(data.tiles)
+
+    def test_invalid_sampling_options_are_recorded(self):
+        base = {'dataset_url': 'http://example.com/data', 'user_id': 'user_001', 'jobId': 'job_001'}
+        for sampling in [{'method': 'spline'}, {'interval': 'a'}, {'spacing': 5}, 'idw']:
+            with self.subTest(sampling=sampling):
+                data = IncomingData(**base, sampling=sampling)
+                self.assertIsNone(data.sampling)
+                self.assertIn('Invalid sampling options', data.sampling_error)
+        self.assertIsNone(IncomingData(**base, sampling={'interval': 5}).sampling_error)
+
+
+class TestSamplingOptions(unittest.TestCase):
+
+    def test_invalid_options(self):
+        for options in [{'method': 'spline'}, {'interval': 0}, {'interval': -1}, {'max_vertices': 1}]:
+            with self.subTest(options=options), self.assertRaises(ValueError):
+                SamplingOptions(**options)
+
+    def test_with_defaults_keeps_requested_method(self):
+        self.assertEqual(SamplingOptions(method='bilinear').with_defaults(method='idw').method, 'bilinear')
+        self.assertEqual(SamplingOptions().with_defaults(method='idw').method, 'idw')
+
 
 if __name__ == '__main__':
     unittest.main()
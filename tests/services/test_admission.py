@@ -0,0 +1,158 @@
+import os
+import time
+import zipfile
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from tests.inclination_helper import dem_fixtures
+from src.services.admission import AdmissionController, JobEstimator, JobEstimate, TILE_BYTES, memory_limit
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.controller = AdmissionController(memory_budget=1000, download_dir=self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_estimate_reads_edges_from_archive(self):
+        # Arrange
+        features = dem_fixtures.sample_edges(count=15, west=-122.98, east=-122.02)
+        features += dem_fixtures.sample_edges(count=5, seed=1, west=-121.98, east=-121.02)
+        features += dem_fixtures.sample_edges(count=5, seed=2, west=-119.98, east=-119.02)
+        for i, feature in enumerate(features):
+            feature['properties']['_u_id'] = f'u{i}'
+            feature['properties']['_v_id'] = f'v{i}'
+        nodes_path, edges_path = dem_fixtures.write_dataset(self.temp_dir.name, features)
+        archive_path = os.path.join(self.temp_dir.name, 'dataset.zip')
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            archive.write(nodes_path, os.path.basename(nodes_path))
+            archive.write(edges_path, os.path.basename(edges_path))
+        os.makedirs(os.path.join(self.temp_dir.name, 'dems'))
+        dem_fixtures.write_dem(os.path.join(self.temp_dir.name, 'dems'), tile='n48w123')
+
+        estimator = JobEstimator(download_dir=self.temp_dir.name, ned_13_index=frozenset(['n48w123', 'n48w122']),
+                                 batch_size=10)
+
+        # Act
+        estimate = estimator.estimate(archive_path)
+
+        # Assert
+        self.assertEqual(estimate.edges, 25)
+        self.assertEqual(estimate.tiles, ['n48w122', 'n48w123'])
+        self.assertEqual(estimate.missing_tiles, ['n48w122'])
+        self.assertGreater(estimate.disk, TILE_BYTES + os.path.getsize(edges_path))
+        self.assertGreater(estimate.memory, 0)
+        prefetched = estimate.prefetched()
+        self.assertEqual(prefetched.missing_tiles, [])
+        self.assertEqual(prefetched.disk, estimate.disk - TILE_BYTES)
+        self.assertEqual(prefetched.memory, estimate.memory)
+
+    @patch('src.services.admission._SAMPLE_EDGES', 20)
+    def test_estimate_extrapolates_edges_from_sample(self):
+        # Arrange
+        nodes_path, edges_path = dem_fixtures.write_dataset(self.temp_dir.name, dem_fixtures.sample_edges(count=200))
+        archive_path = os.path.join(self.temp_dir.name, 'dataset.zip')
+        with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.write(nodes_path, os.path.basename(nodes_path))
+            archive.write(edges_path, os.path.basename(edges_path))
+        estimator = JobEstimator(download_dir=self.temp_dir.name, ned_13_index=frozenset(['n48w123']), batch_size=10)
+
+        # Act
+        estimate = estimator.estimate(archive_path)
+
+        # Assert
+        self.assertAlmostEqual(estimate.edges, 200, delta=20)
+        self.assertEqual(estimate.tiles, ['n48w123'])
+
+    def test_admits_first_job_over_budget(self):
+        # Arrange
+        estimate = JobEstimate(edges=1, tiles=[], missing_tiles=[], memory=5000, disk=0)
+
+        # Act
+        with self.controller.admit(estimate, job_id='large'):
+            stats = self.controller.stats()
+
+        # Assert
+        self.assertEqual(stats['running'], 1)
+        self.assertEqual(self.controller.stats()['running'], 0)
+
+    def test_holds_back_job_until_budget_allows(self):
+        # Arrange
+        running = JobEstimate(edges=1, tiles=[], missing_tiles=[], memory=800, disk=0)
+        waiting = JobEstimate(edges=1, tiles=[], missing_tiles=[], memory=400, disk=0)
+        events = []
+        release = threading.Event()
+
+        def run_first():
+            with self.controller.admit(running, job_id='first'):
+                events.append('first started')
+                release.wait(timeout=5)
+                events.append('first done')
+
+        def run_second():
+            with self.controller.admit(waiting, job_id='second'):
+                events.append('second started')
+
+        first = threading.Thread(target=run_first)
+        first.start()
+        while not events:
+            time.sleep(0.01)
+
+        # Act
+        second = threading.Thread(target=run_second)
+        second.start()
+        time.sleep(0.1)
+        held_back = list(events)
+        release.set()
+        first.join(timeout=5)
+        second.join(timeout=5)
+
+        # Assert
+        self.assertEqual(held_back, ['first started'])
+        self.assertEqual(events, ['first started', 'first done', 'second started'])
+
+    def test_small_jobs_run_together(self):
+        # Arrange
+        small = JobEstimate(edges=1, tiles=[], missing_tiles=[], memory=400, disk=0)
+
+        # Act
+        with self.controller.admit(small, job_id='first'), self.controller.admit(small, job_id='second'):
+            stats = self.controller.stats()
+
+        # Assert
+        self.assertEqual(stats['running'], 2)
+        self.assertEqual(stats['memory'], 800)
+
+    def test_disk_budget(self):
+        # Arrange
+        running = JobEstimate(edges=1, tiles=[], missing_tiles=[], memory=1, disk=10)
+        large = JobEstimate(edges=1, tiles=[], missing_tiles=[], memory=1, disk=100)
+
+        # Act and Assert
+        with self.controller.admit(running, job_id='first'), \
+                patch('src.services.admission.shutil.disk_usage') as mock_disk_usage:
+            mock_disk_usage.return_value.free = 50
+            self.assertFalse(self.controller._fits(large))
+            mock_disk_usage.return_value.free = 500
+            self.assertTrue(self.controller._fits(large))
+
+    def test_memory_limit_uses_cgroup_limit(self):
+        # Arrange
+        limit_path = os.path.join(self.temp_dir.name, 'memory.max')
+        with open(limit_path, 'w') as f:
+            f.write('1048576\n')
+
+        # Act
+        with patch('src.services.admission._CGROUP_MEMORY_LIMITS', (limit_path,)):
+            limit = memory_limit()
+
+        # Assert
+        self.assertEqual(limit, 1048576)
+
+
+if __name__ == '__main__':
+    unittest.main()
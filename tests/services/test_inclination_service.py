@@ -1,13 +1,30 @@
+import os
+import json
+import time
+import threading
 import unittest
 from unittest.mock import patch, MagicMock, mock_open
+from python_ms_core.core.topic.azure_topic import AzureTopic
 from src.services.inclination_service import InclinationService
+from src.services.scheduler import JobScheduler
+from src.services.pipeline import JobPipeline
+from src.services.admission import JobEstimate
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from src.models.queue_message_content import SamplingOptions, RequestMessage
+from src.inclination_helper.inclination import calculate_inclination
+from src.inclination_helper.deadline import JobTimeoutError
+from src.inclination_helper.sampling import SAMPLER_VERSION
 
 
 class TestInclinationService(unittest.TestCase):
 
+    @patch('src.services.inclination_service.JobScheduler')
+    @patch('src.services.inclination_service.JobEstimator')
+    @patch('src.services.inclination_service.AdmissionController')
+    @patch('src.services.inclination_service.ResultIndex')
     @patch('src.services.inclination_service.Settings')
     @patch('src.services.inclination_service.Core')
-    def setUp(self, mock_core, mock_settings):
+    def setUp(self, mock_core, mock_settings, mock_result_index, mock_admission, mock_estimator, mock_scheduler):
         # Mock Settings
         mock_settings.return_value.event_bus.request_subscription = 'test_subscription'
         mock_settings.return_value.event_bus.request_topic = 'test_request_topic'
@@ -20,10 +37,44 @@ class TestInclinationService(unittest.TestCase):
         mock_core.return_value.get_topic.return_value = MagicMock()
         mock_core.return_value.get_storage_client.return_value = MagicMock()
 
-        # Initialize InclinationService with mocked dependencies
-        self.service = InclinationService()
+        # Initialize InclinationService with mocked dependencies, computing in the listener threads
+        with patch.object(InclinationService._config, 'job_workers', 0):
+            self.service = InclinationService()
         self.service.storage_client = MagicMock()
         self.service.container_name = 'test_container'
+        self.service.result_index.get.return_value = None
+
+    @patch('src.services.inclination_service.JobWorkerPool')
+    @patch('src.services.inclination_service.AdmissionController')
+    @patch('src.services.inclination_service.ResultIndex')
+    @patch('src.services.inclination_service.Core')
+    def test_job_workers_match_compute_slots(self, mock_core, mock_result_index, mock_admission, mock_job_worker_pool):
+        # Arrange
+        config = InclinationService._config
+
+        # Act
+        with patch.object(config, 'max_concurrent_messages', 2), patch.object(config, 'small_job_slots', 1), \
+                patch.object(InclinationService, 'subscribe'):
+            service = InclinationService()
+
+        # Assert
+        self.assertEqual(service.scheduler.concurrency, 3)
+        mock_job_worker_pool.assert_called_once_with(workers=3, max_jobs=config.job_worker_max_jobs,
+                                                     max_rss=config.job_worker_max_rss)
+        self.assertIs(service.job_workers, mock_job_worker_pool.return_value)
+
+    @patch('src.services.inclination_service.JobWorkerPool')
+    @patch('src.services.inclination_service.AdmissionController')
+    @patch('src.services.inclination_service.ResultIndex')
+    @patch('src.services.inclination_service.Core')
+    def test_job_workers_can_be_disabled(self, mock_core, mock_result_index, mock_admission, mock_job_worker_pool):
+        # Act
+        with patch.object(InclinationService._config, 'job_workers', 0), patch.object(InclinationService, 'subscribe'):
+            service = InclinationService()
+
+        # Assert
+        mock_job_worker_pool.assert_not_called()
+        self.assertIsNone(service.job_workers)
 
     @patch('src.services.inclination_service.QueueMessage')
     @patch('src.services.inclination_service.RequestMessage')
@@ -62,6 +113,196 @@ class TestInclinationService(unittest.TestCase):
         self.service.send_status.assert_called_once_with(valid=True, request_message=mock_request_message,
                                                          file_path='uploaded_file_path')
 
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_prefetches_tiles_before_computing(self, mock_inclination):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        mock_inclination.return_value.download.return_value = 'archive_path'
+        mock_inclination.return_value.calculate.return_value = 'calculated_file_path'
+        estimate = self.service.estimator.estimate.return_value
+        dem_downloader = mock_inclination.return_value.dem_downloader.return_value
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_file_path')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+
+        # Assert
+        self.service.estimator.estimate.assert_called_once_with('archive_path')
+        dem_downloader.prefetch.assert_called_once_with(estimate.tiles)
+        dem_downloader.release_tiles.assert_called_once()
+        self.service.scheduler.slot.assert_called_once_with(estimate.prefetched.return_value, job_id='123')
+        self.assertEqual(self.service.pipeline.stats()['waiting'], 0)
+
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_fetches_next_job_while_one_computes(self, mock_inclination):
+        # Arrange
+        self.service.scheduler = JobScheduler(slots=1, small_slots=0)
+        self.service.pipeline = JobPipeline(io_slots=2, prefetch_jobs=1)
+        self.service.admission = None
+        self.service.estimator.estimate.return_value = JobEstimate(edges=100, tiles=[], missing_tiles=[], memory=0,
+                                                                   disk=0)
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_file_path')
+        self.service.send_status = MagicMock()
+        events = []
+        release = threading.Event()
+
+        def create_inclination(prefix, **kwargs):
+            inclination = MagicMock()
+            inclination.download.side_effect = lambda: events.append(('fetch', prefix)) or 'archive_path'
+            inclination.calculate.side_effect = \
+                lambda downloaded_file_path: events.append(('compute', prefix)) or release.wait(timeout=5) and 'output'
+            return inclination
+
+        mock_inclination.side_effect = create_inclination
+
+        def process(job_id):
+            request_message = MagicMock()
+            request_message.data.jobId = job_id
+            request_message.data.sampling_error = None
+            thread = threading.Thread(target=self.service.process_message, args=(request_message,))
+            thread.start()
+            return thread
+
+        def wait_for(condition):
+            deadline = time.time() + 5
+            while not condition() and time.time() < deadline:
+                time.sleep(0.01)
+
+        # Act
+        first = process('job_1')
+        wait_for(lambda: ('compute', 'job_1') in events)
+        second = process('job_2')
+        wait_for(lambda: self.service.scheduler.stats()['waiting'] == 1)
+        held_back = list(events)
+        release.set()
+        first.join(timeout=5)
+        second.join(timeout=5)
+
+        # Assert
+        self.assertEqual(self.service.pipeline.concurrency(self.service.scheduler.concurrency), 2)
+        self.assertEqual(held_back, [('fetch', 'job_1'), ('compute', 'job_1'), ('fetch', 'job_2')])
+        self.assertEqual(events[-1], ('compute', 'job_2'))
+        self.assertEqual(self.service.send_status.call_count, 2)
+
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_warms_hinted_tiles_during_download(self, mock_inclination):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        mock_request_message.data.bbox = [-122.5, 47.5, -121.5, 47.8]
+        mock_request_message.data.tiles = ['n47w122']
+        dem_downloader = mock_inclination.return_value.dem_downloader.return_value
+        events = []
+        dem_downloader.warm.side_effect = lambda tiles: events.append(('warm', tiles)) or []
+        mock_inclination.return_value.download.side_effect = lambda: events.append(('download',)) or 'archive_path'
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_file_path')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+        self.service.tile_hints.shutdown(wait=True)
+
+        # Assert
+        self.assertIn(('warm', ['n47w122', 'n48w122', 'n48w123']), events)
+        self.assertIn(('download',), events)
+        self.service.send_status.assert_called_once_with(valid=True, request_message=mock_request_message,
+                                                         file_path='uploaded_file_path')
+
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_ignores_failed_or_large_tile_hints(self, mock_inclination):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        mock_request_message.data.tiles = ['n48w123']
+        dem_downloader = mock_inclination.return_value.dem_downloader.return_value
+        dem_downloader.warm.side_effect = Exception('Network down')
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_file_path')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+        mock_request_message.data.bbox = [-125.0, 30.0, -70.0, 49.0]
+        self.service.process_message(mock_request_message)
+        self.service.tile_hints.shutdown(wait=True)
+
+        # Assert
+        dem_downloader.warm.assert_called_once_with(['n48w123'])
+        self.assertEqual(self.service.send_status.call_count, 2)
+        self.assertTrue(all(call[1]['valid'] for call in self.service.send_status.call_args_list))
+
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_does_not_wait_for_hinted_tiles(self, mock_inclination):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        mock_request_message.data.tiles = ['n47w122']
+        dem_downloader = mock_inclination.return_value.dem_downloader.return_value
+        release = threading.Event()
+        warmed = []
+        dem_downloader.warm.side_effect = lambda tiles: release.wait(timeout=5) and warmed.append(tiles) or []
+        self.service.result_index.get.return_value = ('previous_file_path', 'job_1')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+        warmed_before_status = list(warmed)
+        release.set()
+        self.service.tile_hints.shutdown(wait=True)
+
+        # Assert
+        self.assertEqual(warmed_before_status, [])
+        self.assertEqual(warmed, [['n47w122']])
+        self.service.send_status.assert_called_once_with(valid=True, request_message=mock_request_message,
+                                                         file_path='previous_file_path')
+        dem_downloader.warm.assert_called_once_with(['n47w122'])
+
+    @patch('src.services.inclination_service.get_unique_id', return_value='unique_id')
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_records_result(self, mock_inclination, mock_get_unique_id):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = 'job_2'
+        mock_request_message.data.dataset_url = 'test_dataset_url'
+        mock_inclination.return_value.download.return_value = 'archive_path'
+        mock_inclination.return_value.calculate.return_value = 'calculated_file_path'
+        self.service.result_index.key.return_value = 'result_key'
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_file_path')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+
+        # Assert
+        mock_inclination.return_value.calculate.assert_called_once_with(downloaded_file_path='archive_path')
+        self.assertEqual(self.service.result_index.key.call_args[1]['sampler'], SAMPLER_VERSION)
+        self.service.result_index.put.assert_called_once_with('result_key', url='uploaded_file_path', job_id='job_2')
+
+    @patch('src.services.inclination_service.get_unique_id', return_value='unique_id')
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_reuses_previous_result(self, mock_inclination, mock_get_unique_id):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = 'job_2'
+        mock_request_message.data.dataset_url = 'test_dataset_url'
+        self.service.result_index.get.return_value = ('previous_file_path', 'job_1')
+        self.service.upload_to_azure = MagicMock()
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+
+        # Assert
+        mock_inclination.return_value.calculate.assert_not_called()
+        self.service.upload_to_azure.assert_not_called()
+        self.service.send_status.assert_called_once_with(valid=True, request_message=mock_request_message,
+                                                         file_path='previous_file_path')
+
     @patch('src.services.inclination_service.Logger')
     @patch('src.services.inclination_service.get_unique_id', return_value='unique_id')
     @patch('src.services.inclination_service.Inclination')
@@ -115,6 +356,131 @@ class TestInclinationService(unittest.TestCase):
         self.service.send_status.assert_called_once_with(valid=False, request_message=mock_request_message,
                                                          file_path='dataset_url')
 
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_with_invalid_sampling_options(self, mock_inclination):
+        # Arrange
+        request_message = RequestMessage.from_dict({
+            'messageId': '1234',
+            'messageType': 'JobRequest',
+            'data': {'dataset_url': 'dataset_url', 'user_id': 'user_001', 'jobId': '123',
+                     'sampling': {'interval': -1}}
+        })
+        response_topic = self.service.core.get_topic.return_value
+
+        # Act
+        self.service.process_message(request_message)
+
+        # Assert
+        mock_inclination.assert_not_called()
+        response = QueueMessage.to_dict(response_topic.publish.call_args[1]['data'])['data']
+        self.assertEqual(response['message'], 'Failed')
+        self.assertFalse(response['success'])
+
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_in_job_worker(self, mock_inclination):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        mock_inclination.return_value.file_path = 'dataset_url'
+        mock_inclination.return_value.prefix = '123'
+        mock_inclination.return_value.download.return_value = 'archive_path'
+        mock_inclination.return_value.dem_downloader.return_value.ned_13_tiles = {'n48w123'}
+        self.service.job_workers = MagicMock()
+        self.service.job_workers.run.return_value = 'calculated_file_path'
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_file_path')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+
+        # Assert
+        mock_inclination.return_value.calculate.assert_not_called()
+        self.service.job_workers.run.assert_called_once_with(
+            calculate_inclination, file_path='dataset_url', prefix='123',
+            sampling=mock_inclination.return_value.sampling, downloaded_file_path='archive_path',
+            deadline=mock_inclination.return_value.deadline, prefetched_tiles=['n48w123']
+        )
+        self.service.upload_to_azure.assert_called_once_with(file_path='calculated_file_path', job_id='123')
+
+    @patch('src.services.inclination_service.JobCheckpoint')
+    @patch('src.services.inclination_service.clean_up')
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_keeps_files_of_failed_job(self, mock_inclination, mock_clean_up, mock_checkpoint):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        mock_inclination.return_value.calculate.side_effect = Exception('Pod evicted')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+
+        # Assert
+        mock_clean_up.assert_not_called()
+        mock_checkpoint.collect_garbage.assert_called_once_with(
+            directory=self.service._config.get_download_directory(), max_age=self.service._config.checkpoint_ttl)
+
+    @patch('src.services.inclination_service.JobCheckpoint')
+    @patch('src.services.inclination_service.clean_up')
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_reports_timeout(self, mock_inclination, mock_clean_up, mock_checkpoint):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        mock_inclination.return_value.calculate.side_effect = JobTimeoutError(seconds=60, stage='edges')
+        self.service.upload_to_azure = MagicMock()
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+
+        # Assert
+        self.service.upload_to_azure.assert_not_called()
+        self.service.send_status.assert_called_once_with(valid=False, request_message=mock_request_message,
+                                                         file_path='dataset_url', timed_out=True)
+        mock_clean_up.assert_not_called()
+        deadline = mock_inclination.call_args[1]['deadline']
+        self.assertEqual(deadline.seconds, self.service._config.job_timeout)
+
+    @patch('src.services.inclination_service.JobCheckpoint')
+    @patch('src.services.inclination_service.clean_up')
+    @patch('src.services.inclination_service.Inclination')
+    def test_process_message_cleans_up_completed_job(self, mock_inclination, mock_clean_up, mock_checkpoint):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.jobId = '123'
+        mock_request_message.data.dataset_url = 'dataset_url'
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_file_path')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.process_message(mock_request_message)
+
+        # Assert
+        mock_clean_up.assert_called_once_with(path=f'{self.service._config.get_download_directory()}/123')
+
+    @patch('src.services.inclination_service.TileWarmup')
+    @patch('src.services.inclination_service.create_dem_downloader')
+    def test_warm_up(self, mock_create_dem_downloader, mock_warmup):
+        # Arrange
+        self.service._config = MagicMock()
+        self.service._config.tile_warmup_tiles = 'n48w123, n36w119,'
+        self.service._config.tile_warmup_top_tiles = 4
+        self.service._config.dem.cache_max_bytes = 0
+        mock_warmup.return_value.ready = False
+
+        # Act
+        self.service.warm_up()
+
+        # Assert
+        mock_warmup.assert_called_once_with(dem_downloader=mock_create_dem_downloader.return_value,
+                                            tiles=['n48w123', 'n36w119'], top_tiles=4, max_tiles=None)
+        mock_warmup.return_value.start.assert_called_once()
+        self.assertFalse(self.service.ready)
+
     @patch('src.services.inclination_service.QueueMessage')
     def test_send_status_success(self, mock_queue_message):
         # Arrange
@@ -130,6 +496,35 @@ class TestInclinationService(unittest.TestCase):
         mock_queue_message.data_from.assert_called_once()
         mock_response_topic.publish.assert_called_once_with(data=mock_data)
 
+    @patch('src.services.inclination_service.QueueMessage')
+    def test_send_status_timed_out(self, mock_queue_message):
+        # Arrange
+        mock_request_message = MagicMock()
+
+        # Act
+        self.service.send_status(valid=False, request_message=mock_request_message, file_path='file_path',
+                                 timed_out=True)
+
+        # Assert
+        response = mock_queue_message.data_from.call_args[0][0]['data']
+        self.assertEqual(response['message'], 'Timed out')
+        self.assertFalse(response['success'])
+
+    @patch('src.services.inclination_service.QueueMessage')
+    def test_send_status_records_sampling_options(self, mock_queue_message):
+        # Arrange
+        mock_request_message = MagicMock()
+        mock_request_message.data.sampling = SamplingOptions(interval=5.0, adaptive=True)
+
+        # Act
+        self.service.send_status(valid=True, request_message=mock_request_message, file_path='file_path')
+
+        # Assert
+        package = mock_queue_message.data_from.call_args[0][0]['data']['package']
+        self.assertEqual(package['sampler'], SAMPLER_VERSION)
+        self.assertEqual(package['sampling'], {'method': self.service._config.incline_sampling_method,
+                                               'interval': 5.0, 'max_vertices': None, 'adaptive': True})
+
     @patch('builtins.open', new_callable=mock_open)  # Mock open to simulate file handling
     def test_upload_to_azure_exception(self, mock_open):
         # Arrange
@@ -188,5 +583,53 @@ class TestInclinationService(unittest.TestCase):
         self.assertEqual(result, 'https://azure.example.com/test-container/jobs/test_job_id/test_file.geojson')
 
 
+
+class StopListening(BaseException):
+    pass
+
+
+class TestInclinationServiceSubscription(unittest.TestCase):
+
+    @patch.dict('os.environ', {'TOPIC_CALLBACK_EXECUTION_MODE': 'process'})
+    @patch('python_ms_core.core.topic.azure_topic.AutoLockRenewer')
+    @patch('python_ms_core.core.topic.azure_topic.ServiceBusClient')
+    @patch('src.services.inclination_service.AdmissionController')
+    @patch('src.services.inclination_service.JobEstimator')
+    @patch('src.services.inclination_service.ResultIndex')
+    @patch('src.services.inclination_service.Core')
+    def test_messages_are_processed_in_service_process(self, mock_core, mock_result_index, mock_estimator,
+                                                       mock_admission, mock_service_bus_client, mock_lock_renewer):
+        # Arrange
+        mock_core.return_value.get_topic.side_effect = \
+            lambda topic_name, max_concurrent_messages=1: AzureTopic(
+                config=MagicMock(), topic_name=topic_name, max_concurrent_messages=max_concurrent_messages)
+        with patch.object(InclinationService, 'subscribe'):
+            service = InclinationService()
+        messages = []
+        for job_id in ['job_1', 'job_2']:
+            message = MagicMock()
+            message.__str__.return_value = json.dumps({
+                'messageId': job_id,
+                'messageType': 'JobRequest',
+                'data': {'dataset_url': 'dataset_url', 'user_id': 'user_001', 'jobId': job_id}
+            })
+            messages.append(message)
+        receiver = mock_service_bus_client.from_connection_string.return_value.get_subscription_receiver.return_value
+        receiver.receive_messages.side_effect = [messages, StopListening()]
+        processed = []
+        service.process_message = lambda request_msg: processed.append((os.getpid(), request_msg.data.jobId))
+
+        # Act
+        with self.assertRaises(StopListening):
+            service.subscribe()
+        service.request_topic.executor.shutdown(wait=True)
+
+        # Assert
+        self.assertEqual(service.request_topic.callback_execution_mode, 'thread')
+        self.assertEqual(service.request_topic.max_concurrent_messages,
+                         service.pipeline.concurrency(service.scheduler.concurrency))
+        self.assertEqual(sorted(processed), [(os.getpid(), 'job_1'), (os.getpid(), 'job_2')])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+from src.services.job_workers import JobWorkerPool, JobWorkerError
+from src.inclination_helper.deadline import Deadline, JobTimeoutError
+
+
+def get_pid(value=None):
+    return os.getpid(), value
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def die():
+    os._exit(1)
+
+
+def hang(deadline=None):
+    # Like a read stuck in native code, which never checks the deadline
+    time.sleep(60)
+
+
+class TestJobWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.close()
+
+    def test_runs_jobs_in_another_process(self):
+        # Arrange
+        self.pool = JobWorkerPool(workers=1)
+
+        # Act
+        first_pid, value = self.pool.run(get_pid, value='done')
+        second_pid, _ = self.pool.run(get_pid)
+
+        # Assert
+        self.assertEqual(value, 'done')
+        self.assertNotEqual(first_pid, os.getpid())
+        self.assertEqual(first_pid, second_pid)
+
+    def test_recycles_after_max_jobs(self):
+        # Arrange
+        self.pool = JobWorkerPool(workers=1, max_jobs=2)
+
+        # Act
+        pids = [self.pool.run(get_pid)[0] for _ in range(3)]
+
+        # Assert
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(self.pool.recycled, 1)
+
+    def test_recycles_over_max_rss(self):
+        # Arrange
+        self.pool = JobWorkerPool(workers=1, max_rss=1)
+
+        # Act
+        first_pid, _ = self.pool.run(get_pid)
+        second_pid, _ = self.pool.run(get_pid)
+
+        # Assert
+        self.assertNotEqual(first_pid, second_pid)
+
+    def test_job_errors_are_raised(self):
+        # Arrange
+        self.pool = JobWorkerPool(workers=1)
+
+        # Act and Assert
+        with self.assertRaises(ValueError) as context:
+            self.pool.run(fail, 'Invalid dataset')
+        self.assertEqual(str(context.exception), 'Invalid dataset')
+        self.assertEqual(self.pool.run(get_pid, value=1)[1], 1)
+
+    def test_dead_worker_is_replaced(self):
+        # Arrange
+        self.pool = JobWorkerPool(workers=1)
+
+        # Act and Assert
+        with self.assertRaises(JobWorkerError):
+            self.pool.run(die)
+        self.assertEqual(self.pool.run(get_pid, value=1)[1], 1)
+
+    @patch('src.services.job_workers.KILL_GRACE', 0.5)
+    def test_worker_past_deadline_is_killed(self):
+        # Arrange
+        self.pool = JobWorkerPool(workers=1)
+        pid, _ = self.pool.run(get_pid)
+        start_time = time.time()
+
+        # Act and Assert
+        with self.assertRaises(JobTimeoutError):
+            self.pool.run(hang, deadline=Deadline(seconds=1))
+        self.assertLess(time.time() - start_time, 30)
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+        self.assertNotEqual(self.pool.run(get_pid)[0], pid)
+
+    def test_closed_pool(self):
+        # Arrange
+        self.pool = JobWorkerPool(workers=1)
+        self.pool.close()
+
+        # Act and Assert
+        with self.assertRaises(JobWorkerError):
+            self.pool.run(get_pid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import time
+import threading
+import unittest
+from src.services.pipeline import JobPipeline
+from src.inclination_helper.deadline import Deadline
+
+
+class TestJobPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = JobPipeline(io_slots=1, prefetch_jobs=2)
+        self.events = []
+        self.release = threading.Event()
+
+    def _run(self, name, stage, hold=False):
+        def target():
+            with self.pipeline.io(stage, job_id=name):
+                self.events.append(name)
+                if hold:
+                    self.release.wait(timeout=5)
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_concurrency(self):
+        self.assertEqual(self.pipeline.concurrency(3), 5)
+        self.assertEqual(JobPipeline(io_slots=1, prefetch_jobs=0).concurrency(3), 3)
+
+    def test_io_slots_bound_jobs_in_io_stages(self):
+        # Arrange
+        first = self._run('first', 'fetch', hold=True)
+        self._wait_for(lambda: self.events == ['first'])
+
+        # Act
+        second = self._run('second', 'publish')
+        self._wait_for(lambda: self.pipeline.stats()['waiting'] == 1)
+        waiting = list(self.events)
+        self.release.set()
+        first.join(timeout=5)
+        second.join(timeout=5)
+
+        # Assert
+        self.assertEqual(waiting, ['first'])
+        self.assertEqual(self.events, ['first', 'second'])
+        self.assertEqual(self.pipeline.stats(), {'fetch': 0, 'publish': 0, 'waiting': 0})
+
+    def test_wait_does_not_count_against_deadline(self):
+        # Arrange
+        deadline = Deadline(60)
+        expires_at = deadline.expires_at
+        first = self._run('first', 'fetch', hold=True)
+        self._wait_for(lambda: self.events == ['first'])
+        threading.Timer(0.2, self.release.set).start()
+
+        # Act
+        with self.pipeline.io('fetch', job_id='second', deadline=deadline):
+            pass
+        first.join(timeout=5)
+
+        # Assert
+        self.assertGreaterEqual(deadline.expires_at - expires_at, 0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from src.services.result_index import ResultIndex, file_digest
+from tests.inclination_helper.test_tile_cache import run_in_fork
+
+
+class TestResultIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.archive_path = os.path.join(self.temp_dir.name, 'dataset.zip')
+        with open(self.archive_path, 'wb') as f:
+            f.write(b'PK' + b'0' * 1000)
+        self.index = ResultIndex(path=os.path.join(self.temp_dir.name, 'results.sqlite3'), ttl=60)
+
+    def tearDown(self):
+        self.index.close()
+        self.temp_dir.cleanup()
+
+    def test_key_depends_on_content_and_params(self):
+        # Arrange
+        copy_path = os.path.join(self.temp_dir.name, 'copy.zip')
+        with open(self.archive_path, 'rb') as source, open(copy_path, 'wb') as target:
+            target.write(source.read())
+
+        # Act
+        key = ResultIndex.key(self.archive_path, osw_incline='0.1', sampling={'method': 'idw'})
+
+        # Assert
+        self.assertEqual(key, ResultIndex.key(copy_path, sampling={'method': 'idw'}, osw_incline='0.1'))
+        self.assertNotEqual(key, ResultIndex.key(self.archive_path, osw_incline='0.2', sampling={'method': 'idw'}))
+        with open(copy_path, 'ab') as f:
+            f.write(b'1')
+        self.assertNotEqual(key, ResultIndex.key(copy_path, osw_incline='0.1', sampling={'method': 'idw'}))
+
+    def test_put_and_get(self):
+        # Act
+        self.index.put('key', url='https://example.com/jobs/1/out.zip', job_id='1')
+
+        # Assert
+        self.assertEqual(self.index.get('key'), ('https://example.com/jobs/1/out.zip', '1'))
+        self.assertIsNone(self.index.get('other'))
+
+    def test_expired_results(self):
+        # Arrange
+        with patch('src.services.result_index.time.time', return_value=1000):
+            self.index.put('old', url='old_url', job_id='1')
+        self.index.put('new', url='new_url', job_id='2')
+
+        # Act
+        expired = self.index.get('old')
+        removed = self.index.purge()
+
+        # Assert
+        self.assertIsNone(expired)
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.index.get('new'), ('new_url', '2'))
+
+    def test_disabled_without_ttl(self):
+        index = ResultIndex(path=os.path.join(self.temp_dir.name, 'disabled.sqlite3'), ttl=0)
+        self.assertFalse(index.enabled)
+        self.assertTrue(self.index.enabled)
+        index.close()
+
+    def test_file_digest(self):
+        self.assertEqual(len(file_digest(self.archive_path)), 64)
+
+    def test_forked_process_uses_own_connection(self):
+        # Arrange
+        connection = self.index._connection
+
+        def child():
+            self.index.put('key', url='https://example.com/output.zip', job_id='job_1')
+            assert self.index._connection is not connection
+
+        # Act
+        exit_code = run_in_fork(child)
+
+        # Assert
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(self.index.get('key'), ('https://example.com/output.zip', 'job_1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import time
+import threading
+import unittest
+from src.services.admission import JobEstimate
+from src.services.scheduler import JobScheduler
+
+
+def job(edges, tiles=1):
+    return JobEstimate(edges=edges, tiles=[f'n48w{122 + tile}' for tile in range(tiles)], missing_tiles=[],
+                       memory=0, disk=0)
+
+
+class TestJobScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = JobScheduler(slots=1, small_slots=1, small_max_edges=100, small_max_tiles=1)
+        self.events = []
+        self.release = threading.Event()
+
+    def _run(self, name, estimate, hold=False):
+        def target():
+            with self.scheduler.slot(estimate, job_id=name) as in_lane:
+                self.events.append((name, in_lane))
+                if hold:
+                    self.release.wait(timeout=5)
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_is_small(self):
+        self.assertTrue(self.scheduler.is_small(job(edges=50)))
+        self.assertFalse(self.scheduler.is_small(job(edges=500)))
+        self.assertFalse(self.scheduler.is_small(job(edges=50, tiles=2)))
+
+    def test_concurrency(self):
+        self.assertEqual(self.scheduler.concurrency, 2)
+
+    def test_small_job_runs_in_lane_next_to_large_job(self):
+        # Arrange
+        large = self._run('large', job(edges=100000), hold=True)
+        self._wait_for(lambda: self.events)
+
+        # Act
+        small = self._run('small', job(edges=50))
+        small.join(timeout=5)
+
+        # Assert
+        self.assertEqual(self.events, [('large', False), ('small', True)])
+        self.release.set()
+        large.join(timeout=5)
+
+    def test_large_job_waits_for_slot(self):
+        # Arrange
+        first = self._run('first', job(edges=100000), hold=True)
+        self._wait_for(lambda: self.events)
+
+        # Act
+        second = self._run('second', job(edges=200000))
+        time.sleep(0.1)
+        held_back = list(self.events)
+        self.release.set()
+        first.join(timeout=5)
+        second.join(timeout=5)
+
+        # Assert
+        self.assertEqual(held_back, [('first', False)])
+        self.assertEqual(self.events, [('first', False), ('second', False)])
+
+    def test_free_slot_goes_to_smallest_waiting_job(self):
+        # Arrange
+        scheduler = self.scheduler = JobScheduler(slots=1, small_slots=0)
+        first = self._run('first', job(edges=100000), hold=True)
+        self._wait_for(lambda: self.events)
+        larger = self._run('larger', job(edges=300000))
+        self._wait_for(lambda: scheduler.stats()['waiting'] == 1)
+        smaller = self._run('smaller', job(edges=200000))
+        self._wait_for(lambda: scheduler.stats()['waiting'] == 2)
+
+        # Act
+        self.release.set()
+        for thread in (first, larger, smaller):
+            thread.join(timeout=5)
+
+        # Assert
+        self.assertEqual([name for name, _ in self.events], ['first', 'smaller', 'larger'])
+        self.assertEqual(scheduler.stats(), {'running': 0, 'running_small': 0, 'waiting': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
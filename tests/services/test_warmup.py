@@ -0,0 +1,68 @@
+import sqlite3
+import unittest
+from unittest.mock import MagicMock
+from src.services.warmup import TileWarmup
+
+
+class TestTileWarmup(unittest.TestCase):
+
+    def setUp(self):
+        self.dem_downloader = MagicMock()
+        self.dem_downloader.usage.top.return_value = ['n48w123', 'n36w119', 'n47w122']
+        self.dem_downloader.warm.return_value = []
+
+    def test_tiles(self):
+        # Arrange
+        warmup = TileWarmup(dem_downloader=self.dem_downloader, tiles=['n36w119', 'n40w100', 'n36w119'],
+                            top_tiles=3, max_tiles=4)
+
+        # Act
+        tiles = warmup.tiles()
+
+        # Assert
+        self.assertEqual(tiles, ['n36w119', 'n40w100', 'n48w123', 'n47w122'])
+        self.dem_downloader.usage.top.assert_called_once_with(3)
+
+    def test_start_fetches_tiles_then_is_ready(self):
+        # Arrange
+        warmup = TileWarmup(dem_downloader=self.dem_downloader, top_tiles=2)
+        self.dem_downloader.usage.top.return_value = ['n48w123', 'n36w119']
+        self.dem_downloader.warm.return_value = ['n36w119']
+
+        # Act
+        warmup.start()
+        warmup.wait(timeout=5)
+
+        # Assert
+        self.assertTrue(warmup.ready)
+        self.dem_downloader.warm.assert_called_once_with(['n48w123', 'n36w119'])
+        self.assertEqual(warmup.stats(), {'ready': True, 'tiles': ['n48w123', 'n36w119'], 'failed': ['n36w119']})
+
+    def test_ready_without_tiles(self):
+        # Arrange
+        warmup = TileWarmup(dem_downloader=self.dem_downloader)
+
+        # Act
+        warmup.start()
+
+        # Assert
+        self.assertTrue(warmup.ready)
+        self.dem_downloader.warm.assert_not_called()
+
+    def test_ready_when_warm_up_fails(self):
+        # Arrange
+        self.dem_downloader.usage.top.side_effect = sqlite3.OperationalError('disk I/O error')
+        self.dem_downloader.warm.side_effect = Exception('Network down')
+        warmup = TileWarmup(dem_downloader=self.dem_downloader, tiles=['n48w123'], top_tiles=2)
+
+        # Act
+        warmup.start()
+        warmup.wait(timeout=5)
+
+        # Assert
+        self.assertTrue(warmup.ready)
+        self.dem_downloader.warm.assert_called_once_with(['n48w123'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 from fastapi import status
+from unittest.mock import MagicMock
 from src.main import app, get_settings
 from fastapi.testclient import TestClient
 
@@ -18,6 +19,25 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.text.strip('\"'), "I'm healthy !!")
 
+    def test_ready(self):
+        # Arrange
+        service = MagicMock()
+        service.ready = False
+        app.incline_service = service
+
+        try:
+            # Act
+            warming_up = self.client.get('/health/ready')
+            service.ready = True
+            ready = self.client.get('/ready')
+        finally:
+            app.incline_service = None
+
+        # Assert
+        self.assertEqual(warming_up.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(ready.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/ready').status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
     def test_get_settings(self):
         settings = get_settings()
         self.assertIsNotNone(settings)